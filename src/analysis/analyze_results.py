@@ -38,6 +38,7 @@ import json
 import logging
 import os
 import re
+import sys
 import warnings
 from pathlib import Path
 
@@ -57,17 +58,9 @@ PREDICTIONS_FILE = PROJECT_ROOT / "results" / "predictions" / "all_predictions.j
 RESULTS_DIR      = PROJECT_ROOT / "results"
 ANALYSIS_DIR     = RESULTS_DIR / "analysis"
 
-# ── GQA 5×5 matrix definition ──────────────────────────────────────────────────
-STRUCTURAL_TYPES = ["query", "verify", "logical", "choose", "compare"]
-SEMANTIC_TYPES   = ["rel", "attr", "obj", "cat", "global"]
-
-VALID_CELLS = {
-    ("query",   "rel"),  ("query",   "attr"), ("query",   "cat"), ("query",   "global"),
-    ("verify",  "rel"),  ("verify",  "attr"), ("verify",  "obj"), ("verify",  "global"),
-    ("logical", "attr"), ("logical", "obj"),
-    ("choose",  "rel"),  ("choose",  "attr"), ("choose",  "cat"), ("choose",  "global"),
-    ("compare", "attr"),
-}
+# ── GQA 5×5 matrix definition (src/common/gqa_types.py) ───────────────────────
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "common"))
+from gqa_types import SEMANTIC_TYPES, STRUCTURAL_TYPES, VALID_CELLS
 
 # ── Capability group definitions ────────────────────────────────────────────────
 STRUCTURAL_GROUPS = {
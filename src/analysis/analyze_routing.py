@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+src/analysis/analyze_routing.py
+
+Compares a question-type routing policy (run_inference.py --route, see
+src/inference/routing.py) against running both models, per cell of the
+5×5 structural × semantic grid:
+
+  accuracy — the routed system answers each question with its routed model;
+             simulated from a both-models predictions file, and measured from
+             a routed run's own rows when one exists
+  compute  — model seconds spent: blip_time + vilt_time per question for both
+             models, the routed model's time for the routed system (rows that
+             are dedup fan-out copies cost nothing and are left out)
+
+Rows answered from the answer cache (run_inference.py lists the models in
+"cached") carry the time recorded when the answer was first computed. The
+simulation uses those times as the cost of answering and reports how many
+rows have them. The measured run's compute leaves out every question that
+either run answered from the cache, since that time was not spent there.
+
+Accuracy uses the normalized (rules 1-6) matching from analyze_results.py.
+Compute comes from the per-question times in the rows, so it is only
+comparable between runs on the same host with the same batch settings.
+
+With --suggest T, also writes a per-cell policy that routes a cell to ViLT
+whenever its ViLT accuracy is within T of BLIP's (usable with --route).
+
+Outputs (all in results/analysis/routing/):
+  accuracy_5x5_routed.csv       — simulated routed accuracy per cell
+  accuracy_delta_5x5_routed.csv — routed − BLIP per cell
+  routing_by_cell.csv           — n, ViLT share, BLIP / ViLT / routed accuracy, compute
+  routing_summary.txt           — overall accuracy and compute, measured run if any
+  suggested_policy.json         — --suggest only
+
+Usage:
+  python src/analysis/analyze_routing.py
+  python src/analysis/analyze_routing.py --policy my_policy.json
+  python src/analysis/analyze_routing.py --routed results/predictions/all_predictions.routed.jsonl
+  python src/analysis/analyze_routing.py --suggest 0.02
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# ── Paths ───────────────────────────────────────────────────────────────────────
+PROJECT_ROOT     = Path(__file__).resolve().parent.parent.parent
+PRED_DIR         = PROJECT_ROOT / "results" / "predictions"
+PREDICTIONS_FILE = PRED_DIR / "all_predictions.jsonl"
+ROUTED_FILE      = PRED_DIR / "all_predictions.routed.jsonl"
+OUT_DIR          = PROJECT_ROOT / "results" / "analysis" / "routing"
+
+# ── Shared definitions ─────────────────────────────────────────────────────────
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "analysis"))
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "inference"))
+from analyze_results import (
+    SEMANTIC_TYPES,
+    STRUCTURAL_TYPES,
+    VALID_CELLS,
+    add_correctness_columns,
+    build_matrix,
+    load_predictions,
+    normalize_normalized,
+    print_matrix,
+)
+from routing import describe, load_policy, route
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# ROUTING
+# ══════════════════════════════════════════════════════════════════════════════
+
+def apply_policy(df: pd.DataFrame, policy: dict) -> pd.DataFrame:
+    """Add route, routed_correct_norm, both_time and routed_time columns."""
+    df = df.copy()
+    df["route"] = [route(policy, s, m, d) for s, m, d in
+                   zip(df["structural"], df["semantic"], df["program_depth"])]
+    to_blip = df["route"] == "blip"
+    df["routed_correct_norm"] = df["blip_correct_norm"].where(to_blip, df["vilt_correct_norm"])
+    df["both_time"]   = df["blip_time"].fillna(0) + df["vilt_time"].fillna(0)
+    df["routed_time"] = df["blip_time"].where(to_blip, df["vilt_time"]).fillna(0)
+    return df
+
+
+def spent(df: pd.DataFrame) -> pd.Series:
+    """Rows whose model time was actually spent (not dedup fan-out copies)."""
+    if "dedup_of" not in df:
+        return pd.Series(True, index=df.index)
+    return df["dedup_of"].isna()
+
+
+def from_cache(df: pd.DataFrame) -> pd.Series:
+    """Rows with at least one answer served from the answer cache."""
+    if "cached" not in df:
+        return pd.Series(False, index=df.index)
+    return df["cached"].map(lambda c: isinstance(c, list) and len(c) > 0)
+
+
+def accuracy(col: pd.Series) -> float | None:
+    valid = col.dropna()
+    return round(valid.astype(float).mean(), 4) if len(valid) else None
+
+
+def cell_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Per cell: n, share routed to ViLT, BLIP / ViLT / routed accuracy, compute."""
+    rows = []
+    cells = sorted(VALID_CELLS, key=lambda x: (STRUCTURAL_TYPES.index(x[0]),
+                                               SEMANTIC_TYPES.index(x[1])))
+    for struct, sem in cells:
+        sub = df[(df["structural"] == struct) & (df["semantic"] == sem)]
+        if sub.empty:
+            continue
+        paid = sub[spent(sub)]
+        both_s, routed_s = paid["both_time"].sum(), paid["routed_time"].sum()
+        blip, routed = accuracy(sub["blip_correct_norm"]), accuracy(sub["routed_correct_norm"])
+        rows.append({
+            "structural": struct, "semantic": sem, "n": len(sub),
+            "vilt_share": round((sub["route"] == "vilt").mean(), 4),
+            "blip": blip, "vilt": accuracy(sub["vilt_correct_norm"]), "routed": routed,
+            "routed_minus_blip": round(routed - blip, 4) if None not in (routed, blip) else None,
+            "compute_both_s": round(both_s, 2), "compute_routed_s": round(routed_s, 2),
+            "compute_saved": round(1 - routed_s / both_s, 4) if both_s else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def suggest_policy(table: pd.DataFrame, tolerance: float) -> dict:
+    """Per-cell policy: ViLT wherever it is within tolerance of BLIP, else BLIP."""
+    rules = []
+    for _, r in table.iterrows():
+        if r["blip"] is None or r["vilt"] is None or pd.isna(r["blip"]) or pd.isna(r["vilt"]):
+            continue
+        if r["vilt"] >= r["blip"] - tolerance:
+            rules.append({"structural": r["structural"], "semantic": r["semantic"],
+                          "model": "vilt"})
+    return {"default": "blip", "rules": rules}
+
+
+def measured_run(path: Path, both: pd.DataFrame) -> dict | None:
+    """Accuracy and compute of an actual --route run on the questions it shares
+    with the both-models run; None if it has no routed rows."""
+    df = load_predictions(path)
+    if df.empty or "route" not in df:
+        return None
+    df = add_correctness_columns(df, normalize_normalized, "norm")
+    to_blip = df["route"] == "blip"
+    df["routed_correct_norm"] = df["blip_correct_norm"].where(to_blip, df["vilt_correct_norm"])
+    df["routed_time"] = df["blip_time"].fillna(0) + df["vilt_time"].fillna(0)
+    shared = df[df["qid"].isin(both["qid"])]
+    base = both[both["qid"].isin(shared["qid"])]
+    # compute only over questions both runs actually answered
+    cached = set(shared.loc[from_cache(shared), "qid"]) | set(base.loc[from_cache(base), "qid"])
+    paid_routed = shared[spent(shared) & ~shared["qid"].isin(cached)]
+    paid_both = base[spent(base) & ~base["qid"].isin(cached)]
+    return {
+        "df": df,
+        "n": len(shared),
+        "n_cached": len(cached),
+        "accuracy": accuracy(shared["routed_correct_norm"]),
+        "both_accuracy_blip": accuracy(base["blip_correct_norm"]),
+        "compute_routed_s": paid_routed["routed_time"].sum(),
+        "compute_both_s": paid_both["both_time"].sum(),
+    }
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# MAIN
+# ══════════════════════════════════════════════════════════════════════════════
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a routing policy against both models")
+    parser.add_argument("--predictions", type=Path, default=PREDICTIONS_FILE,
+                        help="Predictions JSONL with both models' answers")
+    parser.add_argument("--routed", type=Path, default=ROUTED_FILE,
+                        help="Predictions JSONL of a --route run (optional; used if it exists)")
+    parser.add_argument("--policy", default="default",
+                        help="Routing policy JSON (default: routing.py's DEFAULT_POLICY)")
+    parser.add_argument("--suggest", type=float, default=None, metavar="T",
+                        help="Also write a per-cell policy routing to ViLT where it is within "
+                             "T of BLIP's accuracy")
+    args = parser.parse_args()
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    policy = load_policy(args.policy)
+    print(f"Routing policy {args.policy}:\n{describe(policy)}")
+
+    df = load_predictions(args.predictions)
+    df = add_correctness_columns(df, normalize_normalized, "norm")
+    df = df[df["blip_answer"].notna() & df["vilt_answer"].notna()]
+    if df.empty:
+        print("No rows with both models' answers — run (or --backfill) both models first.")
+        return
+    df = apply_policy(df, policy)
+
+    # ── Matrices ──────────────────────────────────────────────────────────────
+    routed_m = build_matrix(df, "routed_correct_norm")
+    print_matrix(build_matrix(df, "blip_correct_norm"), "BLIP accuracy (normalized)")
+    print_matrix(build_matrix(df, "vilt_correct_norm"), "ViLT accuracy (normalized)")
+    print_matrix(routed_m, "Routed accuracy (normalized, simulated)")
+    routed_m.to_csv(OUT_DIR / "accuracy_5x5_routed.csv")
+    (routed_m - build_matrix(df, "blip_correct_norm")).to_csv(
+        OUT_DIR / "accuracy_delta_5x5_routed.csv")
+
+    table = cell_table(df)
+    table.to_csv(OUT_DIR / "routing_by_cell.csv", index=False)
+
+    # ── Summary ───────────────────────────────────────────────────────────────
+    paid = df[spent(df)]
+    both_s, routed_s = paid["both_time"].sum(), paid["routed_time"].sum()
+    blip_s, vilt_s = paid["blip_time"].sum(), paid["vilt_time"].sum()
+    lines = [
+        "Question-type routing vs both models",
+        "=" * 60,
+        f"Predictions : {args.predictions}",
+        f"Policy      : {args.policy}",
+        describe(policy),
+        f"Questions   : {len(df):,} ({(df['route'] == 'vilt').mean():.1%} routed to ViLT)",
+        f"Cached      : {from_cache(df).sum():,} rows with answer-cache times "
+        f"(recorded when first computed)",
+        "",
+        "Accuracy (normalized)",
+        f"  BLIP only      {accuracy(df['blip_correct_norm']):.4f}",
+        f"  ViLT only      {accuracy(df['vilt_correct_norm']):.4f}",
+        f"  routed         {accuracy(df['routed_correct_norm']):.4f}",
+        "",
+        "Model compute (s)",
+        f"  both models    {both_s:,.1f}  (BLIP {blip_s:,.1f} + ViLT {vilt_s:,.1f})",
+        f"  routed         {routed_s:,.1f}  "
+        f"({1 - routed_s / both_s:.1%} less than both, "
+        f"{1 - routed_s / blip_s:.1%} less than BLIP only)" if both_s and blip_s else
+        f"  routed         {routed_s:,.1f}",
+        "",
+        "Cells where routing loses > 1pp against BLIP:",
+    ]
+    worse = table[table["routed_minus_blip"].notna() & (table["routed_minus_blip"] < -0.01)]
+    for _, r in worse.iterrows():
+        lines.append(f"  {r['structural']:>8s} × {r['semantic']:<7s} {r['blip']:.3f} → "
+                     f"{r['routed']:.3f} ({r['routed_minus_blip']:+.3f}, n={r['n']}, "
+                     f"{r['compute_saved']:.0%} compute saved)")
+    if worse.empty:
+        lines.append("  none")
+
+    if args.routed.exists():
+        run = measured_run(args.routed, df)
+        if run is not None and run["n"]:
+            print_matrix(build_matrix(run["df"], "routed_correct_norm"),
+                         "Routed accuracy (normalized, measured)")
+            lines += [
+                "",
+                f"Measured routed run : {args.routed} ({run['n']:,} shared questions)",
+                f"  accuracy       routed {run['accuracy']:.4f}  "
+                f"BLIP only {run['both_accuracy_blip']:.4f}",
+                f"  compute (s)    routed {run['compute_routed_s']:,.1f}  "
+                f"both {run['compute_both_s']:,.1f}"
+                f"  ({run['n_cached']:,} questions answered from the cache left out)",
+            ]
+
+    if args.suggest is not None:
+        suggested = suggest_policy(table, args.suggest)
+        (OUT_DIR / "suggested_policy.json").write_text(json.dumps(suggested, indent=2))
+        sim = apply_policy(df, suggested)
+        sim_paid = sim[spent(sim)]
+        lines += [
+            "",
+            f"Suggested policy (ViLT within {args.suggest:.3f} of BLIP): "
+            f"{len(suggested['rules'])} cells to ViLT",
+            f"  accuracy       {accuracy(sim['routed_correct_norm']):.4f}",
+            f"  compute (s)    {sim_paid['routed_time'].sum():,.1f}",
+        ]
+
+    summary = "\n".join(lines)
+    print("\n" + summary)
+    (OUT_DIR / "routing_summary.txt").write_text(summary)
+    print(f"Saved to: {OUT_DIR.relative_to(PROJECT_ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+src/analysis/compare_quantization.py
+
+Compares an int8 (--quantize int8) inference run against fp32 on the same
+questions: per-cell accuracy deltas over the 5×5 structural × semantic grid,
+answer agreement, and per-model speedup.
+
+Questions are joined on qid, so the fp32 side can be the full predictions
+file or a --stratified-sample run of the same N. Accuracy uses the
+normalized (rules 1-6) matching from analyze_results.py. Speedup is the
+ratio of mean per-question model time (blip_time / vilt_time); it is only
+meaningful when both runs used the same host, batch settings and threads.
+
+Outputs (all in results/analysis/quantization/):
+  accuracy_delta_5x5_blip.csv / accuracy_delta_5x5_vilt.csv — int8 − fp32 per cell
+  quantization_by_cell.csv  — n / fp32 / int8 / delta / agreement per cell and model
+  quantization_summary.txt  — overall deltas, speedups, cells over tolerance
+
+Usage:
+  python src/analysis/compare_quantization.py
+  python src/analysis/compare_quantization.py --fp32 results/predictions/sample_fp32.jsonl
+  python src/analysis/compare_quantization.py --tolerance 0.02
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ── Paths ───────────────────────────────────────────────────────────────────────
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+PRED_DIR     = PROJECT_ROOT / "results" / "predictions"
+FP32_FILE    = PRED_DIR / "all_predictions.jsonl"
+INT8_FILE    = PRED_DIR / "all_predictions.int8.jsonl"
+OUT_DIR      = PROJECT_ROOT / "results" / "analysis" / "quantization"
+
+# ── Import shared definitions from analyze_results ─────────────────────────────
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "analysis"))
+from analyze_results import (
+    SEMANTIC_TYPES,
+    STRUCTURAL_TYPES,
+    VALID_CELLS,
+    add_correctness_columns,
+    build_matrix,
+    load_predictions,
+    normalize_normalized,
+    print_matrix,
+)
+
+MODELS = ("blip", "vilt")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# COMPARISON
+# ══════════════════════════════════════════════════════════════════════════════
+
+def join_runs(fp32: pd.DataFrame, int8: pd.DataFrame) -> pd.DataFrame:
+    """One row per question present in both runs, columns suffixed _fp32 / _int8."""
+    cols = ["qid", "blip_answer", "vilt_answer", "blip_time", "vilt_time",
+            "blip_correct_norm", "vilt_correct_norm"]
+    meta = int8[["qid", "structural", "semantic", "gt_answer"]]
+    df = meta.merge(fp32[cols], on="qid").merge(int8[cols], on="qid", suffixes=("_fp32", "_int8"))
+    return df
+
+
+def cell_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Per (cell, model): n, fp32 / int8 accuracy, delta and answer agreement."""
+    rows = []
+    cells = sorted(VALID_CELLS, key=lambda x: (STRUCTURAL_TYPES.index(x[0]),
+                                               SEMANTIC_TYPES.index(x[1])))
+    for struct, sem in cells:
+        sub = df[(df["structural"] == struct) & (df["semantic"] == sem)]
+        for model in MODELS:
+            a, b = sub[f"{model}_correct_norm_fp32"], sub[f"{model}_correct_norm_int8"]
+            valid = a.notna() & b.notna()
+            if not valid.any():
+                continue
+            acc_fp32 = a[valid].astype(float).mean()
+            acc_int8 = b[valid].astype(float).mean()
+            agree = (sub.loc[valid, f"{model}_answer_fp32"].map(normalize_normalized)
+                     == sub.loc[valid, f"{model}_answer_int8"].map(normalize_normalized)).mean()
+            rows.append({
+                "structural": struct, "semantic": sem, "model": model,
+                "n": int(valid.sum()),
+                "acc_fp32": round(acc_fp32, 4), "acc_int8": round(acc_int8, 4),
+                "delta": round(acc_int8 - acc_fp32, 4),
+                "agreement": round(agree, 4),
+            })
+    return pd.DataFrame(rows)
+
+
+def speedup(df: pd.DataFrame, model: str):
+    """(mean fp32 s/q, mean int8 s/q, fp32 / int8) or None if a run skipped the model."""
+    t32 = df[f"{model}_time_fp32"].dropna()
+    t8  = df[f"{model}_time_int8"].dropna()
+    if t32.empty or t8.empty or t8.mean() == 0:
+        return None
+    return t32.mean(), t8.mean(), t32.mean() / t8.mean()
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# MAIN
+# ══════════════════════════════════════════════════════════════════════════════
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare int8 and fp32 inference runs")
+    parser.add_argument("--fp32", type=Path, default=FP32_FILE, help="fp32 predictions JSONL")
+    parser.add_argument("--int8", type=Path, default=INT8_FILE, help="int8 predictions JSONL")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="Flag cells whose |accuracy delta| exceeds this (default 0.01)")
+    args = parser.parse_args()
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    print("Loading predictions...")
+    runs = {}
+    for name, path in (("fp32", args.fp32), ("int8", args.int8)):
+        df = load_predictions(path)
+        runs[name] = add_correctness_columns(df, normalize_normalized, "norm")
+    df = join_runs(runs["fp32"], runs["int8"])
+    print(f"  {len(df):,} questions in both runs")
+    if df.empty:
+        print("No overlapping questions — run both modes with the same --stratified-sample.")
+        return
+
+    # ── Per-cell deltas ───────────────────────────────────────────────────────
+    for model in MODELS:
+        delta = (build_matrix(df, f"{model}_correct_norm_int8")
+                 - build_matrix(df, f"{model}_correct_norm_fp32"))
+        if delta.isna().all().all():
+            continue
+        print_matrix(delta, f"{model.upper()} accuracy delta (int8 − fp32, normalized)")
+        delta.to_csv(OUT_DIR / f"accuracy_delta_5x5_{model}.csv")
+
+    table = cell_table(df)
+    table.to_csv(OUT_DIR / "quantization_by_cell.csv", index=False)
+
+    # ── Summary ───────────────────────────────────────────────────────────────
+    lines = [
+        "Int8 dynamic quantization vs fp32",
+        "=" * 60,
+        f"fp32 run : {args.fp32}",
+        f"int8 run : {args.int8}",
+        f"Questions compared : {len(df):,}",
+        "",
+    ]
+    for model in MODELS:
+        a = df[f"{model}_correct_norm_fp32"]
+        b = df[f"{model}_correct_norm_int8"]
+        valid = a.notna() & b.notna()
+        if not valid.any():
+            continue
+        acc32 = a[valid].astype(float).mean()
+        acc8  = b[valid].astype(float).mean()
+        lines.append(f"{model.upper()}")
+        lines.append(f"  accuracy   fp32 {acc32:.4f}  int8 {acc8:.4f}  delta {acc8 - acc32:+.4f}")
+        sub = table[table["model"] == model]
+        lines.append(f"  agreement  {np.average(sub['agreement'], weights=sub['n']):.4f} "
+                     f"(answers identical after normalization)")
+        sp = speedup(df, model)
+        if sp:
+            lines.append(f"  time/q     fp32 {sp[0]*1000:.1f} ms  int8 {sp[1]*1000:.1f} ms  "
+                         f"speedup ×{sp[2]:.2f}")
+        over = sub[sub["delta"].abs() > args.tolerance]
+        lines.append(f"  cells with |delta| > {args.tolerance:.3f}: {len(over)} / {len(sub)}")
+        for _, r in over.iterrows():
+            lines.append(f"    {r['structural']:>8s} × {r['semantic']:<7s} "
+                         f"{r['acc_fp32']:.3f} → {r['acc_int8']:.3f} ({r['delta']:+.3f}, n={r['n']})")
+        lines.append("")
+
+    summary = "\n".join(lines)
+    print("\n" + summary)
+    (OUT_DIR / "quantization_summary.txt").write_text(summary)
+    print(f"Saved to: {OUT_DIR.relative_to(PROJECT_ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
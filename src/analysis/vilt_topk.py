@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+src/analysis/vilt_topk.py
+
+Re-derives ViLT answers from the top-k store written by
+run_inference.py --vilt-topk K (src/inference/topk_store.py), without
+re-running the model:
+
+  top-k hit       — is the ground truth among ViLT's k highest-scoring labels?
+  restricted      — ViLT's answer when it may only pick one of a question's
+                    candidate answers (yes/no for verify / logical, the two
+                    options for choose; same extraction as --blip-scoring,
+                    from the question's program in the questions file)
+  thresholded     — ViLT's answer only when its confidence, sigmoid(top-1
+                    logit), reaches a threshold; abstains otherwise
+
+A restricted answer is exact whenever at least one candidate is in the
+stored top-k: that candidate outscores every label outside it. When none is,
+the answer is unknown (None) and counted as uncovered — re-run with a larger
+K to cover more. Without the questions file, choose options come from the
+"X or Y?" ending of the question text only, which misses relation choose
+questions ("to the left or to the right of ...?"); their count is reported.
+
+Library use:
+  store = load_store()                       # or load_store(path_to_predictions)
+  restricted_answer(store, qid, ["yes", "no"])
+  threshold_answer(store, qid, 0.5)
+  df = add_topk_columns(load_predictions(path), store, load_programs())
+
+Outputs (all in results/analysis/vilt_topk/):
+  topk_by_cell.csv       — per cell: n, top-1 / top-k accuracy, restricted
+                           accuracy and coverage (closed questions)
+  threshold_curve.csv    — per threshold: coverage and accuracy on answered
+  vilt_topk_summary.txt  — overall figures
+
+Usage:
+  python src/analysis/vilt_topk.py
+  python src/analysis/vilt_topk.py --predictions results/predictions/all_predictions.shard-0.jsonl
+  python src/analysis/vilt_topk.py --thresholds 0.1 0.3 0.5 0.7 0.9
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ── Paths ───────────────────────────────────────────────────────────────────────
+PROJECT_ROOT     = Path(__file__).resolve().parent.parent.parent
+PREDICTIONS_FILE = PROJECT_ROOT / "results" / "predictions" / "all_predictions.jsonl"
+QUESTIONS_PATH   = PROJECT_ROOT / "data" / "questions1.2" / "val_balanced_questions.json"
+OUT_DIR          = PROJECT_ROOT / "results" / "analysis" / "vilt_topk"
+
+# ── Shared definitions ─────────────────────────────────────────────────────────
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "analysis"))
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "common"))
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "inference"))
+from analyze_results import (
+    SEMANTIC_TYPES,
+    STRUCTURAL_TYPES,
+    VALID_CELLS,
+    build_matrix,
+    load_predictions,
+    normalize_normalized,
+    print_matrix,
+)
+from closed_answers import closed_candidates
+from gqa_questions import load_questions
+from topk_store import TopkStore, topk_base
+
+DEFAULT_THRESHOLDS = [0.0, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# API
+# ══════════════════════════════════════════════════════════════════════════════
+
+def load_store(predictions: Path = PREDICTIONS_FILE) -> TopkStore:
+    """The top-k store written alongside a predictions file."""
+    return TopkStore(topk_base(predictions))
+
+
+def sigmoid(logits: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+def confidence(store: TopkStore, qid: str) -> float | None:
+    """ViLT's confidence in its own top-1 answer, or None without a record."""
+    rec = store.get(qid)
+    return None if rec is None else float(sigmoid(rec[1][0]))
+
+
+def topk_hit(store: TopkStore, qid: str, answer: str, k: int | None = None,
+             norm_fn=normalize_normalized) -> bool | None:
+    """True if answer is among the first k (default all stored) labels."""
+    rec = store.get(qid)
+    if rec is None:
+        return None
+    target = norm_fn(str(answer))
+    return any(norm_fn(label) == target for label in rec[0][:k])
+
+
+def restricted_answer(store: TopkStore, qid: str, candidates: list[str],
+                      norm_fn=normalize_normalized) -> str | None:
+    """
+    ViLT's highest-scoring label among candidates (returned as the candidate
+    string), or None if no candidate is in the stored top-k.
+    """
+    rec = store.get(qid)
+    if rec is None or not candidates:
+        return None
+    by_norm = {norm_fn(c): c for c in candidates}
+    for label in rec[0]:
+        hit = by_norm.get(norm_fn(label))
+        if hit is not None:
+            return hit
+    return None
+
+
+def threshold_answer(store: TopkStore, qid: str, threshold: float) -> str | None:
+    """ViLT's top-1 answer if its confidence is ≥ threshold, else None (abstain)."""
+    rec = store.get(qid)
+    if rec is None or sigmoid(rec[1][0]) < threshold:
+        return None
+    return rec[0][0]
+
+
+def load_programs(path: Path = QUESTIONS_PATH) -> dict[str, list]:
+    """qid → semantic program of every question in the questions file ({} if
+    it is missing); choose questions take their options from it."""
+    if not path.exists():
+        print(f"Questions file {path} not found: choose options from question text only")
+        return {}
+    return {qid: q["semantic"] for qid, q in load_questions(path, ("semantic",)).items()}
+
+
+def row_candidates(row, programs: dict | None = None) -> list[str] | None:
+    """Candidate answers of a predictions row, as --blip-scoring extracts them:
+    from the question's program when programs has it, else from the text."""
+    return closed_candidates({"types": {"structural": row["structural"]},
+                              "question": row["question"],
+                              "semantic": (programs or {}).get(row["qid"])})
+
+
+def add_topk_columns(df: pd.DataFrame, store: TopkStore, programs: dict | None = None,
+                     norm_fn=normalize_normalized) -> pd.DataFrame:
+    """
+    Add, for rows with a top-k record: vilt_conf, vilt_topk_hit,
+    vilt_candidates (see row_candidates; programs from load_programs),
+    vilt_restricted (None for open questions or no candidate in top-k) and
+    vilt_restricted_correct. Rows without a record are dropped.
+    """
+    df = df[df["qid"].isin(store.index.keys())].copy()
+    df["vilt_conf"] = [confidence(store, qid) for qid in df["qid"]]
+    df["vilt_topk_hit"] = [topk_hit(store, qid, gt, norm_fn=norm_fn)
+                           for qid, gt in zip(df["qid"], df["gt_answer"])]
+    df["vilt_top1_correct"] = [topk_hit(store, qid, gt, k=1, norm_fn=norm_fn)
+                               for qid, gt in zip(df["qid"], df["gt_answer"])]
+    df["vilt_candidates"] = [row_candidates(r, programs) for _, r in df.iterrows()]
+    df["vilt_restricted"] = [
+        restricted_answer(store, qid, cands, norm_fn) if isinstance(cands, list) else None
+        for qid, cands in zip(df["qid"], df["vilt_candidates"])
+    ]
+    df["vilt_restricted_correct"] = [
+        None if pd.isna(ans) else norm_fn(ans) == norm_fn(str(gt))
+        for ans, gt in zip(df["vilt_restricted"], df["gt_answer"])
+    ]
+    return df
+
+
+def threshold_curve(df: pd.DataFrame, thresholds: list[float]) -> pd.DataFrame:
+    """Coverage (share answered) and accuracy on answered questions per threshold."""
+    rows = []
+    for t in thresholds:
+        answered = df["vilt_conf"] >= t
+        n = int(answered.sum())
+        rows.append({
+            "threshold": t,
+            "answered":  n,
+            "coverage":  round(n / len(df), 4) if len(df) else None,
+            "accuracy":  round(df.loc[answered, "vilt_top1_correct"].astype(float).mean(), 4)
+                         if n else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def cell_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Per cell: n, top-1 / top-k accuracy, and restricted accuracy + coverage."""
+    rows = []
+    cells = sorted(VALID_CELLS, key=lambda x: (STRUCTURAL_TYPES.index(x[0]),
+                                               SEMANTIC_TYPES.index(x[1])))
+    for struct, sem in cells:
+        sub = df[(df["structural"] == struct) & (df["semantic"] == sem)]
+        if sub.empty:
+            continue
+        closed = sub[sub["vilt_candidates"].notna()]
+        covered = closed["vilt_restricted_correct"].notna()
+        rows.append({
+            "structural": struct, "semantic": sem, "n": len(sub),
+            "top1":  round(sub["vilt_top1_correct"].astype(float).mean(), 4),
+            "topk":  round(sub["vilt_topk_hit"].astype(float).mean(), 4),
+            "n_closed": len(closed),
+            "restricted": round(closed.loc[covered, "vilt_restricted_correct"].astype(float).mean(), 4)
+                          if covered.any() else None,
+            "restricted_coverage": round(covered.mean(), 4) if len(closed) else None,
+        })
+    return pd.DataFrame(rows)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# MAIN
+# ══════════════════════════════════════════════════════════════════════════════
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-derive ViLT answers from its top-k store")
+    parser.add_argument("--predictions", type=Path, default=PREDICTIONS_FILE,
+                        help="Predictions JSONL whose .vilt_topk store to read")
+    parser.add_argument("--questions", type=Path, default=QUESTIONS_PATH,
+                        help="Questions file supplying choose questions' programs")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=DEFAULT_THRESHOLDS,
+                        help="Confidence thresholds for the abstention curve")
+    args = parser.parse_args()
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    store = load_store(args.predictions)
+    print(f"Top-{store.k} store: {len(store):,} questions ({store.model_id})")
+    df = add_topk_columns(load_predictions(args.predictions), store,
+                          load_programs(args.questions))
+    if df.empty:
+        print("No predictions rows have a top-k record.")
+        return
+    no_options = (df["structural"] == "choose") & df["vilt_candidates"].isna()
+    if no_options.any():
+        print(f"{no_options.sum():,} choose questions have no candidates and are left out "
+              f"of the restricted figures")
+
+    print_matrix(build_matrix(df, "vilt_topk_hit"), f"ViLT top-{store.k} accuracy (normalized)")
+    table = cell_table(df)
+    table.to_csv(OUT_DIR / "topk_by_cell.csv", index=False)
+    curve = threshold_curve(df, args.thresholds)
+    curve.to_csv(OUT_DIR / "threshold_curve.csv", index=False)
+
+    # ── Summary ───────────────────────────────────────────────────────────────
+    closed = df[df["vilt_candidates"].notna()]
+    covered = closed["vilt_restricted_correct"].notna()
+    lines = [
+        f"ViLT top-{store.k} re-derivation",
+        "=" * 60,
+        f"Predictions : {args.predictions}",
+        f"Questions   : {len(df):,}",
+        "",
+        f"top-1 accuracy        {df['vilt_top1_correct'].astype(float).mean():.4f}",
+        f"top-{store.k} accuracy        {df['vilt_topk_hit'].astype(float).mean():.4f}",
+        f"mean confidence       {df['vilt_conf'].mean():.4f}",
+        "",
+        f"Closed questions      {len(closed):,}",
+    ]
+    if len(closed):
+        unrestricted = closed["vilt_top1_correct"].astype(float).mean()
+        lines.append(f"  unrestricted acc    {unrestricted:.4f}")
+        if covered.any():
+            lines.append(f"  restricted acc      "
+                         f"{closed.loc[covered, 'vilt_restricted_correct'].astype(float).mean():.4f}"
+                         f" (on {covered.sum():,} with a candidate in top-{store.k})")
+        lines.append(f"  coverage            {covered.mean():.4f}")
+    lines += ["", "Confidence threshold → coverage / accuracy on answered"]
+    for _, r in curve.iterrows():
+        acc = "—" if pd.isna(r["accuracy"]) else f"{r['accuracy']:.4f}"
+        lines.append(f"  ≥ {r['threshold']:.2f}   {r['coverage']:.4f}   {acc}")
+
+    summary = "\n".join(lines)
+    print("\n" + summary)
+    (OUT_DIR / "vilt_topk_summary.txt").write_text(summary)
+    print(f"Saved to: {OUT_DIR.relative_to(PROJECT_ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+src/common/closed_answers.py
+
+Candidate answers for GQA's closed-answer questions: run_inference.py
+--blip-scoring scores BLIP on them, and vilt_topk.py restricts ViLT's top-k
+to them. Only the standard library, so an offline analysis can use it
+without the inference stack.
+"""
+
+import re
+
+_YES_NO = ["yes", "no"]
+_CHOOSE_TEXT = re.compile(r"(\w+) or (?:the |a |an )?(\w+)\s*\?$")
+
+
+def _relation_answer(option: str) -> str:
+    """GQA answers spatial choose questions with the bare direction:
+    'to the left of' → 'left'."""
+    option = re.sub(r"^to the ", "", option)
+    return re.sub(r" of$", "", option)
+
+
+def closed_candidates(q: dict) -> list[str] | None:
+    """
+    Candidate answers for closed-answer questions: yes/no for verify and
+    logical, the two options for choose — taken from the program's final
+    choose step (argument "red|blue", or "obj,to the left of|to the right of,s"
+    for relations), else from the "X or Y?" ending of the question text.
+    None for open-ended questions.
+    """
+    structural = q["types"]["structural"]
+    if structural in ("verify", "logical"):
+        return _YES_NO
+    if structural != "choose":
+        return None
+    for step in reversed(q.get("semantic") or []):
+        if step.get("operation", "").startswith("choose"):
+            parts = step.get("argument", "").split(",")
+            options = (parts[1] if len(parts) >= 3 else parts[0]).split("|")
+            options = [_relation_answer(o.strip()) for o in options]
+            if len(options) >= 2 and all(options):
+                return options
+            break
+    m = _CHOOSE_TEXT.search(q["question"])
+    return [m.group(1), m.group(2)] if m else None
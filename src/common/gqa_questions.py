@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+src/common/gqa_questions.py
+
+Streaming loader for GQA question files (val_balanced_questions.json and
+larger splits such as train_all).
+
+json.load on a questions file materializes every question's full functional
+program, annotations and entailed / equivalent lists at once; for train_all
+(~14M questions) that does not fit in memory. This module instead:
+
+  iter_questions(path, fields)   — yields (qid, question) pairs one at a time,
+                                   parsing the top-level object incrementally
+                                   and keeping only the requested fields
+  load_questions(path, fields)   — dict {qid: question} of those fields, read
+                                   from the columnar cache when it is fresh
+  load_columns(path, fields)     — {field: column} straight from the columnar
+                                   cache (memory-mapped numpy arrays), for
+                                   analyses that never need per-question dicts
+  build_columnar_cache(path)     — one-time conversion to the columnar cache
+
+Field names:
+  "answer", "types", ...         — top-level fields, kept whole
+  "types.structural", ...        — one nested value; the question keeps the
+                                   nested shape, i.e. q["types"]["structural"]
+  "program_depth"                — derived: len(q["semantic"])
+
+Columnar cache (<questions file>.columns/, rebuilt when the source changes):
+  meta.json                      — source size/mtime, qid order, field kinds
+  <field>.codes.npy              — categorical fields (imageId, answer, types.*,
+                                   groups.*): int32 codes into meta's vocab,
+                                   -1 for null
+  <field>.npy                    — int / bool fields
+  <field>.offsets.npy + .bytes   — text fields (question, fullAnswer, ...) and
+                                   JSON-encoded structured fields (semantic, ...)
+
+Usage:
+  python src/common/gqa_questions.py --build-cache
+  python src/common/gqa_questions.py --build-cache data/questions1.2/train_all_questions \\
+      --fields imageId question answer types.structural types.semantic program_depth
+"""
+
+import argparse
+import json
+import os
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+# ── Paths ──────────────────────────────────────────────────────────────────────
+PROJECT_ROOT   = Path(__file__).resolve().parent.parent.parent
+QUESTIONS_PATH = PROJECT_ROOT / "data" / "questions1.2" / "val_balanced_questions.json"
+
+# Fields stored by default in the columnar cache: everything except the bulky
+# program / grounding fields (request those explicitly with --fields).
+DEFAULT_CACHE_FIELDS = (
+    "imageId", "question", "answer", "fullAnswer", "isBalanced",
+    "types.structural", "types.semantic", "types.detailed",
+    "groups.global", "groups.local", "program_depth",
+)
+_CATEGORICAL = ("imageId", "answer", "types.", "groups.")
+
+_CHUNK = 1 << 20
+_WS = " \t\n\r"
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# STREAMING PARSER
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _iter_object_items(path: Path) -> Iterator[tuple[str, object]]:
+    """Yield (key, value) for each member of the file's top-level JSON object,
+    holding only one member (plus a read-ahead chunk) in memory at a time."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(_CHUNK)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in _WS:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, pos = decoder.raw_decode(buf, pos)
+                    return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill()   # value straddles the chunk boundary
+
+        fill()
+        skip_ws()
+        if buf[pos : pos + 1] != "{":
+            raise ValueError(f"{path.name}: expected a top-level JSON object")
+        pos += 1
+        while True:
+            skip_ws()
+            if buf[pos : pos + 1] == "}":
+                return
+            if buf[pos : pos + 1] == ",":
+                pos += 1
+                skip_ws()
+            key = decode()
+            skip_ws()
+            if buf[pos : pos + 1] != ":":
+                raise ValueError(f"{path.name}: malformed object near {key!r}")
+            pos += 1
+            skip_ws()
+            yield key, decode()
+
+
+def _get(q: dict, field: str):
+    if field == "program_depth":
+        return len(q.get("semantic", []))
+    value = q
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _project(q: dict, fields: Iterable[str] | None) -> dict:
+    """Keep only `fields` of q, preserving the nesting of dotted fields."""
+    if fields is None:
+        return q
+    out = {}
+    for field in fields:
+        *parents, leaf = field.split(".")
+        node = out
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = _get(q, field)
+    return out
+
+
+def iter_questions(path: Path = QUESTIONS_PATH, fields: Iterable[str] | None = None,
+                   limit: int | None = None) -> Iterator[tuple[str, dict]]:
+    """Stream (qid, question) pairs from a GQA questions file; fields=None keeps
+    every field."""
+    fields = list(fields) if fields is not None else None
+    for i, (qid, q) in enumerate(_iter_object_items(Path(path))):
+        if limit is not None and i >= limit:
+            return
+        yield qid, _project(q, fields)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# COLUMNAR CACHE
+# ══════════════════════════════════════════════════════════════════════════════
+
+def cache_dir(path: Path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".columns")
+
+
+def _source_stamp(path: Path) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _read_meta(path: Path) -> dict | None:
+    """Cache metadata, or None if there is no cache or it is stale."""
+    try:
+        with open(cache_dir(path) / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return meta if meta.get("source") == _source_stamp(path) else None
+
+
+def _file_stem(field: str) -> str:
+    return field.replace(".", "__")
+
+
+def build_columnar_cache(path: Path = QUESTIONS_PATH,
+                         fields: Iterable[str] = DEFAULT_CACHE_FIELDS) -> Path:
+    """Stream `path` once and write the columnar cache; returns its directory."""
+    path, fields = Path(path), list(fields)
+    out_dir = cache_dir(path)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Building columnar cache for {path.name} → {out_dir.name}/ …")
+
+    kinds, vocabs, columns, blobs = {}, {}, {}, {}
+    qids = []
+    try:
+        for qid, q in iter_questions(path):
+            qids.append(qid)
+            for field in fields:
+                value = _get(q, field)
+                kind = kinds.get(field)
+                if kind is None:
+                    if isinstance(value, bool):
+                        kind = "bool"
+                    elif isinstance(value, int):
+                        kind = "int"
+                    elif field.startswith(_CATEGORICAL) and (value is None or isinstance(value, str)):
+                        kind = "cat"
+                    elif isinstance(value, str):
+                        kind = "str"
+                    else:
+                        kind = "json"
+                    kinds[field] = kind
+                    if kind in ("str", "json"):
+                        blobs[field] = open(out_dir / f"{_file_stem(field)}.bytes", "wb")
+                        columns[field] = array("q", [0])
+                    else:
+                        columns[field] = array("i" if kind == "cat" else "q")
+                    vocabs[field] = {}
+                if kind == "cat":
+                    columns[field].append(-1 if value is None
+                                          else vocabs[field].setdefault(value, len(vocabs[field])))
+                elif kind in ("int", "bool"):
+                    columns[field].append(int(value))
+                else:
+                    data = (value if kind == "str" else json.dumps(value)).encode()
+                    blobs[field].write(data)
+                    columns[field].append(columns[field][-1] + len(data))
+    finally:
+        for fh in blobs.values():
+            fh.close()
+
+    for field, kind in kinds.items():
+        stem = _file_stem(field)
+        if kind == "cat":
+            np.save(out_dir / f"{stem}.codes.npy", np.frombuffer(columns[field], dtype=np.int32))
+        elif kind == "int":
+            np.save(out_dir / f"{stem}.npy", np.frombuffer(columns[field], dtype=np.int64))
+        elif kind == "bool":
+            np.save(out_dir / f"{stem}.npy", np.frombuffer(columns[field], dtype=np.int64).astype(bool))
+        else:
+            np.save(out_dir / f"{stem}.offsets.npy", np.frombuffer(columns[field], dtype=np.int64))
+
+    meta = {
+        "source": _source_stamp(path),
+        "qids":   qids,
+        "fields": {f: kinds[f] for f in fields if f in kinds},
+        "vocabs": {f: list(vocabs[f]) for f in fields if kinds.get(f) == "cat"},
+    }
+    with open(out_dir / "meta.json.tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(out_dir / "meta.json.tmp", out_dir / "meta.json")   # written last = cache complete
+    print(f"  {len(qids):,} questions, {len(kinds)} fields")
+    return out_dir
+
+
+class _TextColumn:
+    """Lazy sequence over a blob + offsets text column (memory-mapped)."""
+
+    def __init__(self, blob: Path, offsets: np.ndarray, is_json: bool):
+        self._blob = np.memmap(blob, dtype=np.uint8, mode="r") if offsets[-1] else b""
+        self._offsets = offsets
+        self._json = is_json
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        text = bytes(self._blob[start:end]).decode()
+        return json.loads(text) if self._json else text
+
+
+def load_columns(path: Path = QUESTIONS_PATH, fields: Iterable[str] | None = None) -> dict:
+    """
+    {"qid": [...], field: column, ...} from the columnar cache. Categorical
+    columns come back as pandas-style (codes, vocab) pairs; int/bool columns as
+    memory-mapped arrays; text and JSON columns as lazy sequences.
+    Raises LookupError if the cache is missing, stale or lacks a field.
+    """
+    meta = _read_meta(Path(path))
+    if meta is None:
+        raise LookupError(f"no fresh columnar cache for {Path(path).name} — run --build-cache")
+    fields = list(meta["fields"]) if fields is None else list(fields)
+    missing = [f for f in fields if f not in meta["fields"]]
+    if missing:
+        raise LookupError(f"columnar cache lacks fields {missing}")
+
+    root = cache_dir(Path(path))
+    out = {"qid": meta["qids"]}
+    for field in fields:
+        kind, stem = meta["fields"][field], _file_stem(field)
+        if kind == "cat":
+            out[field] = (np.load(root / f"{stem}.codes.npy", mmap_mode="r"), meta["vocabs"][field])
+        elif kind in ("int", "bool"):
+            out[field] = np.load(root / f"{stem}.npy", mmap_mode="r")
+        else:
+            out[field] = _TextColumn(root / f"{stem}.bytes",
+                                     np.load(root / f"{stem}.offsets.npy", mmap_mode="r"),
+                                     is_json=(kind == "json"))
+    return out
+
+
+def load_questions(path: Path = QUESTIONS_PATH, fields: Iterable[str] | None = None) -> dict:
+    """
+    {qid: question} restricted to `fields` (all fields if None). Served from
+    the columnar cache when it is fresh and holds every requested field,
+    otherwise streamed from the JSON file.
+    """
+    path = Path(path)
+    meta = _read_meta(path) if fields is not None else None
+    fields = list(fields) if fields is not None else None
+    if meta is None or any(f not in meta["fields"] for f in fields):
+        return dict(iter_questions(path, fields))
+
+    cols = load_columns(path, fields)
+    values = {}
+    for field in fields:
+        col = cols[field]
+        if isinstance(col, tuple):
+            codes, vocab = col
+            values[field] = [vocab[c] if c >= 0 else None for c in codes.tolist()]
+        elif isinstance(col, np.ndarray):
+            values[field] = col.tolist()
+        else:
+            values[field] = [col[i] for i in range(len(col))]
+
+    data = {}
+    for i, qid in enumerate(cols["qid"]):
+        q = {}
+        for field in fields:
+            *parents, leaf = field.split(".")
+            node = q
+            for part in parents:
+                node = node.setdefault(part, {})
+            node[leaf] = values[field][i]
+        data[qid] = q
+    return data
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="GQA questions: streaming loader + columnar cache")
+    parser.add_argument("path", nargs="?", type=Path, default=QUESTIONS_PATH,
+                        help="Questions JSON file (default: val_balanced_questions.json)")
+    parser.add_argument("--build-cache", action="store_true",
+                        help="Convert the file to the columnar cache")
+    parser.add_argument("--fields", nargs="+", default=list(DEFAULT_CACHE_FIELDS),
+                        help="Fields to store in the cache")
+    args = parser.parse_args()
+
+    if args.build_cache:
+        build_columnar_cache(args.path, args.fields)
+    else:
+        n = sum(1 for _ in iter_questions(args.path, fields=()))
+        print(f"{args.path.name}: {n:,} questions")
+
+
+if __name__ == "__main__":
+    main()
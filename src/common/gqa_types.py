@@ -0,0 +1,20 @@
+"""
+src/common/gqa_types.py
+
+The GQA 5×5 structural × semantic matrix: type orders and the 15 cells that
+occur in the data.
+
+Kept free of heavy imports so inference code (estimate.py) and the analysis
+scripts (through analyze_results.py) share one definition of the grid.
+"""
+
+STRUCTURAL_TYPES = ["query", "verify", "logical", "choose", "compare"]
+SEMANTIC_TYPES   = ["rel", "attr", "obj", "cat", "global"]
+
+VALID_CELLS = {
+    ("query",   "rel"),  ("query",   "attr"), ("query",   "cat"), ("query",   "global"),
+    ("verify",  "rel"),  ("verify",  "attr"), ("verify",  "obj"), ("verify",  "global"),
+    ("logical", "attr"), ("logical", "obj"),
+    ("choose",  "rel"),  ("choose",  "attr"), ("choose",  "cat"), ("choose",  "global"),
+    ("compare", "attr"),
+}
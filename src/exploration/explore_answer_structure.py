@@ -21,8 +21,8 @@ Outputs (in results/exploration/answer_structure/):
   answer_vocab_stats.csv            — per-cell vocab sizes and top answers
 """
 
-import json
 import re
+import sys
 import textwrap
 from collections import Counter, defaultdict
 from pathlib import Path
@@ -41,6 +41,10 @@ OUT_DIR      = PROJECT_ROOT / "results" / "exploration" / "answer_structure"
 FIG_DIR      = OUT_DIR / "figures"
 FIG_DIR.mkdir(parents=True, exist_ok=True)
 
+# ── Streaming question loader (src/common/gqa_questions.py) ────────────────────
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "common"))
+from gqa_questions import load_questions
+
 # ── GQA taxonomy ──────────────────────────────────────────────────────────────
 STRUCTURAL = ["query", "verify", "logical", "choose", "compare"]
 SEMANTIC   = ["rel", "attr", "obj", "cat", "global"]
@@ -53,10 +57,13 @@ VALID_CELLS = {
 }
 
 
+# Fields used below; entailed / equivalent / groups are never loaded.
+FIELDS = ("imageId", "question", "answer", "fullAnswer", "types", "semantic", "annotations")
+
+
 def load_data() -> dict:
     print("Loading val_balanced_questions.json …")
-    with open(DATA_PATH) as f:
-        data = json.load(f)
+    data = load_questions(DATA_PATH, FIELDS)
     print(f"  {len(data):,} questions loaded")
     return data
 
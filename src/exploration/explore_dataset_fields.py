@@ -25,6 +25,7 @@ Outputs (in results/exploration/dataset_fields/):
 """
 
 import json
+import sys
 from collections import Counter, defaultdict
 from pathlib import Path
 
@@ -43,14 +44,22 @@ OUT_DIR      = PROJECT_ROOT / "results" / "exploration" / "dataset_fields"
 FIG_DIR      = OUT_DIR / "figures"
 FIG_DIR.mkdir(parents=True, exist_ok=True)
 
+# ── Streaming question loader (src/common/gqa_questions.py) ────────────────────
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "common"))
+from gqa_questions import iter_questions, load_questions
+
 STRUCTURAL = ["query", "verify", "logical", "choose", "compare"]
 SEMANTIC   = ["rel", "attr", "obj", "cat", "global"]
 
 
+# Fields used by the statistics below. The field guide's sample question is
+# streamed separately with every field (see write_field_guide).
+FIELDS = ("imageId", "answer", "types", "groups", "entailed", "equivalent", "annotations")
+
+
 def load_data():
     print("Loading val_balanced_questions.json …")
-    with open(Q_PATH) as f:
-        questions = json.load(f)
+    questions = load_questions(Q_PATH, FIELDS)
     print(f"  {len(questions):,} questions")
 
     print("Loading val_sceneGraphs.json …")
@@ -62,7 +71,7 @@ def load_data():
 
 # ── Field guide text ──────────────────────────────────────────────────────────
 def write_field_guide(questions: dict, scene_graphs: dict):
-    sample_q = list(questions.values())[5]   # pick an interesting one
+    sample_qid, sample_q = list(iter_questions(Q_PATH, limit=6))[5]   # pick an interesting one
     sample_sg_id = sample_q["imageId"]
     sample_sg = scene_graphs.get(sample_sg_id, {})
 
@@ -125,7 +134,7 @@ def write_field_guide(questions: dict, scene_graphs: dict):
             lines.append(f"         {line}")
 
     # ── Sample question ──
-    lines.append(f"\n\nSAMPLE QUESTION (id: {list(questions.keys())[5]}):")
+    lines.append(f"\n\nSAMPLE QUESTION (id: {sample_qid}):")
     import pprint
     lines.append(pprint.pformat(sample_q, width=80))
 
@@ -22,7 +22,7 @@ Outputs (in results/exploration/depth_distribution/):
   depth_stats.csv                  — per-cell depth statistics
 """
 
-import json
+import sys
 import textwrap
 from collections import Counter, defaultdict
 from pathlib import Path
@@ -41,6 +41,10 @@ OUT_DIR      = PROJECT_ROOT / "results" / "exploration" / "depth_distribution"
 FIG_DIR      = OUT_DIR / "figures"
 FIG_DIR.mkdir(parents=True, exist_ok=True)
 
+# ── Streaming question loader (src/common/gqa_questions.py) ────────────────────
+sys.path.insert(0, str(PROJECT_ROOT / "src" / "common"))
+from gqa_questions import load_questions
+
 # ── GQA taxonomy ──────────────────────────────────────────────────────────────
 STRUCTURAL = ["query", "verify", "logical", "choose", "compare"]
 SEMANTIC   = ["rel", "attr", "obj", "cat", "global"]
@@ -56,10 +60,13 @@ DEPTH_COLORS = {2: "#4e9af1", 3: "#3ec97c", 4: "#f5a623", 5: "#e74c3c",
                 6: "#9b59b6", 7: "#1abc9c", 8: "#e67e22", 9: "#c0392b"}
 
 
+# Fields used below; annotations / entailed / equivalent / groups are never loaded.
+FIELDS = ("imageId", "question", "answer", "fullAnswer", "types", "semantic")
+
+
 def load_data() -> dict:
     print("Loading val_balanced_questions.json …")
-    with open(DATA_PATH) as f:
-        data = json.load(f)
+    data = load_questions(DATA_PATH, FIELDS)
     print(f"  {len(data):,} questions loaded")
     return data
 
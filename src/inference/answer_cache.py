@@ -0,0 +1,174 @@
+"""
+src/inference/answer_cache.py
+
+Persistent content-addressed answer cache (run_inference.py --answer-cache).
+
+Resume only reuses rows of the same output file, by qid. Re-running on an
+overlapping question set (a new balanced subset, testdev, a filtered slice)
+would run both models again on inputs they have already answered. The answer
+cache is a SQLite file shared by every run, one entry per model answer:
+
+  key     = sha256(model revision, image content digest, question, candidates)
+  answers : key → (answer, seconds per question when it was computed)
+  images  : imageId → (file stamp, sha256 of the image bytes)
+
+The model revision (model_version + backend, precision and decoding mode,
+built by run_inference.py) changes whenever any of them would change an
+answer. The question is lowercased and whitespace-collapsed, as for
+deduplication (both tokenizers are uncased). Image digests are memoized
+per file stamp (size and mtime of the image, or of images.zip), so an image
+is hashed once rather than on every run.
+
+Lookups and fills count hits / misses / additions per model for the run
+summary. A lock makes the cache safe to call from the --parallel-models
+joiner thread.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from model_bundle import MANIFEST, WEIGHTS, is_bundle
+
+_CHUNK = 500   # keys per SELECT ... IN (...)
+
+
+def _file_sha(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+
+
+def model_version(model_id: str, bundle_path: Path | None = None) -> str:
+    """
+    Identify the weights a model id resolves to without loading them: the
+    local bundle's manifest, config and weight size; a local directory's
+    config and weight sizes; or the hub snapshot's commit hash.
+    """
+    if bundle_path is not None and is_bundle(bundle_path, model_id):
+        manifest = json.loads((bundle_path / MANIFEST).read_text())
+        return (f"{model_id}@bundle:{_file_sha(bundle_path / 'config.json')}:"
+                f"{(bundle_path / WEIGHTS).stat().st_size}:{manifest.get('transformers')}")
+    local = Path(model_id)
+    if local.is_dir():
+        weights = sorted(f"{p.name}={p.stat().st_size}" for p in local.iterdir()
+                         if p.suffix in (".safetensors", ".bin"))
+        return f"{model_id}@local:{_file_sha(local / 'config.json')}:{','.join(weights)}"
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        config = try_to_load_from_cache(model_id, "config.json")
+        if isinstance(config, str):
+            return f"{model_id}@{Path(config).parent.name}"   # .../snapshots/<commit>/config.json
+    except ImportError:
+        pass
+    return f"{model_id}@unknown"
+
+
+class AnswerCache:
+    """
+    revisions: model name → revision string for every model this run fills.
+    lookup:    models whose answers may be served from the cache (default all).
+    """
+
+    def __init__(self, path: Path, revisions: dict[str, str], lookup=None):
+        self.path      = Path(path)
+        self.revisions = revisions
+        self.lookup    = set(revisions if lookup is None else lookup)
+        self.hits      = Counter()
+        self.misses    = Counter()
+        self.added     = Counter()
+        self._lock     = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS answers ("
+                         "key TEXT PRIMARY KEY, answer TEXT, seconds REAL, created REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS images ("
+                         "image_id TEXT PRIMARY KEY, stamp TEXT, digest TEXT)")
+        self._db.commit()
+
+    # ── keys ──────────────────────────────────────────────────────────────────
+    def key(self, model: str, image_digest: str, question: str, candidates=None) -> str:
+        text = " ".join(question.lower().split())
+        payload = json.dumps([self.revisions[model], image_digest, text, list(candidates or ())])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def image_digests(self, stamps: dict[str, str], read_bytes, workers: int = 4) -> dict[str, str]:
+        """
+        imageId → sha256 of its bytes, for every imageId in stamps (imageId →
+        file stamp) that read_bytes can read. Digests whose stamp is unchanged
+        come from the images table; the rest are hashed on `workers` threads.
+        """
+        ids = list(stamps)
+        known = {}
+        with self._lock:
+            for i in range(0, len(ids), _CHUNK):
+                chunk = ids[i : i + _CHUNK]
+                rows = self._db.execute(
+                    f"SELECT image_id, stamp, digest FROM images WHERE image_id IN "
+                    f"({','.join('?' * len(chunk))})", chunk).fetchall()
+                known.update({image_id: digest for image_id, stamp, digest in rows
+                              if stamp == stamps[image_id]})
+
+        def digest(image_id):
+            data = read_bytes(image_id)
+            return image_id, (hashlib.sha256(data).hexdigest() if data is not None else None)
+
+        todo = [image_id for image_id in ids if image_id not in known]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            new = {image_id: d for image_id, d in pool.map(digest, todo) if d is not None}
+        if new:
+            with self._lock:
+                self._db.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?)",
+                                     [(image_id, stamps[image_id], d) for image_id, d in new.items()])
+                self._db.commit()
+        return {**known, **new}
+
+    # ── answers ───────────────────────────────────────────────────────────────
+    def get_many(self, model: str, keys: list[str]) -> dict[str, tuple[str, float]]:
+        """key → (answer, seconds) for the keys found; counts hits and misses."""
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _CHUNK):
+                chunk = keys[i : i + _CHUNK]
+                rows = self._db.execute(
+                    f"SELECT key, answer, seconds FROM answers WHERE key IN "
+                    f"({','.join('?' * len(chunk))})", chunk).fetchall()
+                found.update({key: (answer, seconds) for key, answer, seconds in rows})
+            self.hits[model]   += len(found)
+            self.misses[model] += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, entries: list[tuple[str, str, float]]):
+        """Store (key, answer, seconds) entries."""
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)",
+                                 [(key, answer, seconds, now) for key, answer, seconds in entries])
+            self._db.commit()
+            self.added[model] += len(entries)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def summary(self) -> str:
+        """One line per model: hits / misses (hit rate), answers added."""
+        lines = []
+        for model in sorted(self.revisions):
+            hits, misses = self.hits[model], self.misses[model]
+            rate = f"{hits / (hits + misses):.0%}" if hits + misses else "—"
+            lines.append(f"  {model:<6s} {hits:>9,} hits / {misses:>9,} misses ({rate}), "
+                         f"{self.added[model]:,} added")
+        lines.append(f"  {len(self):,} answers in {self.path}")
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
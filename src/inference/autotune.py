@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+src/inference/autotune.py
+
+Throughput autotuner for run_inference.py on the local CPU.
+
+Sweeps, for BLIP and ViLT separately:
+  - batch size                     (--batch-sizes)
+  - torch intra-op threads         (--threads; default: all cores per worker, and half)
+  - torch inter-op threads         (--interop; 0 = torch's default)
+  - worker processes               (--workers; as run_inference.py --launch N,
+                                    each with cores / N threads)
+  - backend                        (torch, plus onnx when export_onnx.py graphs exist)
+
+on a fixed sample of GQA questions (stratified by cell, sorted by imageId as
+run_inference.py orders them), or on synthetic images and template questions
+when the questions file or images are missing. Every (model, backend,
+workers, threads, inter-op) combination runs in fresh processes — inter-op
+threads can only be set once per process, and peak RSS must not carry over —
+loaded through run_inference.py's own model code, with the image-embedding
+cache off so every batch does its full work. Each batch size is warmed up,
+then timed for --min-seconds; concurrent workers' questions/s are summed.
+
+The profile (tuning_profile.py) records every measurement and the best
+single-process settings for BLIP, ViLT and both in sequence (combined rate
+1 / (1/blip + 1/vilt)). run_inference.py loads it automatically on this host
+and uses it for --batch-size, --num-threads, --interop-threads and --backend
+unless they are given; the best multi-worker layout is printed as a --launch
+recommendation.
+
+Output:
+  results/autotune/<host>.json
+
+Usage:
+  python src/inference/autotune.py
+  python src/inference/autotune.py --batch-sizes 1 8 32 --workers 1 2 --min-seconds 10
+  python src/inference/autotune.py --synthetic --sample 32     # no GQA data needed
+  python src/inference/autotune.py --skip-vilt --backends torch onnx
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import run_inference as ri
+from tuning_profile import cpu_model, host_name, profile_path, write_profile
+
+# Template questions for --synthetic (and when GQA data is missing).
+SYNTHETIC_QUESTIONS = [
+    "What color is the car on the left?",
+    "Is there a table in the picture?",
+    "Which side of the image is the man on?",
+    "What is the large animal standing on the grass?",
+    "Are the chairs made of wood or metal?",
+    "Is the sky cloudy?",
+    "What is the woman holding?",
+    "Who is wearing the hat?",
+]
+SYNTHETIC_SIZE = (640, 480)   # typical GQA image
+QUESTIONS_PER_IMAGE = 4
+WARMUP_BATCHES = 2
+
+# run_inference.py module settings a trial process must share with this one.
+TRIAL_SETTINGS = ri.WORKER_SETTINGS + ("IMAGES_DIR", "IMAGES_ZIP")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SAMPLE
+# ══════════════════════════════════════════════════════════════════════════════
+
+def gqa_sample(n: int) -> list[dict] | None:
+    """n questions from val_balanced, stratified by cell and sorted by imageId,
+    whose images can be read; None if the questions file or images are missing."""
+    if not ri.QUESTIONS_PATH.exists() or not (ri.IMAGES_DIR.exists() or ri.IMAGES_ZIP.exists()):
+        return None
+    data = ri.load_questions(ri.QUESTIONS_PATH, ri.QUESTION_FIELDS)
+    n_cells = len({(q["types"]["structural"], q["types"]["semantic"]) for q in data.values()})
+    data = ri.stratified_sample(data, -(-n // max(1, n_cells)))
+    qids = sorted(data, key=lambda qid: zlib.crc32(qid.encode()))[:n]
+    sample = sorted(({"imageId": data[qid]["imageId"], "question": data[qid]["question"]}
+                     for qid in qids), key=lambda q: q["imageId"])
+    readable = {q["imageId"] for q in sample if ri.read_image(q["imageId"]) is not None}
+    sample = [q for q in sample if q["imageId"] in readable]
+    return sample or None
+
+
+def synthetic_sample(n: int) -> list[dict]:
+    return [{"imageId": f"synthetic-{i // QUESTIONS_PER_IMAGE}",
+             "question": SYNTHETIC_QUESTIONS[i % len(SYNTHETIC_QUESTIONS)]} for i in range(n)]
+
+
+def sample_image(image_id: str, synthetic: bool) -> Image.Image:
+    if not synthetic:
+        return ri.read_image(image_id)
+    rng = np.random.default_rng(zlib.crc32(image_id.encode()))
+    w, h = SYNTHETIC_SIZE
+    return Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss: KB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# TRIAL (one process: one model, backend, thread setting; all batch sizes)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def run_trial(spec: dict) -> dict:
+    for key, value in spec["settings"].items():
+        setattr(ri, key, Path(value) if isinstance(getattr(ri, key), Path) else value)
+    if spec["interop"] > 0 and spec["backend"] == "torch":
+        torch.set_num_interop_threads(spec["interop"])
+    torch.set_num_threads(spec["threads"])
+    ri._memory.max_bytes = 0   # no embedding / image reuse across batches
+
+    name = spec["model"]
+    t0 = time.perf_counter()
+    bundle_dir = Path(spec["bundle_dir"]) if spec["bundle_dir"] else None
+    blip, vilt = ri.load_models(name == "blip", name == "vilt", "cpu", spec["backend"],
+                                (spec["threads"], spec["interop"]), bundle_dir)
+    load_s = time.perf_counter() - t0
+    pair = blip or vilt
+    answer_fn = ri.blip_answer_batch if name == "blip" else ri.vilt_answer_batch
+
+    sample = json.loads(Path(spec["sample"]).read_text())
+    images = {q["imageId"]: sample_image(q["imageId"], spec["synthetic"]) for q in sample}
+
+    results = []
+    with torch.no_grad():
+        for batch_size in spec["batch_sizes"]:
+            batches = [sample[i : i + batch_size] for i in range(0, len(sample), batch_size)]
+
+            def run(batch):
+                ids = [q["imageId"] for q in batch]
+                answer_fn(pair, ids, [images[i] for i in ids], [q["question"] for q in batch], "cpu")
+
+            for batch in batches[:WARMUP_BATCHES]:
+                run(batch)
+            n_questions, t0 = 0, time.perf_counter()
+            while True:
+                for batch in batches:
+                    run(batch)
+                    n_questions += len(batch)
+                if time.perf_counter() - t0 >= spec["min_seconds"]:
+                    break
+            elapsed = time.perf_counter() - t0
+            results.append({"batch_size": batch_size, "qps": n_questions / elapsed,
+                            "peak_rss_mb": peak_rss_mb()})
+    return {"load_s": load_s, "results": results}
+
+
+def launch_trial(spec: dict, workers: int) -> list[dict] | None:
+    """Run `workers` copies of a trial at once; per batch size, the summed
+    questions/s and peak RSS. None if any copy failed."""
+    env = {**os.environ, "OMP_NUM_THREADS": str(spec["threads"]),
+           "MKL_NUM_THREADS": str(spec["threads"])}
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--trial", json.dumps(spec)]
+    procs = [subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              text=True) for _ in range(workers)]
+    outs = []
+    for proc in procs:
+        stdout, stderr = proc.communicate()
+        if proc.returncode != 0:
+            print(f"    failed: {stderr.strip().splitlines()[-1] if stderr.strip() else proc.returncode}")
+            return None
+        outs.append(json.loads(stdout.strip().splitlines()[-1]))
+    return [{"batch_size": rows[0]["batch_size"],
+             "qps": sum(r["qps"] for r in rows),
+             "peak_rss_mb": sum(r["peak_rss_mb"] for r in rows)}
+            for rows in zip(*(out["results"] for out in outs))]
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SWEEP
+# ══════════════════════════════════════════════════════════════════════════════
+
+def thread_options(cores: int, workers: int, spec: list[int] | None) -> list[int]:
+    """Intra-op threads per worker: the given list (capped to the worker's share
+    of the cores), or all of that share and half of it."""
+    share = max(1, cores // workers)
+    options = [min(t, share) for t in spec] if spec else [share, share // 2]
+    return sorted({t for t in options if t >= 1}, reverse=True)
+
+
+def combined_best(trials: list[dict], single_process: bool) -> dict | None:
+    """Best configuration for BLIP then ViLT on the same settings (combined
+    rate 1 / (1/blip + 1/vilt)); single_process restricts it to one worker."""
+    by_config = {}
+    for t in trials:
+        if single_process and t["workers"] != 1:
+            continue
+        key = (t["backend"], t["workers"], t["threads"], t["interop"], t["batch_size"])
+        by_config.setdefault(key, {})[t["model"]] = t
+    best = None
+    for (backend, workers, threads, interop, batch_size), models in by_config.items():
+        if len(models) < 2:
+            continue
+        qps = 1.0 / sum(1.0 / m["qps"] for m in models.values())
+        if best is None or qps > best["qps"]:
+            best = {"backend": backend, "workers": workers, "batch_size": batch_size,
+                    "num_threads": threads, "interop_threads": interop, "qps": round(qps, 3),
+                    "peak_rss_mb": round(max(m["peak_rss_mb"] for m in models.values()))}
+    return best
+
+
+def model_best(trials: list[dict], model: str) -> dict | None:
+    single = [t for t in trials if t["model"] == model and t["workers"] == 1]
+    if not single:
+        return None
+    t = max(single, key=lambda t: t["qps"])
+    return {"backend": t["backend"], "workers": 1, "batch_size": t["batch_size"],
+            "num_threads": t["threads"], "interop_threads": t["interop"],
+            "qps": round(t["qps"], 3), "peak_rss_mb": round(t["peak_rss_mb"])}
+
+
+def format_best(label: str, best: dict | None) -> str:
+    if best is None:
+        return f"  {label:<6s} —"
+    return (f"  {label:<6s} {best['qps']:7.2f} q/s  backend={best['backend']} "
+            f"batch={best['batch_size']} threads={best['num_threads']} "
+            f"interop={best['interop_threads']} workers={best['workers']} "
+            f"peak RSS {best['peak_rss_mb']:,} MB")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# MAIN
+# ══════════════════════════════════════════════════════════════════════════════
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune run_inference.py settings for this CPU")
+    parser.add_argument("--trial", default=None, help=argparse.SUPPRESS)   # internal: one trial
+    parser.add_argument("--skip-blip", action="store_true", help="Do not tune BLIP")
+    parser.add_argument("--skip-vilt", action="store_true", help="Do not tune ViLT")
+    parser.add_argument("--sample", type=int, default=64, metavar="N",
+                        help="Questions in the benchmark sample (default 64)")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Benchmark on synthetic images even if GQA data is present")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32],
+                        metavar="B", help="Batch sizes to try (default 1 4 8 16 32)")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, metavar="T",
+                        help="Intra-op threads per worker to try (default: the worker's "
+                             "share of the cores, and half of it)")
+    parser.add_argument("--interop", type=int, nargs="+", default=[0, 1], metavar="T",
+                        help="Inter-op threads to try; 0 = torch's default (default 0 1)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], metavar="N",
+                        help="Concurrent worker processes to try (default 1 2 4, "
+                             "up to the core count)")
+    parser.add_argument("--backends", nargs="+", choices=["torch", "onnx"], default=None,
+                        help="Backends to try (default torch, plus onnx if its graphs exist)")
+    parser.add_argument("--min-seconds", type=float, default=3.0, metavar="S",
+                        help="Timed seconds per batch size after warm-up (default 3)")
+    parser.add_argument("--no-bundle", action="store_true",
+                        help="Load models with from_pretrained even if local bundles exist")
+    parser.add_argument("--output", type=Path, default=None, metavar="PATH",
+                        help="Profile file (default results/autotune/<host>.json)")
+    args = parser.parse_args()
+
+    if args.trial is not None:
+        print(json.dumps(run_trial(json.loads(args.trial))))
+        return
+
+    cores = os.cpu_count() or 1
+    out_path = args.output or profile_path(ri.AUTOTUNE_DIR)
+    backends = args.backends or (["torch", "onnx"] if (ri.ONNX_DIR / "vilt.onnx").exists()
+                                 else ["torch"])
+    models = [m for m in ("blip", "vilt") if not getattr(args, f"skip_{m}")]
+    workers = sorted({w for w in args.workers if 1 <= w <= cores})
+
+    # ── Sample ────────────────────────────────────────────────────────────────
+    sample = None if args.synthetic else gqa_sample(args.sample)
+    synthetic = sample is None
+    if synthetic:
+        sample = synthetic_sample(args.sample)
+        print(f"Sample: {len(sample)} template questions on synthetic "
+              f"{SYNTHETIC_SIZE[0]}×{SYNTHETIC_SIZE[1]} images")
+    else:
+        print(f"Sample: {len(sample)} GQA questions on "
+              f"{len({q['imageId'] for q in sample})} images")
+    print(f"Host: {host_name()} ({cpu_model()}, {cores} CPUs)")
+
+    # ── Sweep ─────────────────────────────────────────────────────────────────
+    trials = []
+    with tempfile.TemporaryDirectory() as tmp:
+        sample_file = Path(tmp) / "sample.json"
+        sample_file.write_text(json.dumps(sample))
+        base = {
+            "sample":      str(sample_file),
+            "synthetic":   synthetic,
+            "batch_sizes": sorted(args.batch_sizes),
+            "min_seconds": args.min_seconds,
+            "bundle_dir":  None if args.no_bundle else str(ri.BUNDLE_DIR),
+            "settings":    {k: str(getattr(ri, k)) for k in TRIAL_SETTINGS},
+        }
+        for model in models:
+            for backend in backends:
+                for n_workers in workers:
+                    for threads in thread_options(cores, n_workers, args.threads):
+                        for interop in sorted(set(args.interop)):
+                            print(f"{model} {backend} workers={n_workers} threads={threads} "
+                                  f"interop={interop}")
+                            spec = {**base, "model": model, "backend": backend,
+                                    "threads": threads, "interop": interop}
+                            rows = launch_trial(spec, n_workers)
+                            for row in rows or []:
+                                print(f"    batch {row['batch_size']:>3d}: {row['qps']:7.2f} q/s, "
+                                      f"peak RSS {row['peak_rss_mb']:,.0f} MB")
+                                trials.append({"model": model, "backend": backend,
+                                               "workers": n_workers, "threads": threads,
+                                               "interop": interop, **row})
+
+    if not trials:
+        print("No trial succeeded — no profile written.")
+        sys.exit(1)
+
+    # ── Profile ───────────────────────────────────────────────────────────────
+    best = {m: model_best(trials, m) for m in models}
+    best["both"] = combined_best(trials, single_process=True)
+    best_sharded = combined_best(trials, single_process=False)
+    profile = {
+        "host":         host_name(),
+        "cpu_model":    cpu_model(),
+        "cpu_count":    cores,
+        "created":      time.strftime("%Y-%m-%d %H:%M:%S"),
+        "torch":        torch.__version__,
+        "models":       {"blip": ri.BLIP_MODEL_ID, "vilt": ri.VILT_MODEL_ID},
+        "sample":       {"questions": len(sample), "synthetic": synthetic},
+        "best":         {k: v for k, v in best.items() if v is not None},
+        "best_sharded": best_sharded,
+        "trials":       [{**t, "qps": round(t["qps"], 3), "peak_rss_mb": round(t["peak_rss_mb"])}
+                         for t in trials],
+    }
+    write_profile(out_path, profile)
+
+    print("\nBest single-process settings (applied by run_inference.py on this host):")
+    for label in (*models, "both"):
+        print(format_best(label, best.get(label)))
+    if best_sharded and best_sharded["workers"] > 1 and (
+            best["both"] is None or best_sharded["qps"] > best["both"]["qps"]):
+        print(f"\nFaster with several workers: run_inference.py --launch {best_sharded['workers']} "
+              f"--batch-size {best_sharded['batch_size']}")
+        print(format_best("both", best_sharded))
+    print(f"\nProfile saved to: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+src/inference/backfill.py
+
+Per-model completion tracking and column merging (run_inference.py --backfill).
+
+A predictions row holds both models' answers, and resume counts a qid as done
+once any row exists — so after a --skip-blip run, BLIP could only be added by
+re-running ViLT too. A backfill run instead executes one model on the qids
+whose rows lack that model's answer, into a part file of its own:
+
+  all_predictions.jsonl                  — consolidated predictions
+  all_predictions.backfill-blip.jsonl    — rows of a `--backfill blip` run
+
+The part file is an ordinary PredictionLog (checkpointed, resumable). When the
+run finishes, merge_columns copies the model's columns from the part rows
+into the matching rows of the main file by qid, adding rows for qids the main
+file lacks, and replaces the main file atomically.
+
+Columns can be renamed on the way in (--backfill-as): backfilling an int8
+BLIP as "blip_int8" adds blip_int8_answer / _correct / _time / _method next
+to the existing blip_* columns instead of replacing them.
+"""
+
+import json
+import os
+from pathlib import Path
+
+from prediction_log import checkpoint_path, load_done_qids
+
+# Row fields produced by each model (make_row); "<model>_answer" marks it done.
+MODEL_FIELDS = {
+    "blip": ("blip_answer", "blip_correct", "blip_time", "blip_method"),
+    "vilt": ("vilt_answer", "vilt_correct", "vilt_time"),
+}
+
+
+def backfill_path(path: Path, name: str) -> Path:
+    """all_predictions.jsonl → all_predictions.backfill-NAME.jsonl"""
+    return path.with_name(f"{path.stem}.backfill-{name}{path.suffix}")
+
+
+def renamed_fields(model: str, name: str) -> dict[str, str]:
+    """Part-row field → main-row column, e.g. blip_time → blip_int8_time."""
+    return {field: name + field[len(model):] for field in MODEL_FIELDS[model]}
+
+
+def model_done_qids(path: Path, name: str) -> set[str]:
+    """qids of rows in path with a non-null "<name>_answer" — the rows that
+    model (or column set) has already answered."""
+    key = f"{name}_answer"
+    done = set()
+    if not path.exists():
+        return done
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n") or not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if row.get(key) is not None:
+                done.add(row["qid"])
+    return done
+
+
+def backfill_done_qids(path: Path, name: str) -> set[str]:
+    """qids a backfill of `name` can skip: answered in the main file, or
+    already written to its part file (whose torn tail is repaired)."""
+    return model_done_qids(path, name) | load_done_qids(backfill_path(path, name))
+
+
+def _load_part(part: Path, fields: dict[str, str]) -> dict[str, dict]:
+    """qid → {"row": full part row, "columns": renamed model columns}."""
+    rows = {}
+    with open(part) as f:
+        for line in f:
+            if not line.endswith("\n") or not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            rows[row["qid"]] = {
+                "row":     row,
+                "columns": {dst: row.get(src) for src, dst in fields.items()},
+            }
+    return rows
+
+
+def merge_columns(path: Path, model: str, name: str | None = None) -> tuple[int, int]:
+    """
+    Fold the `model` columns of backfill_path(path, name) into path: matching
+    rows get the (renamed) columns, missing qids are appended as whole rows.
+    A column set run at a precision other than the row's also records
+    "<name>_precision". The merged file is written to a temporary file and
+    renamed into place; the part file is left on disk.
+    Returns (rows updated, rows added).
+    """
+    name = name or model
+    part = backfill_path(path, name)
+    if not part.exists():
+        return 0, 0
+    fields = renamed_fields(model, name)
+    pending = _load_part(part, fields)
+
+    def fill(row: dict, entry: dict) -> dict:
+        row.update(entry["columns"])
+        precision = entry["row"].get("precision")
+        if precision is not None and precision != row.get("precision"):
+            row[f"{name}_precision"] = precision
+        return row
+
+    n_updated = 0
+    tmp = path.with_name(path.name + ".merging")
+    with open(tmp, "w") as out_f:
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    entry = pending.pop(row["qid"], None)
+                    if entry is not None:
+                        row = fill(row, entry)
+                        n_updated += 1
+                    out_f.write(json.dumps(row) + "\n")
+        for entry in pending.values():
+            row = entry["row"]
+            if name != model:
+                # a renamed column set is the only one this row has
+                for src in fields:
+                    row.pop(src, None)
+            out_f.write(json.dumps(fill(row, entry)) + "\n")
+        out_f.flush()
+        os.fsync(out_f.fileno())
+    os.replace(tmp, path)
+    checkpoint_path(path).unlink(missing_ok=True)   # rebuilt on next resume
+    return n_updated, len(pending)
@@ -0,0 +1,223 @@
+"""
+src/inference/estimate.py
+
+Adaptive, cell-stratified quick estimate for run_inference.py --estimate.
+
+Questions are stratified over the 15 valid structural × semantic cells and,
+within each cell, over program depth: a cell's questions are ordered so that
+every prefix of the order covers its depths in proportion to their
+population (each depth stratum in crc32(qid) order, strata interleaved by
+relative rank). Sampling a cell means taking a longer prefix, so the
+sample is deterministic and a resumed estimate reuses every answered row.
+
+Round 1 takes `initial` questions per cell. After each round every cell's
+95% CI on the paired BLIP − ViLT gap (or on the one model's accuracy when
+the other is skipped) is recomputed; cells still wider than `target` get
+the sample size projected to reach it, n · (width / target)², at most
+`growth` × n per round. It stops once every cell is within target (or has
+no questions left), or after `max_total` questions.
+
+Cell estimates are post-stratified over depth: Σ_d W_d · mean_d with W_d
+the depth's share of the cell, and variance Σ_d W_d² s_d² / n_d with a
+finite-population correction. Each depth stratum's variance counts one
+pseudo-observation at each end of the value range, so a small sample in
+which every answer agrees cannot report a zero-width interval. The overall
+estimate weights cells by their share of the split.
+"""
+
+import json
+import math
+import sys
+import zlib
+from collections import Counter, defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+from gqa_types import SEMANTIC_TYPES, STRUCTURAL_TYPES, VALID_CELLS
+
+Z = 1.96   # 95% normal interval
+
+# metric → value range (where the two pseudo-observations sit)
+METRICS = {
+    "blip": (0.0, 1.0),
+    "vilt": (0.0, 1.0),
+    "gap":  (-1.0, 1.0),
+}
+
+
+def _cell_key(cell):
+    return STRUCTURAL_TYPES.index(cell[0]), SEMANTIC_TYPES.index(cell[1])
+
+
+def cell_orders(data: dict, depth_fn) -> dict[tuple, list[str]]:
+    """Per valid cell, its qids in depth-proportional sampling order."""
+    by_depth = defaultdict(lambda: defaultdict(list))
+    for qid, q in data.items():
+        cell = (q["types"]["structural"], q["types"]["semantic"])
+        if cell in VALID_CELLS:
+            by_depth[cell][depth_fn(q)].append(qid)
+    orders = {}
+    for cell, strata in by_depth.items():
+        ranked = []
+        for qids in strata.values():
+            qids.sort(key=lambda qid: zlib.crc32(qid.encode()))
+            ranked += [((i + 0.5) / len(qids), zlib.crc32(qid.encode()), qid)
+                       for i, qid in enumerate(qids)]
+        orders[cell] = [qid for *_, qid in sorted(ranked)]
+    return orders
+
+
+def _poststratified(values: dict, pop: Counter, lo: float, hi: float):
+    """(mean, variance) of a cell from per-depth value lists."""
+    sampled = {d: v for d, v in values.items() if v}
+    if not sampled:
+        return None, None
+    total = sum(pop[d] for d in sampled)
+    mean = var = 0.0
+    for d, v in sampled.items():
+        w, n = pop[d] / total, len(v)
+        padded = v + [lo, hi]
+        m = sum(padded) / len(padded)
+        s2 = sum((x - m) ** 2 for x in padded) / (len(padded) - 1)
+        fpc = 1 - n / pop[d] if pop[d] > 1 else 0.0
+        mean += w * sum(v) / n
+        var  += w * w * s2 / n * fpc
+    return mean, var
+
+
+class AdaptiveEstimate:
+    def __init__(self, data: dict, depth_fn, target: float, initial: int = 50,
+                 growth: float = 2.0, max_total: int = 20000):
+        if target <= 0:
+            raise ValueError("target CI width must be > 0")
+        self.target    = target
+        self.initial   = initial
+        self.growth    = growth
+        self.max_total = max_total
+        self.orders    = cell_orders(data, depth_fn)
+        self.depth     = {qid: depth_fn(data[qid]) for qid in self._all_qids()}
+        self.pop       = {cell: Counter(self.depth[qid] for qid in qids)
+                          for cell, qids in self.orders.items()}
+        self.taken     = {cell: 0 for cell in self.orders}
+        self.results: dict[str, dict] = {}   # qid → {"blip": 0/1 | None, "vilt": …}
+        self.rounds    = 0
+
+    def _all_qids(self):
+        for qids in self.orders.values():
+            yield from qids
+
+    def add_rows(self, path: Path):
+        """Record the outcome of every sampled question answered in path."""
+        if not path.exists():
+            return
+        sampled = {qid for cell, qids in self.orders.items() for qid in qids[: self.taken[cell]]}
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue   # torn last line of an interrupted run
+                if row.get("qid") in sampled:
+                    self.results[row["qid"]] = {"blip": row.get("blip_correct"),
+                                                "vilt": row.get("vilt_correct")}
+
+    def _metric(self) -> str:
+        have = {m for r in self.results.values() for m in ("blip", "vilt") if r[m] is not None}
+        return "gap" if have == {"blip", "vilt"} else (have.pop() if have else "gap")
+
+    def cell_stats(self) -> list[dict]:
+        """Per cell: n, population and (estimate, CI half-width) per metric."""
+        stats = []
+        for cell in sorted(self.orders, key=_cell_key):
+            values = {m: defaultdict(list) for m in METRICS}
+            n = 0
+            for qid in self.orders[cell][: self.taken[cell]]:
+                r = self.results.get(qid)
+                if r is None:
+                    continue
+                n += 1
+                d = self.depth[qid]
+                for m in ("blip", "vilt"):
+                    if r[m] is not None:
+                        values[m][d].append(float(r[m]))
+                if r["blip"] is not None and r["vilt"] is not None:
+                    values["gap"][d].append(float(r["blip"]) - float(r["vilt"]))
+            row = {"structural": cell[0], "semantic": cell[1], "n": n,
+                   "population": len(self.orders[cell])}
+            for m, (lo, hi) in METRICS.items():
+                mean, var = _poststratified(values[m], self.pop[cell], lo, hi)
+                row[m] = mean
+                row[f"{m}_ci"] = None if var is None else Z * math.sqrt(var)
+            stats.append(row)
+        return stats
+
+    def overall(self, stats: list[dict]) -> dict:
+        """Population-weighted estimate over all cells with at least one answer."""
+        total = sum(s["population"] for s in stats if s["n"])
+        out = {"n": sum(s["n"] for s in stats), "population": total}
+        for m in METRICS:
+            parts = [(s["population"] / total, s[m], s[f"{m}_ci"]) for s in stats
+                     if s["n"] and s[m] is not None]
+            out[m] = sum(w * v for w, v, _ in parts) if parts else None
+            out[f"{m}_ci"] = math.sqrt(sum((w * ci) ** 2 for w, _, ci in parts)) if parts else None
+        return out
+
+    def next_round(self) -> list[str]:
+        """qids to add to the sample now; empty when the estimate is done."""
+        budget = self.max_total - sum(self.taken.values())
+        want = {}
+        if self.rounds == 0:
+            want = {cell: self.initial for cell in self.orders}
+        else:
+            metric = self._metric()
+            for s in self.cell_stats():
+                cell = (s["structural"], s["semantic"])
+                ci = s[f"{metric}_ci"]
+                if ci is None or s["n"] == 0 or 2 * ci <= self.target:
+                    continue
+                needed = math.ceil(s["n"] * (2 * ci / self.target) ** 2)
+                want[cell] = min(needed, math.ceil(self.taken[cell] * self.growth))
+        qids = []
+        for cell, n in sorted(want.items(), key=lambda kv: _cell_key(kv[0])):
+            n = min(n, len(self.orders[cell]))
+            extra = min(max(0, n - self.taken[cell]), budget)
+            qids += self.orders[cell][self.taken[cell] : self.taken[cell] + extra]
+            self.taken[cell] += extra
+            budget -= extra
+        self.rounds += 1
+        return qids
+
+
+def format_estimates(stats: list[dict], overall: dict, target: float) -> str:
+    def fmt(v, ci):
+        return f"{'—':>15s}" if v is None else f"{v:>7.3f} ± {ci:.3f}"
+
+    lines = [
+        f"{'cell':18s}{'n':>7s}{'of':>8s}   {'BLIP':>15s}   {'ViLT':>15s}   {'gap':>15s}",
+        "-" * 82,
+    ]
+    for s in stats:
+        gap_ci = s["gap_ci"]
+        flag = "" if gap_ci is None or 2 * gap_ci <= target else "  *"
+        lines.append(f"{s['structural'] + '×' + s['semantic']:18s}{s['n']:>7,}{s['population']:>8,}   "
+                     f"{fmt(s['blip'], s['blip_ci'])}   {fmt(s['vilt'], s['vilt_ci'])}   "
+                     f"{fmt(s['gap'], s['gap_ci'])}{flag}")
+    lines.append("-" * 82)
+    lines.append(f"{'overall':18s}{overall['n']:>7,}{overall['population']:>8,}   "
+                 f"{fmt(overall['blip'], overall['blip_ci'])}   "
+                 f"{fmt(overall['vilt'], overall['vilt_ci'])}   "
+                 f"{fmt(overall['gap'], overall['gap_ci'])}")
+    lines.append(f"(95% intervals; * = gap CI still wider than {target:.3f})")
+    return "\n".join(lines)
+
+
+def write_estimates(path: Path, stats: list[dict], overall: dict):
+    """Per-cell estimates (plus an 'overall' row) as CSV."""
+    cols = ["structural", "semantic", "n", "population"] + \
+           [c for m in METRICS for c in (m, f"{m}_ci")]
+    with open(path, "w") as f:
+        f.write(",".join(cols) + "\n")
+        for row in stats + [{"structural": "overall", "semantic": "", **overall}]:
+            f.write(",".join("" if row.get(c) is None else
+                             (f"{row[c]:.5f}" if isinstance(row[c], float) else str(row[c]))
+                             for c in cols) + "\n")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+src/inference/export_onnx.py
+
+Exports the parts of BLIP and ViLT that run_inference.py --backend onnx runs
+in ONNX Runtime (see onnx_backend.py for the graph list) to models/onnx/.
+
+Each graph is traced on small dummy inputs with dynamic batch / sequence /
+patch axes, then checked against the PyTorch model on the same inputs.
+
+Usage:
+  python src/inference/export_onnx.py                # both models
+  python src/inference/export_onnx.py --skip-vilt    # BLIP only
+  python src/inference/export_onnx.py --opset 17
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+import torch
+from torch import nn
+from transformers import BlipForQuestionAnswering, GenerationConfig, ViltForQuestionAnswering
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from onnx_backend import BLIP_TEXT_DECODER, BLIP_TEXT_ENCODER, BLIP_VISION, META, VILT
+from run_inference import BLIP_MODEL_ID, ONNX_DIR, VILT_MODEL_ID
+
+
+# ── Export wrappers: plain tensor in, tensor out ──────────────────────────────
+class BlipVision(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.vision_model = model.vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values)[0]
+
+
+class BlipTextEncoder(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.text_encoder = model.text_encoder
+
+    def forward(self, input_ids, attention_mask, image_embeds):
+        image_mask = torch.ones(image_embeds.shape[:-1], dtype=torch.long)
+        return self.text_encoder(input_ids=input_ids, attention_mask=attention_mask,
+                                 encoder_hidden_states=image_embeds,
+                                 encoder_attention_mask=image_mask, return_dict=False)[0]
+
+
+class BlipTextDecoder(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.text_decoder = model.text_decoder
+
+    def forward(self, input_ids, attention_mask, encoder_hidden_states):
+        encoder_mask = torch.ones(encoder_hidden_states.shape[:-1], dtype=torch.long)
+        return self.text_decoder(input_ids=input_ids, attention_mask=attention_mask,
+                                 encoder_hidden_states=encoder_hidden_states,
+                                 encoder_attention_mask=encoder_mask,
+                                 use_cache=False, return_dict=True).logits
+
+
+class ViltFromEmbeds(nn.Module):
+    """ViLT after patch selection: text embeddings + transformer + classifier."""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids, image_embeds, image_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                          token_type_ids=token_type_ids, image_embeds=image_embeds,
+                          pixel_mask=image_mask).logits
+
+
+# ── Export + check ────────────────────────────────────────────────────────────
+def export(module: nn.Module, inputs: dict, dynamic_axes: dict, path: Path, opset: int):
+    """Trace module on inputs, save it to path and compare ONNX Runtime to PyTorch."""
+    module.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            module, tuple(inputs.values()), str(path),
+            input_names=list(inputs), output_names=["output"],
+            dynamic_axes={**dynamic_axes, "output": {0: "batch"}},
+            opset_version=opset, dynamo=False,
+        )
+        expected = module(**inputs).numpy()
+    session = ort.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+    (got,) = session.run(None, {k: v.numpy() for k, v in inputs.items()})
+    err = float(np.abs(got - expected).max())
+    print(f"  {path.name}: max |onnx − torch| = {err:.2e}")
+
+
+def export_blip(out_dir: Path, opset: int):
+    print(f"Loading BLIP ({BLIP_MODEL_ID})...")
+    model = BlipForQuestionAnswering.from_pretrained(BLIP_MODEL_ID).eval()
+    size = model.config.vision_config.image_size
+    hidden = model.config.text_config.hidden_size
+    batch = {0: "batch"}
+    seq   = {0: "batch", 1: "seq"}
+
+    pixel_values = torch.randn(2, 3, size, size)
+    export(BlipVision(model), {"pixel_values": pixel_values}, {"pixel_values": batch},
+           out_dir / BLIP_VISION, opset)
+
+    with torch.no_grad():
+        image_embeds = BlipVision(model)(pixel_values)
+    vocab = model.config.text_config.vocab_size
+    input_ids = torch.randint(0, vocab, (2, 7))
+    export(BlipTextEncoder(model),
+           {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids),
+            "image_embeds": image_embeds},
+           {"input_ids": seq, "attention_mask": seq, "image_embeds": batch},
+           out_dir / BLIP_TEXT_ENCODER, opset)
+
+    question_embeds = torch.randn(2, 7, hidden)
+    answer_ids = torch.randint(0, vocab, (2, 3))
+    answer_ids[:, 0] = model.decoder_start_token_id
+    export(BlipTextDecoder(model),
+           {"input_ids": answer_ids, "attention_mask": torch.ones_like(answer_ids),
+            "encoder_hidden_states": question_embeds},
+           {"input_ids": seq, "attention_mask": seq,
+            "encoder_hidden_states": {0: "batch", 1: "question_len"}},
+           out_dir / BLIP_TEXT_DECODER, opset)
+
+    # Total answer length ([DEC] included) as text_decoder.generate works it out
+    # for the 1-token prompt: the default max_length means 20 *new* tokens.
+    gen = model.text_decoder.generation_config
+    if gen.max_new_tokens is not None:
+        max_length = gen.max_new_tokens + 1
+    elif gen.max_length == GenerationConfig().max_length:
+        max_length = min(gen.max_length + 1, model.config.text_config.max_position_embeddings)
+    else:
+        max_length = gen.max_length
+    return {
+        "model_id":               BLIP_MODEL_ID,
+        "decoder_start_token_id": model.decoder_start_token_id,
+        "sep_token_id":           model.config.text_config.sep_token_id,
+        "pad_token_id":           model.config.text_config.pad_token_id,
+        "max_length":             max_length,
+    }
+
+
+def export_vilt(out_dir: Path, opset: int):
+    print(f"Loading ViLT ({VILT_MODEL_ID})...")
+    model = ViltForQuestionAnswering.from_pretrained(VILT_MODEL_ID).eval()
+    size = model.config.image_size
+    pixel_values = torch.randn(2, 3, size, size)
+    pixel_mask = torch.ones(2, size, size, dtype=torch.long)
+    with torch.no_grad():
+        image_embeds, image_mask, _ = model.vilt.embeddings.visual_embed(
+            pixel_values, pixel_mask, max_image_length=model.config.max_image_length)
+    input_ids = torch.randint(0, model.config.vocab_size, (2, 7))
+    seq = {0: "batch", 1: "seq"}
+    export(ViltFromEmbeds(model),
+           {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids),
+            "token_type_ids": torch.zeros_like(input_ids),
+            "image_embeds": image_embeds, "image_mask": image_mask.long()},
+           {"input_ids": seq, "attention_mask": seq, "token_type_ids": seq,
+            "image_embeds": {0: "batch", 1: "patches"}, "image_mask": {0: "batch", 1: "patches"}},
+           out_dir / VILT, opset)
+    return {"model_id": VILT_MODEL_ID}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export BLIP / ViLT to ONNX for --backend onnx")
+    parser.add_argument("--skip-blip", action="store_true", help="Do not export BLIP")
+    parser.add_argument("--skip-vilt", action="store_true", help="Do not export ViLT")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset (default 17)")
+    parser.add_argument("--out-dir", type=Path, default=ONNX_DIR,
+                        help="Output directory (default models/onnx/)")
+    args = parser.parse_args()
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = args.out_dir / META
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+    if not args.skip_blip:
+        meta["blip"] = export_blip(args.out_dir, args.opset)
+    if not args.skip_vilt:
+        meta["vilt"] = export_vilt(args.out_dir, args.opset)
+    meta_path.write_text(json.dumps(meta, indent=2))
+    print(f"Exported to: {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
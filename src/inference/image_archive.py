@@ -0,0 +1,139 @@
+"""
+src/inference/image_archive.py
+
+Indexed, memory-mapped reader for data/images.zip.
+
+Opening the ~20 GB GQA images.zip with zipfile parses the whole central
+directory and every read goes through a seek + read + copy on one shared file
+handle. ImageArchive instead:
+
+  - builds an index imageId → (data offset, compressed size, size, method)
+    once from the central directory and caches it next to the zip
+    (images.zip.idx, invalidated when the zip's size or mtime changes)
+  - memory-maps the zip and serves stored (uncompressed) members as
+    zero-copy memoryview slices of the mapping; deflated members are
+    inflated from the mapped bytes
+  - exposes each member's archive offset so callers can order work for
+    sequential reads
+
+Reads only slice the mapping (no shared file position), so one instance can
+be shared by any number of prefetch threads.
+
+Usage:
+    archive = ImageArchive(Path("data/images.zip"))
+    buf = archive.read("2354786")          # memoryview or bytes, None if absent
+    todo.sort(key=lambda x: archive.offset(x[1]["imageId"]))
+"""
+
+import mmap
+import os
+import struct
+import zipfile
+import zlib
+from pathlib import Path
+
+_INDEX_VERSION = 1
+_LOCAL_HEADER  = struct.Struct("<4s5H3L2H")   # zip local file header (30 bytes)
+_LOCAL_MAGIC   = b"PK\x03\x04"
+
+
+class ImageArchive:
+    def __init__(self, zip_path: Path, index_path: Path | None = None,
+                 prefix: str = "images/", suffix: str = ".jpg"):
+        self.zip_path   = Path(zip_path)
+        self.index_path = Path(index_path) if index_path else self.zip_path.with_name(
+            self.zip_path.name + ".idx")
+        self._prefix, self._suffix = prefix, suffix
+
+        self._fh = open(self.zip_path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+
+        st = os.stat(self.zip_path)
+        self._stamp = f"{_INDEX_VERSION} {st.st_size} {st.st_mtime_ns}"
+        self.index = self._load_index()
+        if self.index is None:
+            self.index = self._build_index()
+            self._save_index()
+
+    # ── Index ─────────────────────────────────────────────────────────────────
+    def _load_index(self) -> dict | None:
+        """Return the cached index, or None if absent or stale."""
+        try:
+            with open(self.index_path) as f:
+                if f.readline().rstrip("\n") != self._stamp:
+                    return None
+                index = {}
+                for line in f:
+                    image_id, offset, csize, size, method = line.rstrip("\n").split("\t")
+                    index[image_id] = (int(offset), int(csize), int(size), int(method))
+                return index
+        except (OSError, ValueError):
+            return None
+
+    def _build_index(self) -> dict:
+        print(f"Indexing {self.zip_path.name} (one-time)...")
+        index = {}
+        with zipfile.ZipFile(self._fh) as zf:
+            infos = zf.infolist()
+        for info in infos:
+            name = info.filename
+            if not (name.startswith(self._prefix) and name.endswith(self._suffix)):
+                continue
+            image_id = name[len(self._prefix) : -len(self._suffix)]
+            header = _LOCAL_HEADER.unpack_from(self._mm, info.header_offset)
+            if header[0] != _LOCAL_MAGIC:
+                raise zipfile.BadZipFile(f"bad local header for {name}")
+            name_len, extra_len = header[-2], header[-1]
+            offset = info.header_offset + _LOCAL_HEADER.size + name_len + extra_len
+            index[image_id] = (offset, info.compress_size, info.file_size, info.compress_type)
+        return index
+
+    def _save_index(self):
+        """Write the index atomically; a read-only data directory just means
+        the index is rebuilt next time."""
+        tmp = self.index_path.with_name(self.index_path.name + f".tmp{os.getpid()}")
+        try:
+            with open(tmp, "w") as f:
+                f.write(self._stamp + "\n")
+                for image_id, (offset, csize, size, method) in self.index.items():
+                    f.write(f"{image_id}\t{offset}\t{csize}\t{size}\t{method}\n")
+            os.replace(tmp, self.index_path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+
+    # ── Access ────────────────────────────────────────────────────────────────
+    def __contains__(self, image_id: str) -> bool:
+        return image_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def offset(self, image_id: str) -> int:
+        """Archive offset of image_id's data (images not in the archive sort last)."""
+        entry = self.index.get(image_id)
+        return entry[0] if entry else len(self._mm)
+
+    def read(self, image_id: str) -> memoryview | bytes | None:
+        """
+        Raw file bytes for image_id: a zero-copy memoryview into the mapping for
+        stored members, freshly inflated bytes for deflated ones, None if absent.
+        """
+        entry = self.index.get(image_id)
+        if entry is None:
+            return None
+        offset, csize, size, method = entry
+        data = self._view[offset : offset + csize]
+        if method == zipfile.ZIP_STORED:
+            return data
+        if method == zipfile.ZIP_DEFLATED:
+            return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data, size)
+        raise NotImplementedError(f"unsupported zip compression method {method} for {image_id}")
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            pass   # slices still held by callers; the mapping goes with them
+        self._fh.close()
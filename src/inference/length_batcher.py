@@ -0,0 +1,81 @@
+"""
+src/inference/length_batcher.py
+
+Length-sorted dynamic batching for the inference loop.
+
+Questions arrive in image order (so each image is read and encoded once).
+LengthBatcher holds them in a window of up to `window` consecutive images,
+then sorts the window by cost — tokenized question length plus expected
+answer length — and cuts it into batches whose padded size
+(questions × longest cost in the batch) stays within `token_budget`.
+Short questions therefore travel in large batches and long ones in small
+batches, instead of every batch being padded to its longest member.
+
+Ties in cost are broken by imageId, so questions of one image with equal
+cost sit next to each other and share a batch and its image embedding.
+Questions of one image with different costs can still land in different
+batches; their embedding is then reused through run_inference.py's
+in-memory LRU. A small window bounds both the images held in memory and how
+far one image's questions can be spread apart.
+
+Usage:
+    batcher = LengthBatcher(cost_fn, token_budget=2048, window=16)
+    for item in stream:
+        for batch in batcher.add(item, image_id):
+            run(batch)
+    for batch in batcher.flush():
+        run(batch)
+"""
+
+from typing import Callable
+
+
+class LengthBatcher:
+    def __init__(self, cost_fn: Callable, token_budget: int, window: int = 16,
+                 max_batch: int | None = None):
+        if token_budget < 1:
+            raise ValueError("token budget must be ≥ 1")
+        if window < 1:
+            raise ValueError("batch window must be ≥ 1 image")
+        self._cost_fn   = cost_fn
+        self.budget     = token_budget
+        self.window     = window
+        self.max_batch  = max_batch
+        self._pending   = []      # (cost, imageId, arrival index, item)
+        self._images    = set()
+        self.tokens     = 0       # real (unpadded) tokens batched so far
+        self.padded     = 0       # padded tokens batched so far
+
+    def add(self, item, image_id: str) -> list[list]:
+        """Queue one item; returns the window's batches once it is full."""
+        ready = []
+        if image_id not in self._images and len(self._images) >= self.window:
+            ready = self.flush()
+        self._images.add(image_id)
+        self._pending.append((self._cost_fn(item), image_id, len(self._pending), item))
+        return ready
+
+    def flush(self) -> list[list]:
+        """Cut everything pending into budgeted batches, shortest first."""
+        self._pending.sort(key=lambda p: (p[0], p[1], p[2]))
+        batches, batch, longest = [], [], 0
+        for cost, _, _, item in self._pending:
+            full = self.max_batch is not None and len(batch) >= self.max_batch
+            if batch and (full or max(longest, cost) * (len(batch) + 1) > self.budget):
+                batches.append(batch)
+                self.padded += longest * len(batch)
+                batch, longest = [], 0
+            batch.append(item)
+            longest = max(longest, cost)
+            self.tokens += cost
+        if batch:
+            batches.append(batch)
+            self.padded += longest * len(batch)
+        self._pending = []
+        self._images  = set()
+        return batches
+
+    @property
+    def efficiency(self) -> float:
+        """Share of batched tokens that are real rather than padding."""
+        return self.tokens / self.padded if self.padded else 1.0
@@ -0,0 +1,101 @@
+"""
+src/inference/memory_cache.py
+
+Bounded in-memory LRU cache for the inference loop's per-image work:
+decoded images, image-processor outputs and BLIP image embeddings.
+
+The loop used to keep exactly one decoded image and one BLIP embedding,
+which only pays off while questions arrive sorted by imageId. Length-sorted
+batches (--token-budget), estimate rounds and deduplicated to-do lists revisit
+an image after others, so ByteLRU keeps as many recent entries as fit in a
+byte budget and evicts the least recently used first.
+
+Keys are (kind, imageId) tuples; hits / misses are counted per kind so the run
+summary can report each one's hit rate. A lock makes get / put safe from the
+prefetch threads. Sizes are estimated from the payload (PIL pixel bytes,
+tensor storage) — close enough for a budget, not an exact RSS figure.
+"""
+
+import threading
+from collections import Counter, OrderedDict
+
+import torch
+from PIL import Image
+
+
+def nbytes(value) -> int:
+    """Approximate memory held by an image, tensor, or container of them."""
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    return 0
+
+
+class ByteLRU:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes     = 0
+        self._items: OrderedDict = OrderedDict()   # key → (value, size), oldest first
+        self._lock     = threading.Lock()
+        self.hits      = Counter()
+        self.misses    = Counter()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key) -> bool:
+        return key in self._items
+
+    def get(self, key):
+        """Cached value for key (marked most recently used), or None."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses[key[0]] += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits[key[0]] += 1
+            return item[0]
+
+    def put(self, key, value):
+        """Insert value, evicting least recently used entries to stay in budget.
+        Values larger than the whole budget are not cached."""
+        size = nbytes(value)
+        if value is None or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            while self._items and self.bytes + size > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+            self._items[key] = (value, size)
+            self.bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def hit_rate(self, kind: str | None = None) -> float:
+        hits   = self.hits[kind] if kind else sum(self.hits.values())
+        misses = self.misses[kind] if kind else sum(self.misses.values())
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def summary(self) -> str:
+        """One line per kind: hits / misses (hit rate), then size and evictions."""
+        lines = []
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            lines.append(f"  {kind:<12s} {self.hits[kind]:>9,} hits / {self.misses[kind]:>9,} misses "
+                         f"({self.hit_rate(kind):.0%})")
+        lines.append(f"  {len(self):,} entries, {self.bytes / 2**20:,.0f} / "
+                     f"{self.max_bytes / 2**20:,.0f} MB, {self.evictions:,} evictions")
+        return "\n".join(lines)
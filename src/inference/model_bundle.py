@@ -0,0 +1,105 @@
+"""
+src/inference/model_bundle.py
+
+Self-contained local model bundles for fast startup (prepare_bundle.py).
+
+A bundle is one directory per model:
+  model.safetensors   — weights, a single file
+  config.json         — model config (incl. ViLT's id2label)
+  preprocessor / tokenizer files — from processor.save_pretrained
+  labels.json         — answer label map (classifier models only)
+  bundle.json         — {"model_id", "model_class", "transformers"}
+
+load_bundle builds the model from config.json without running weight
+initialisation, then assigns every parameter a tensor that is a view into a
+read-only, copy-on-write memory map of model.safetensors. Nothing is copied
+and nothing is resolved through the Hugging Face hub: startup costs a JSON
+parse and an mmap, and every process that maps the same bundle (shard
+workers, --launch) shares one page-cache copy of the weights.
+"""
+
+import json
+import mmap
+import struct
+from pathlib import Path
+
+import torch
+import transformers
+from transformers.modeling_utils import no_init_weights
+
+WEIGHTS  = "model.safetensors"
+LABELS   = "labels.json"
+MANIFEST = "bundle.json"
+
+_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+
+def write_bundle(model_id: str, proc, model, out_dir: Path):
+    """Save model, processor, label map and manifest to out_dir."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(out_dir, safe_serialization=True, max_shard_size="1000GB")
+    proc.save_pretrained(out_dir)
+    id2label = model.config.id2label
+    if len(id2label) > 2:     # a real label set, not the LABEL_0 / LABEL_1 default
+        (out_dir / LABELS).write_text(json.dumps({int(k): v for k, v in id2label.items()}))
+    (out_dir / MANIFEST).write_text(json.dumps({
+        "model_id":     model_id,
+        "model_class":  type(model).__name__,
+        "transformers": transformers.__version__,
+    }, indent=2))
+
+
+def is_bundle(path: Path, model_id: str) -> bool:
+    """True if path holds a complete bundle prepared from model_id."""
+    manifest = path / MANIFEST
+    if not (manifest.exists() and (path / WEIGHTS).exists()):
+        return False
+    return json.loads(manifest.read_text()).get("model_id") == model_id
+
+
+def mmap_safetensors(path: Path) -> dict[str, torch.Tensor]:
+    """
+    Map a .safetensors file and return its tensors as zero-copy views.
+    The map is copy-on-write (ACCESS_COPY), so tensors are writable as torch
+    requires, but pages are only duplicated if a tensor is actually written.
+    """
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    (header_len,) = struct.unpack("<Q", buf[:8])
+    header = json.loads(buf[8 : 8 + header_len])
+    header.pop("__metadata__", None)
+    data = memoryview(buf)[8 + header_len :]
+    tensors = {}
+    for name, info in header.items():
+        dtype = _DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if end == start:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(data[start:end], dtype=dtype).view(info["shape"])
+    return tensors
+
+
+def load_bundle(path: Path, model_cls, proc_cls):
+    """Return (processor, model) from a bundle, weights memory-mapped."""
+    proc = proc_cls.from_pretrained(path, local_files_only=True)
+    config = model_cls.config_class.from_pretrained(path, local_files_only=True)
+    with no_init_weights():
+        model = model_cls(config)
+    state = mmap_safetensors(path / WEIGHTS)
+    missing, unexpected = model.load_state_dict(state, strict=False, assign=True)
+    # save_pretrained drops tied copies (e.g. BLIP's decoder output matrix);
+    # tie_weights points them back at the mapped tensor they share.
+    model.tie_weights()
+    mapped = {t.data_ptr() for t in state.values()}
+    tensors = {**dict(model.named_parameters(remove_duplicate=False)),
+               **dict(model.named_buffers(remove_duplicate=False))}
+    missing = [k for k in missing if tensors[k].data_ptr() not in mapped]
+    if missing or unexpected:
+        raise RuntimeError(f"bundle {path} does not match {model_cls.__name__}: "
+                           f"missing {missing[:5]}, unexpected {unexpected[:5]}")
+    return proc, model.eval()
@@ -0,0 +1,136 @@
+"""
+src/inference/onnx_backend.py
+
+ONNX Runtime (CPU) backend for run_inference.py --backend onnx.
+
+export_onnx.py writes the graphs to models/onnx/:
+  blip_vision.onnx        pixel_values → image_embeds
+  blip_text_encoder.onnx  input_ids, attention_mask, image_embeds → question_embeds
+  blip_text_decoder.onnx  input_ids, attention_mask, encoder_hidden_states → logits
+  vilt.onnx               input_ids, attention_mask, token_type_ids,
+                          image_embeds, image_mask → logits
+  onnx_meta.json          BLIP decoder token ids and generation length
+
+OnnxBlip mirrors the pieces run_inference.py runs on the PyTorch model
+(image encoder, question encoder, decoder logits, greedy answer generation)
+and takes / returns torch tensors, so the batching, caching and per-length
+decoding code is shared by both backends. The decoder graph has no KV cache:
+every generation step re-runs the (≤ max_length token) answer prefix, which
+is cheap next to the vision encoder.
+
+ViLT's patch embedding picks image patches with data-dependent shapes (one
+position-embedding interpolation per image size), which ONNX export cannot
+trace, so OnnxVilt keeps that small module in PyTorch and runs the
+transformer, pooler and classifier in ONNX Runtime. It is called like the
+PyTorch model (model(**inputs).logits) and reuses its config — id2label
+included — for decoding.
+"""
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+BLIP_VISION       = "blip_vision.onnx"
+BLIP_TEXT_ENCODER = "blip_text_encoder.onnx"
+BLIP_TEXT_DECODER = "blip_text_decoder.onnx"
+VILT              = "vilt.onnx"
+META              = "onnx_meta.json"
+
+
+def session_options(intra_threads: int = 0, inter_threads: int = 0) -> ort.SessionOptions:
+    """All graph optimizations; 0 threads leaves the choice to onnxruntime."""
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    opts.intra_op_num_threads = intra_threads
+    opts.inter_op_num_threads = inter_threads
+    opts.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if inter_threads > 1
+                           else ort.ExecutionMode.ORT_SEQUENTIAL)
+    return opts
+
+
+def _session(path: Path, opts: ort.SessionOptions) -> ort.InferenceSession:
+    if not path.exists():
+        raise FileNotFoundError(f"{path} not found — run src/inference/export_onnx.py first")
+    return ort.InferenceSession(str(path), sess_options=opts, providers=["CPUExecutionProvider"])
+
+
+def _np(t: torch.Tensor, dtype) -> np.ndarray:
+    return t.detach().cpu().numpy().astype(dtype, copy=False)
+
+
+class OnnxBlip:
+    def __init__(self, onnx_dir: Path, intra_threads: int = 0, inter_threads: int = 0):
+        opts = session_options(intra_threads, inter_threads)
+        self._vision  = _session(onnx_dir / BLIP_VISION, opts)
+        self._encoder = _session(onnx_dir / BLIP_TEXT_ENCODER, opts)
+        self._decoder = _session(onnx_dir / BLIP_TEXT_DECODER, opts)
+        meta = json.loads((onnx_dir / META).read_text())["blip"]
+        self.decoder_start_token_id = meta["decoder_start_token_id"]
+        self.sep_token_id = meta["sep_token_id"]
+        self.pad_token_id = meta["pad_token_id"]
+        self.max_length   = meta["max_length"]
+
+    def encode_images(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        (out,) = self._vision.run(None, {"pixel_values": _np(pixel_values, np.float32)})
+        return torch.from_numpy(out)
+
+    def encode_questions(self, image_embeds, input_ids, attention_mask) -> torch.Tensor:
+        (out,) = self._encoder.run(None, {
+            "input_ids":      _np(input_ids, np.int64),
+            "attention_mask": _np(attention_mask, np.int64),
+            "image_embeds":   _np(image_embeds, np.float32),
+        })
+        return torch.from_numpy(out)
+
+    def decoder_logits(self, input_ids, attention_mask, question_embeds) -> torch.Tensor:
+        (out,) = self._decoder.run(None, {
+            "input_ids":             _np(input_ids, np.int64),
+            "attention_mask":        _np(attention_mask, np.int64),
+            "encoder_hidden_states": _np(question_embeds, np.float32),
+        })
+        return torch.from_numpy(out)
+
+    def generate(self, question_embeds: torch.Tensor) -> list[list[int]]:
+        """
+        Greedy decoding as text_decoder.generate does it by default: argmax
+        per step, [PAD] after a sequence's [SEP], stop when every sequence has
+        ended or max_length tokens (including [DEC]) are reached.
+        """
+        embeds = _np(question_embeds, np.float32)
+        n = len(embeds)
+        ids = np.full((n, 1), self.decoder_start_token_id, dtype=np.int64)
+        done = np.zeros(n, dtype=bool)
+        while ids.shape[1] < self.max_length and not done.all():
+            (logits,) = self._decoder.run(None, {
+                "input_ids":             ids,
+                "attention_mask":        np.ones_like(ids),
+                "encoder_hidden_states": embeds,
+            })
+            nxt = logits[:, -1].argmax(-1)
+            nxt[done] = self.pad_token_id
+            ids = np.concatenate([ids, nxt[:, None]], axis=1)
+            done |= nxt == self.sep_token_id
+        return ids.tolist()
+
+
+class OnnxVilt:
+    def __init__(self, onnx_dir: Path, torch_model, intra_threads: int = 0, inter_threads: int = 0):
+        self._session   = _session(onnx_dir / VILT, session_options(intra_threads, inter_threads))
+        self.embeddings = torch_model.vilt.embeddings   # patch selection stays in PyTorch
+        self.config     = torch_model.config
+
+    def __call__(self, input_ids, attention_mask, token_type_ids, pixel_values, pixel_mask):
+        image_embeds, image_mask, _ = self.embeddings.visual_embed(
+            pixel_values, pixel_mask, max_image_length=self.config.max_image_length)
+        (logits,) = self._session.run(None, {
+            "input_ids":      _np(input_ids, np.int64),
+            "attention_mask": _np(attention_mask, np.int64),
+            "token_type_ids": _np(token_type_ids, np.int64),
+            "image_embeds":   _np(image_embeds, np.float32),
+            "image_mask":     _np(image_mask, np.int64),
+        })
+        return SimpleNamespace(logits=torch.from_numpy(logits))
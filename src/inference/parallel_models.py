@@ -0,0 +1,80 @@
+"""
+src/inference/parallel_models.py
+
+Shared-memory image ring for run_inference.py --parallel-models.
+
+With --parallel-models, BLIP and ViLT run in their own worker processes, each
+with its own thread budget, instead of one after the other. The main process
+decodes every image once into a slot of an ImageRing — a
+multiprocessing.shared_memory block cut into fixed-size slots — and sends
+both workers only (slot, shape) references; each worker reads the pixels
+through a numpy view of the same memory, without a copy or a pickle.
+
+A slot is handed out by acquire() and returned by release() once every
+worker has answered the batch that uses it, so the ring also bounds how far
+the producer can run ahead of the slower model. Images larger than a slot
+travel inline in the task message instead.
+"""
+
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class ImageRing:
+    def __init__(self, n_slots: int, slot_bytes: int, name: str | None = None):
+        self.n_slots    = n_slots
+        self.slot_bytes = slot_bytes
+        self.owner      = name is None
+        self.shm = (shared_memory.SharedMemory(create=True, size=n_slots * slot_bytes)
+                    if self.owner else shared_memory.SharedMemory(name=name))
+        self.name = self.shm.name
+        self._free = list(range(n_slots))
+        self._cond = threading.Condition()
+
+    @classmethod
+    def attach(cls, name: str, n_slots: int, slot_bytes: int) -> "ImageRing":
+        """The worker side: map an existing ring by name."""
+        return cls(n_slots, slot_bytes, name=name)
+
+    # ── owner side ────────────────────────────────────────────────────────────
+    def fits(self, array: np.ndarray) -> bool:
+        return array.nbytes <= self.slot_bytes
+
+    def acquire(self, n: int, abort=lambda: False) -> list[int]:
+        """Block until n slots (at most the ring size) are free and take them.
+        Gives up with RuntimeError if abort() turns true while waiting."""
+        n = min(n, self.n_slots)
+        with self._cond:
+            while len(self._free) < n:
+                if abort():
+                    raise RuntimeError("model workers stopped")
+                self._cond.wait(timeout=1.0)
+            slots, self._free = self._free[:n], self._free[n:]
+        return slots
+
+    def release(self, slots: list[int]):
+        if not slots:
+            return
+        with self._cond:
+            self._free.extend(slots)
+            self._cond.notify_all()
+
+    def put(self, slot: int, array: np.ndarray) -> tuple:
+        """Copy a uint8 image array into slot; returns its shape."""
+        view = np.ndarray(array.shape, dtype=np.uint8, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+        view[...] = array
+        return array.shape
+
+    # ── both sides ────────────────────────────────────────────────────────────
+    def view(self, slot: int, shape: tuple) -> np.ndarray:
+        """Zero-copy uint8 view of the image in slot."""
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,112 @@
+"""
+src/inference/pixel_cache.py
+
+Persistent on-disk cache of preprocessed pixel tensors, one per imageId.
+
+BlipProcessor / ViltProcessor outputs depend only on the image and the image
+processor's config, so they are computed once and reused by every later run,
+backfill or question subset on the same images — with the cache warm, the
+image is never opened or decoded.
+
+Layout (one directory per model + processor config):
+  <root>/<model>-<config hash>/
+    pixels.bin   — raw arrays, appended back to back
+    index.jsonl  — {"id": imageId, "arrays": [[name, dtype, shape, offset], ...]}
+
+The config hash covers the full image-processor config, so changing resize /
+normalization settings starts a new cache instead of serving stale tensors.
+An index line is only appended after its array data has been written and
+flushed, so a crash leaves at worst unreferenced bytes at the end of
+pixels.bin. Appends take an exclusive flock, so shard workers on one host can
+fill the same cache.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+import torch
+
+
+def config_hash(model_id: str, image_processor) -> str:
+    blob = f"{model_id}\n{image_processor.to_json_string()}".encode()
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+class PixelCache:
+    def __init__(self, root: Path, model_id: str, image_processor):
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", model_id.rsplit("/", 1)[-1]).strip("-")
+        self.dir = Path(root) / f"{slug}-{config_hash(model_id, image_processor)}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.data_path  = self.dir / "pixels.bin"
+        self.index_path = self.dir / "index.jsonl"
+        self.data_path.touch()
+        self.index: dict[str, list] = {}
+        self._map  = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self._load_index()
+
+    def _load_index(self):
+        if not self.index_path.exists():
+            return
+        with open(self.index_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue   # torn final line from an interrupted append
+                self.index[entry["id"]] = entry["arrays"]
+
+    def __contains__(self, image_id: str) -> bool:
+        return image_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _mapped(self, end: int) -> np.memmap:
+        """Memory map of pixels.bin covering at least `end` bytes (remapped as it grows)."""
+        if self._map is None or len(self._map) < end:
+            self._map = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+        return self._map
+
+    def get(self, image_id: str) -> dict[str, torch.Tensor] | None:
+        arrays = self.index.get(image_id)
+        if arrays is None:
+            self.misses += 1
+            return None
+        end = max(offset + np.dtype(dtype).itemsize * int(np.prod(shape))
+                  for _, dtype, shape, offset in arrays)
+        with self._lock:
+            mm = self._mapped(end)
+        out = {}
+        for name, dtype, shape, offset in arrays:
+            nbytes = np.dtype(dtype).itemsize * int(np.prod(shape))
+            arr = mm[offset : offset + nbytes].view(dtype).reshape(shape)
+            out[name] = torch.from_numpy(np.array(arr))   # copy out of the read-only map
+        self.hits += 1
+        return out
+
+    def put(self, image_id: str, tensors: dict[str, torch.Tensor]):
+        arrays = {name: t.detach().cpu().contiguous().numpy() for name, t in tensors.items()}
+        with self._lock, open(self.data_path, "ab") as data_f, \
+                open(self.index_path, "a") as index_f:
+            fcntl.flock(index_f, fcntl.LOCK_EX)
+            try:
+                offset = data_f.seek(0, os.SEEK_END)
+                entries = []
+                for name, arr in arrays.items():
+                    data_f.write(arr.tobytes())
+                    entries.append([name, arr.dtype.str, list(arr.shape), offset])
+                    offset += arr.nbytes
+                data_f.flush()
+                index_f.write(json.dumps({"id": image_id, "arrays": entries}) + "\n")
+                index_f.flush()
+            finally:
+                fcntl.flock(index_f, fcntl.LOCK_UN)
+        self.index[image_id] = entries
@@ -0,0 +1,172 @@
+"""
+src/inference/prediction_log.py
+
+Append-only predictions JSONL with a compact resume checkpoint.
+
+Resuming used to json.loads every row of all_predictions.jsonl just to read
+its qid. PredictionLog keeps a sidecar, all_predictions.jsonl.ckpt, appended
+after every flushed batch of rows:
+
+    #inode <st_ino of the JSONL>
+    <byte offset after the batch>\t<qid> <qid> ...
+
+so the done set on restart is a plain read of the sidecar. Rows written after
+the last checkpoint record (e.g. by an older version of the script) are found
+by scanning only the tail of the JSONL from that offset. A final line without
+a trailing newline — a write torn by preemption — is truncated away before
+appending resumes, so it can never fuse with the next row.
+
+When the sidecar is missing or does not describe this file (a different inode,
+or an offset past the end of the file, e.g. after a merge replaced it), the
+JSONL is scanned once with a qid-only fast path and the sidecar rewritten.
+"""
+
+import json
+import os
+from pathlib import Path
+
+_QID_PREFIX = '{"qid": "'   # json.dumps(row) with "qid" as the first key
+
+
+def checkpoint_path(path: Path) -> Path:
+    return path.with_name(path.name + ".ckpt")
+
+
+def _line_qid(line: bytes) -> str | None:
+    """qid of one JSONL row, without parsing the whole row when possible."""
+    text = line.decode("utf-8", errors="replace")
+    if text.startswith(_QID_PREFIX):
+        end = text.find('"', len(_QID_PREFIX))
+        if end > 0 and "\\" not in text[len(_QID_PREFIX) : end]:
+            return text[len(_QID_PREFIX) : end]
+    try:
+        return json.loads(text)["qid"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+
+def _scan(path: Path, start: int) -> tuple[list[str], int]:
+    """qids of complete rows from byte `start` on, and the offset just past the
+    last complete line (a torn final line is excluded)."""
+    qids = []
+    end = start
+    with open(path, "rb") as f:
+        f.seek(start)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            end += len(line)
+            if line.strip():
+                qid = _line_qid(line)
+                if qid is not None:
+                    qids.append(qid)
+    return qids, end
+
+
+def _read_checkpoint(path: Path) -> tuple[set[str], int] | None:
+    """(qids, offset) recorded in the sidecar, or None if it can't be trusted."""
+    ckpt = checkpoint_path(path)
+    try:
+        with open(ckpt) as f:
+            header = f.readline()
+            if header != f"#inode {os.stat(path).st_ino}\n":
+                return None
+            done, offset = set(), 0
+            for line in f:
+                if not line.endswith("\n"):
+                    break   # torn final record
+                end, _, qids = line.rstrip("\n").partition("\t")
+                offset = int(end)
+                done.update(qids.split())
+    except (OSError, ValueError):
+        return None
+    if offset > os.path.getsize(path):
+        return None
+    return done, offset
+
+
+def load_done_qids(path: Path, repair: bool = True) -> set[str]:
+    """
+    qids with a complete row in `path`. With repair=True (the writer's view),
+    a torn final line is truncated and the sidecar brought up to date.
+    """
+    if not path.exists():
+        return set()
+
+    state = _read_checkpoint(path)
+    if state is None:
+        done, offset = set(), 0
+        rewrite = True
+    else:
+        done, offset = state
+        rewrite = False
+
+    tail, end = _scan(path, offset)
+    done.update(tail)
+
+    if repair:
+        if end < os.path.getsize(path):
+            print(f"  Truncating torn final line in {path.name} at byte {end:,}")
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        if rewrite:
+            with open(checkpoint_path(path), "w") as f:
+                f.write(f"#inode {os.stat(path).st_ino}\n")
+                if done:
+                    f.write(f"{end}\t{' '.join(sorted(done))}\n")
+        elif tail:
+            _append_record(path, end, tail)
+    return done
+
+
+def _append_record(path: Path, offset: int, qids: list[str]):
+    fd = os.open(checkpoint_path(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, f"{offset}\t{' '.join(qids)}\n".encode())
+    finally:
+        os.close(fd)
+
+
+class PredictionLog:
+    """
+    Appends batches of prediction rows to `path` and records each flushed batch
+    in the checkpoint sidecar. Call load_done_qids(path) before opening so the
+    file ends on a complete line and the sidecar matches it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._f = open(self.path, "ab")
+        if self._f.tell() == 0 or not checkpoint_path(self.path).exists():
+            with open(checkpoint_path(self.path), "w") as f:
+                f.write(f"#inode {os.fstat(self._f.fileno()).st_ino}\n")
+
+    def append(self, rows: list[dict]):
+        if not rows:
+            return
+        self.append_lines("".join(json.dumps(row) + "\n" for row in rows).encode(),
+                          [row["qid"] for row in rows])
+
+    def append_lines(self, data: bytes, qids: list[str]):
+        """Append already-serialized rows (complete lines) and record their qids."""
+        if not qids:
+            return
+        self._f.write(data)
+        self._f.flush()
+        _append_record(self.path, self._f.tell(), qids)
+
+    def fsync(self):
+        os.fsync(self._f.fileno())
+
+    def sync(self):
+        """Rows are already in the file after every append (see SegmentLog.sync)."""
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,77 @@
+"""
+src/inference/prefetch.py
+
+Bounded background image prefetch for the inference loop.
+
+ImagePrefetcher reads and decodes the next `depth` images, in the order the
+loop will consume them, on a small thread pool while the current batch runs
+on the model. JPEG decoding in PIL releases the GIL, so threads overlap file /
+zip I/O and decode with torch compute without extra processes.
+
+Every item is yielded as (image_id, image, error): a loader exception is
+returned with its image_id rather than raised, so the loop can count the
+image as missing and carry on.
+
+Usage:
+    with ImagePrefetcher(image_ids, read_image, depth=8, workers=2) as images:
+        for image_id, image, err in images:
+            ...
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+
+class ImagePrefetcher:
+    def __init__(self, image_ids: Iterable[str], load_fn: Callable, depth: int = 8,
+                 workers: int = 2):
+        if depth < 1:
+            raise ValueError("prefetch depth must be ≥ 1")
+        self._ids     = iter(image_ids)
+        self._load_fn = load_fn
+        self._depth   = depth
+        self._pending = deque()   # (image_id, Future), in consumption order
+        self._pool    = ThreadPoolExecutor(max_workers=max(1, workers),
+                                           thread_name_prefix="prefetch")
+        self._closed  = False
+
+    def _fill(self):
+        while len(self._pending) < self._depth:
+            image_id = next(self._ids, None)
+            if image_id is None:
+                return
+            self._pending.append((image_id, self._pool.submit(self._load_fn, image_id)))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        self._fill()
+        if not self._pending:
+            raise StopIteration
+        image_id, future = self._pending.popleft()
+        self._fill()   # keep the queue full while the caller waits / computes
+        try:
+            return image_id, future.result(), None
+        except Exception as e:
+            return image_id, None, e
+
+    def close(self):
+        """Cancel queued loads and wait for in-flight ones to finish."""
+        if self._closed:
+            return
+        self._closed = True
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,89 @@
+"""
+src/inference/routing.py
+
+Question-type routing policies (run_inference.py --route).
+
+A routed run answers each question with one model only, chosen from the
+question's GQA types and program depth. A policy is a JSON object of rules,
+tried in order, and a default:
+
+  {
+    "default": "blip",
+    "rules": [
+      {"structural": "logical", "min_depth": 6, "model": "vilt"},
+      {"structural": ["verify", "compare"], "semantic": ["global", "attr"], "model": "vilt"}
+    ]
+  }
+
+A rule matches when every condition it names holds: "structural" and
+"semantic" take a type or a list of types, "min_depth" / "max_depth" bound
+program_depth (inclusive). The first matching rule's model answers; the
+default answers questions no rule matches.
+
+DEFAULT_POLICY follows docs/milestone1_findings.md: ViLT, several times
+cheaper on CPU, takes the closed yes/no types (verify, logical, compare),
+where it trails BLIP by at most ~5pp, leads on logical depth 7 and ties on
+compare; BLIP keeps choose (its largest leads, up to +11pp) and the
+open-ended query questions.
+"""
+
+import json
+from pathlib import Path
+
+MODELS = ("blip", "vilt")
+CONDITIONS = ("structural", "semantic", "min_depth", "max_depth")
+
+DEFAULT_POLICY = {
+    "default": "blip",
+    "rules": [
+        {"structural": ["verify", "logical", "compare"], "model": "vilt"},
+    ],
+}
+
+
+def load_policy(spec: str | Path | None) -> dict:
+    """DEFAULT_POLICY for None / "default", else the policy in JSON file spec.
+    Raises ValueError on an unknown model or condition."""
+    if spec is None or str(spec) == "default":
+        policy = DEFAULT_POLICY
+    else:
+        policy = json.loads(Path(spec).read_text())
+    if policy.get("default") not in MODELS:
+        raise ValueError(f"routing policy default must be one of {MODELS}")
+    for rule in policy.get("rules", []):
+        if rule.get("model") not in MODELS:
+            raise ValueError(f"routing rule {rule} has no model in {MODELS}")
+        unknown = set(rule) - set(CONDITIONS) - {"model"}
+        if unknown:
+            raise ValueError(f"routing rule {rule} has unknown conditions {sorted(unknown)}")
+    return policy
+
+
+def _matches(rule: dict, structural: str, semantic: str, depth: int) -> bool:
+    for key, value in (("structural", structural), ("semantic", semantic)):
+        allowed = rule.get(key)
+        if allowed is not None and value not in ([allowed] if isinstance(allowed, str) else allowed):
+            return False
+    if "min_depth" in rule and depth < rule["min_depth"]:
+        return False
+    if "max_depth" in rule and depth > rule["max_depth"]:
+        return False
+    return True
+
+
+def route(policy: dict, structural: str, semantic: str, depth: int) -> str:
+    """The model that answers a question of these types and program depth."""
+    for rule in policy.get("rules", []):
+        if _matches(rule, structural, semantic, depth):
+            return rule["model"]
+    return policy["default"]
+
+
+def describe(policy: dict) -> str:
+    """One line per rule, then the default."""
+    lines = []
+    for rule in policy.get("rules", []):
+        conds = ", ".join(f"{k}={rule[k]}" for k in CONDITIONS if k in rule)
+        lines.append(f"  {conds or 'any'} → {rule['model']}")
+    lines.append(f"  otherwise → {policy['default']}")
+    return "\n".join(lines)
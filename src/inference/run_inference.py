@@ -5,31 +5,128 @@ src/inference/run_inference.py
 Full inference run of BLIP and ViLT on GQA balanced validation split.
 
 Features:
-  - Resumable: skips already-processed questions on restart
-  - Writes predictions incrementally to JSONL (safe against interruption)
-  - Reads images from data/images/ (extracted) or data/images.zip (fallback)
+  - Resumable: skips already-processed questions on restart, reading the
+    done set from a compact checkpoint sidecar (prediction_log.py)
+  - Writes predictions incrementally to JSONL (safe against interruption):
+    rows are serialized and written on a background thread into segment files
+    that are fsync'd, renamed into place and folded into the JSONL every
+    --commit-interval seconds (segment_log.py); resume only trusts committed
+    segments, so preemption never leaves a torn row
+  - Reads images from data/images/ (extracted) or data/images.zip (fallback);
+    the zip is read through a cached offset index and a memory map
   - Sorts questions by imageId → each image loaded once (cache-friendly)
+  - Decoded images, processor outputs and BLIP image embeddings are kept in
+    an in-memory LRU cache under a byte budget (--cache-mb, memory_cache.py),
+    so orders other than imageId (length-sorted batches, estimate rounds)
+    still reuse them; hit rates are reported in the summary
+  - Batched: consecutive questions (within and across images) are padded
+    into one processor/model call per batch (--batch-size), or length-sorted
+    into batches under a padded-token budget (--token-budget, length_batcher.py)
+  - BLIP's ViT image encoder runs once per image; its embedding is reused
+    for every question on that image (--no-embed-reuse to disable)
+  - Preprocessed pixel tensors are cached per imageId on disk (pixel_cache.py);
+    images whose tensors are cached for every model are never decoded
+  - Per-stage timings (image fetch, processor, transfer, forward, decode,
+    write) per batch plus periodic throughput reports in a metrics file
+  - --blip-scoring answers closed questions (verify / logical: yes|no,
+    choose: its two options) by BLIP decoder likelihood instead of generation
+  - Sharded: --num-shards N --shard-index K processes a deterministic,
+    disjoint subset of imageIds into its own shard file; --launch N starts
+    N shard workers locally and merges their outputs when they finish
+  - --quantize int8 applies dynamic int8 quantization to both models' Linear
+    layers for CPU runs; each row records its "precision" (fp32 / int8), and
+    --stratified-sample N restricts a run to N questions per 5×5 cell for
+    comparison against fp32 (src/analysis/compare_quantization.py)
+  - Models load from local bundles (prepare_bundle.py) when present: no hub
+    lookups, weights memory-mapped and shared by all shard workers
+  - --backend onnx runs both models in ONNX Runtime on CPU (graphs exported
+    by export_onnx.py, see onnx_backend.py); rows have the same schema
+  - --estimate W: quick estimate on an adaptive sample stratified by cell and
+    program depth, grown until every cell's BLIP − ViLT gap CI is ≤ W wide
+    (estimate.py); per-cell accuracies and gap with 95% intervals
+  - Identical questions on the same image (same normalized text and model
+    setup) run once; the answer is fanned out to every such qid, whose row
+    names the answered one in "dedup_of" (--no-dedup to disable)
+  - --vilt-topk K stores ViLT's top-K label ids and logits per question in a
+    compact binary sidecar (topk_store.py), so restricted / thresholded ViLT
+    answers can be re-derived without re-running it (src/analysis/vilt_topk.py)
+  - --parallel-models runs BLIP and ViLT at the same time in two worker
+    processes with separate thread budgets; images are decoded once into a
+    shared-memory ring both read without copying (parallel_models.py), and a
+    joiner thread merges their answers into the usual one row per qid
+  - Per-model resume: --backfill MODEL runs only that model on questions
+    whose rows lack its answer, into a part file of its own, then merges its
+    columns into the predictions file (backfill.py); --backfill-as NAME adds
+    them as NAME_* columns instead, e.g. an int8 variant next to fp32
+  - Batch size, thread counts and backend default to this host's autotune
+    profile (autotune.py, results/autotune/<host>.json) when one exists;
+    explicit flags win, --no-profile ignores it
+  - Answers are kept in a persistent content-addressed cache shared by all
+    runs (answer_cache.py), keyed on model revision, image content hash and
+    question text: questions answered before by every model of the run are
+    written from it without reading their image, and only the missing model
+    runs on a partial hit; images are hashed and looked up a window of 256 at a
+    time, just ahead of the models; rows list the models whose answer (and
+    recorded time) came from the cache in "cached" (--no-answer-cache to
+    disable)
+  - --route [POLICY] answers each question with only one model, picked by a
+    policy over its structural / semantic type and program depth
+    (routing.py); rows name it in "route", and src/analysis/analyze_routing.py
+    compares the routed system's accuracy and compute against both models
   - Saves per-question metadata needed for all downstream analyses
 
 Usage:
   python run_inference.py                 # full run, both models
   python run_inference.py --dry-run 200   # test on first 200 questions
+  python run_inference.py --estimate 0.1  # quick per-cell estimate, gap CI ≤ 0.1 wide
   python run_inference.py --skip-blip     # ViLT only
   python run_inference.py --skip-vilt     # BLIP only
+  python run_inference.py --batch-size 16 # 16 questions per forward/generate
+  python run_inference.py --token-budget 1024 --batch-window 16   # dynamic batches
+  python run_inference.py --num-shards 8 --shard-index 3   # one shard worker
+  python run_inference.py --launch 8      # 8 local shard workers + merge
+  python run_inference.py --merge-shards 8                 # merge only
+  python run_inference.py --order archive # read images.zip sequentially
+  python run_inference.py --pixel-cache fill              # create + fill pixel cache
+  python run_inference.py --blip-scoring  # score closed-answer candidates with BLIP
+  python run_inference.py --stratified-sample 500 --quantize int8   # int8 sample run
+  python run_inference.py --backend onnx --ort-intra-threads 8      # ONNX Runtime
+  python run_inference.py --vilt-topk 10  # also keep ViLT's top-10 answers + logits
+  python run_inference.py --parallel-models --model-threads 12,4 --batch-size 16
+  python run_inference.py --backfill blip # add BLIP answers to a --skip-blip run
+  python run_inference.py --route         # one model per question, default policy
+  python run_inference.py --route my_policy.json
+  python run_inference.py --backfill blip --backfill-as blip_int8 --quantize int8
 
 Output:
   results/predictions/all_predictions.jsonl   — one JSON object per line
+  results/predictions/all_predictions.shard-K.jsonl — per-shard output (sharded runs)
+  results/predictions/all_predictions.int8.jsonl — --quantize int8 runs
+  results/predictions/all_predictions.routed.jsonl — --route runs
+  results/predictions/all_predictions.estimate.jsonl / .csv — --estimate rows + estimates
+  results/predictions/all_predictions.metrics.jsonl — per-batch stage timings + reports
+  results/predictions/all_predictions.vilt_topk.{json,bin,qids} — --vilt-topk store
+  results/predictions/all_predictions.backfill-NAME.jsonl — --backfill part file
+  results/cache/answers.sqlite — answer cache shared by all runs
 """
 
 import argparse
 import io
 import json
+import multiprocessing
 import os
+import queue
 import re
+import subprocess
+import sys
+import threading
 import time
-import zipfile
+import zlib
+from itertools import groupby
 from pathlib import Path
+from types import SimpleNamespace
 
+import numpy as np
 import torch
 from PIL import Image
 from tqdm import tqdm
@@ -40,12 +137,46 @@ from transformers import (
     ViltProcessor,
 )
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+from closed_answers import closed_candidates
+from gqa_questions import load_questions
+from image_archive import ImageArchive
+from answer_cache import AnswerCache, model_version
+from backfill import backfill_done_qids, backfill_path, merge_columns
+from estimate import AdaptiveEstimate, format_estimates, write_estimates
+from length_batcher import LengthBatcher
+from memory_cache import ByteLRU
+from model_bundle import is_bundle, load_bundle
+from parallel_models import ImageRing
+from pixel_cache import PixelCache
+from prediction_log import PredictionLog, checkpoint_path, load_done_qids
+from prefetch import ImagePrefetcher
+from segment_log import SegmentLog, recover_segments
+from stage_metrics import MetricsWriter, StageTimer, format_report
+from tuning_profile import load_profile, profile_defaults, profile_path
+from routing import describe, load_policy, route
+from topk_store import TopkWriter, merge_stores, topk_base
+
 # ── Paths ──────────────────────────────────────────────────────────────────────
 PROJECT_ROOT     = Path(__file__).resolve().parent.parent.parent
 QUESTIONS_PATH   = PROJECT_ROOT / "data" / "questions1.2" / "val_balanced_questions.json"
 IMAGES_DIR       = PROJECT_ROOT / "data" / "images"       # extracted directory (preferred)
 IMAGES_ZIP       = PROJECT_ROOT / "data" / "images.zip"   # fallback
 PREDICTIONS_FILE = PROJECT_ROOT / "results" / "predictions" / "all_predictions.jsonl"
+PIXEL_CACHE_DIR  = PROJECT_ROOT / "results" / "cache" / "pixels"
+ANSWER_CACHE     = PROJECT_ROOT / "results" / "cache" / "answers.sqlite"
+ONNX_DIR         = PROJECT_ROOT / "models" / "onnx"          # export_onnx.py output
+BUNDLE_DIR       = PROJECT_ROOT / "models" / "bundles"       # prepare_bundle.py output
+AUTOTUNE_DIR     = PROJECT_ROOT / "results" / "autotune"     # autotune.py profiles
+
+# Question fields kept in memory (the rest of each question is dropped while
+# streaming the file; see src/common/gqa_questions.py)
+QUESTION_FIELDS = ("imageId", "question", "answer", "types.structural", "types.semantic",
+                   "program_depth")
+
+# ── Models ─────────────────────────────────────────────────────────────────────
+BLIP_MODEL_ID = "Salesforce/blip-vqa-base"
+VILT_MODEL_ID = "dandelin/vilt-b32-finetuned-vqa"
 
 # ── Answer normalization ───────────────────────────────────────────────────────
 _NUM_MAP = {
@@ -60,211 +191,1718 @@ def normalize(s: str) -> str:
     s = re.sub(r"^(a |an |the )", "", s)
     return s
 
-# ── Image loading (with single-image cache keyed on imageId) ──────────────────
-_zip_handle: zipfile.ZipFile | None = None
-_zip_names: set[str] | None = None
-_cache_id: str | None = None
-_cache_img: Image.Image | None = None
-
+# ── Image loading (with an in-memory LRU cache keyed on imageId) ─────────────
+_archive: ImageArchive | None = None
+_archive_lock = threading.Lock()
 
-def _open_zip() -> zipfile.ZipFile:
-    global _zip_handle, _zip_names
-    if _zip_handle is None:
-        _zip_handle = zipfile.ZipFile(IMAGES_ZIP)
-        _zip_names = set(_zip_handle.namelist())
-    return _zip_handle
+# Decoded images ("image"), processor outputs ("blip" / "vilt") and BLIP image
+# embeddings ("blip.embed"), keyed (kind, imageId); main() sets the budget.
+_memory = ByteLRU(1024 * 2**20)
 
 
-def load_image(image_id: str) -> Image.Image | None:
-    """Return PIL image for image_id, using a one-slot cache (effective when
-    questions are sorted by imageId)."""
-    global _cache_id, _cache_img
-
-    if image_id == _cache_id:
-        return _cache_img
+def _open_zip() -> ImageArchive:
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = ImageArchive(IMAGES_ZIP)
+    return _archive
 
-    img = None
 
+def read_image_bytes(image_id: str) -> bytes | None:
+    """Encoded bytes of one image, or None if it is in neither the extracted
+    directory nor the zip. Safe to call from prefetch threads."""
     # 1. Try extracted directory
     path = IMAGES_DIR / f"{image_id}.jpg"
     if path.exists():
-        img = Image.open(path).convert("RGB")
+        return path.read_bytes()
 
     # 2. Fall back to zip
-    elif IMAGES_ZIP.exists():
-        zf = _open_zip()
-        key = f"images/{image_id}.jpg"
-        if key in _zip_names:
-            with zf.open(key) as fh:
-                img = Image.open(io.BytesIO(fh.read())).convert("RGB")
-
-    _cache_id, _cache_img = image_id, img
+    if IMAGES_ZIP.exists():
+        return _open_zip().read(image_id)
+    return None
+
+
+def read_image(image_id: str) -> Image.Image | None:
+    """Read and decode one image, or None if it is in neither the extracted
+    directory nor the zip. Uncached and safe to call from prefetch threads."""
+    buf = read_image_bytes(image_id)
+    return None if buf is None else Image.open(io.BytesIO(buf)).convert("RGB")
+
+
+def image_stamp(image_id: str) -> str | None:
+    """Size and mtime of the file an image is read from (its own file, or
+    images.zip), for memoizing its content digest; None if it has none."""
+    path = IMAGES_DIR / f"{image_id}.jpg"
+    if not path.exists():
+        path = IMAGES_ZIP if IMAGES_ZIP.exists() else None
+    if path is None:
+        return None
+    st = path.stat()
+    return f"{path.name}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def load_image(image_id: str) -> Image.Image | None:
+    """Return PIL image for image_id through the in-memory LRU cache (safe to
+    call from prefetch threads)."""
+    img = _memory.get(("image", image_id))
+    if img is None:
+        img = read_image(image_id)
+        _memory.put(("image", image_id), img)
     return img
 
 
+# Stand-in for an image whose processor outputs are all in the pixel cache:
+# it is never opened, and the model calls read its tensors from the cache.
+PIXELS_CACHED = object()
+
+
+def iter_images(todo: list, prefetch: int, workers: int, is_cached=lambda image_id: False):
+    """
+    Yield (qid, q, image, error) for every question in todo order. With
+    prefetch > 0, images are decoded `prefetch` images ahead on `workers`
+    threads; otherwise they are loaded synchronously. Both go through
+    load_image's LRU cache. Each run of consecutive questions on one image is
+    fetched once; images for which is_cached(image_id) holds are yielded as
+    PIXELS_CACHED unread.
+    """
+    def fetch(image_id):
+        return PIXELS_CACHED if is_cached(image_id) else load_image(image_id)
+
+    if prefetch <= 0:
+        for qid, q in todo:
+            try:
+                image_id = q["imageId"]
+                yield qid, q, fetch(image_id), None
+            except Exception as e:
+                yield qid, q, None, e
+        return
+
+    image_ids = [image_id for image_id, _ in groupby(q["imageId"] for _, q in todo)]
+    with ImagePrefetcher(image_ids, fetch, depth=prefetch, workers=workers) as images:
+        current_id = image = err = None
+        for qid, q in todo:
+            if q["imageId"] != current_id:
+                current_id, image, err = next(images)
+            yield qid, q, image, err
+
+
 # ── Helpers ────────────────────────────────────────────────────────────────────
 def program_depth(q: dict) -> int:
+    if "program_depth" in q:
+        return q["program_depth"]
     return len(q.get("semantic", []))
 
 
-def load_done_qids(path: Path) -> set[str]:
-    done = set()
-    if path.exists():
-        with open(path) as f:
-            for line in f:
-                line = line.strip()
-                if line:
+# ── Dynamic batching cost (--token-budget) ────────────────────────────────────
+# Expected BLIP answer length in tokens for generated answers; GQA answers are
+# mostly one word, open queries occasionally two ("coffee table").
+ANSWER_TOKENS = {"query": 2}
+
+
+def add_token_costs(todo: list, tokenizer, with_answers: bool):
+    """
+    Store each question's batching cost in q["n_tokens"]: its tokenized
+    length, plus — when BLIP runs — the expected answer length (longest
+    candidate when scoring, else ANSWER_TOKENS by structural type).
+    """
+    questions = [q["question"] for _, q in todo]
+    lengths = [len(ids) for ids in tokenizer(questions)["input_ids"]]
+    for (_, q), n in zip(todo, lengths):
+        if with_answers:
+            if q.get("candidates"):
+                n += max(len(tokenizer.tokenize(c)) for c in q["candidates"]) + 1
+            else:
+                n += ANSWER_TOKENS.get(q["types"]["structural"], 1) + 1   # + [SEP]
+        q["n_tokens"] = n
+
+
+# ── Sharding ───────────────────────────────────────────────────────────────────
+def shard_of(image_id: str, num_shards: int) -> int:
+    """Deterministic shard for an imageId (crc32 is stable across processes,
+    unlike hash()). All questions on an image land in the same shard."""
+    return zlib.crc32(image_id.encode()) % num_shards
+
+
+def shard_path(path: Path, shard_index: int) -> Path:
+    """all_predictions.jsonl → all_predictions.shard-K.jsonl"""
+    return path.with_name(f"{path.stem}.shard-{shard_index}{path.suffix}")
+
+
+def merge_shards(path: Path, num_shards: int) -> int:
+    """
+    Merge the shard files for `path` into `path` itself, keeping the first row
+    seen for each qid (rows already in `path` win). The merged file is written
+    to a temporary file and renamed into place; shard files are left on disk.
+    Returns the number of rows in the merged file.
+    """
+    sources = [path] + [shard_path(path, k) for k in range(num_shards)]
+    seen = set()
+    n_dup = 0
+    tmp = path.with_name(path.name + ".merging")
+    with open(tmp, "w") as out_f:
+        for src in sources:
+            if not src.exists():
+                if src != path:
+                    print(f"  Warning: missing shard file {src.name}")
+                continue
+            with open(src) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
                     try:
-                        done.add(json.loads(line)["qid"])
+                        qid = json.loads(line)["qid"]
                     except (json.JSONDecodeError, KeyError):
-                        pass
-    return done
+                        continue
+                    if qid in seen:
+                        n_dup += 1
+                        continue
+                    seen.add(qid)
+                    out_f.write(line + "\n")
+    os.replace(tmp, path)
+    checkpoint_path(path).unlink(missing_ok=True)   # rebuilt on next resume
+    print(f"Merged {len(seen):,} rows into {path.name} ({n_dup:,} duplicates dropped)")
+    n_topk = merge_stores(topk_base(path), [topk_base(shard_path(path, k)) for k in range(num_shards)])
+    if n_topk:
+        print(f"Merged {n_topk:,} ViLT top-k records into {topk_base(path).name}")
+    return len(seen)
+
+
+def finish_backfill(path: Path, model: str, name: str):
+    """Merge a backfill run's part file (and ViLT top-k store) into path."""
+    updated, added = merge_columns(path, model, name)
+    print(f"Merged {name} columns into {path.name}: {updated:,} rows updated, {added:,} added")
+    n_topk = merge_stores(topk_base(path), [topk_base(backfill_path(path, name))])
+    if n_topk:
+        print(f"Merged {n_topk:,} ViLT top-k records into {topk_base(path).name}")
+
+
+def launch_shards(num_shards: int, argv: list[str], path: Path) -> None:
+    """
+    Start one worker process per shard with the remaining command-line options,
+    splitting the CPU cores evenly between them, then merge their outputs.
+    """
+    threads = max(1, (os.cpu_count() or 1) // num_shards)
+    procs = []
+    for k in range(num_shards):
+        cmd = [sys.executable, str(Path(__file__).resolve()), *argv,
+               "--num-shards", str(num_shards), "--shard-index", str(k),
+               "--num-threads", str(threads)]
+        env = {**os.environ, "OMP_NUM_THREADS": str(threads), "MKL_NUM_THREADS": str(threads)}
+        print(f"Launching shard {k}/{num_shards} ({threads} threads)")
+        procs.append(subprocess.Popen(cmd, env=env))
+
+    failed = [k for k, p in enumerate(procs) if p.wait() != 0]
+    if failed:
+        print(f"Shards {failed} exited with errors — not merging. Re-run to resume them.")
+        sys.exit(1)
+    merge_shards(path, num_shards)
+
+
+def load_pretrained(name: str, model_id: str, model_cls, proc_cls, bundle_dir: Path | None,
+                    with_model: bool = True):
+    """
+    (processor, model) from the local bundle under bundle_dir/name when one
+    was prepared from model_id (weights memory-mapped, no hub lookups), else
+    from_pretrained. model is None when with_model is False.
+    """
+    path = bundle_dir / name if bundle_dir is not None else None
+    if path is not None and is_bundle(path, model_id):
+        print(f"  from bundle {path}")
+        if not with_model:
+            return proc_cls.from_pretrained(path, local_files_only=True), None
+        return load_bundle(path, model_cls, proc_cls)
+    proc = proc_cls.from_pretrained(model_id)
+    return proc, (model_cls.from_pretrained(model_id).eval() if with_model else None)
+
+
+def load_models(run_blip: bool, run_vilt: bool, device: str, backend: str = "torch",
+                ort_threads: tuple[int, int] = (0, 0), bundle_dir: Path | None = BUNDLE_DIR):
+    """
+    Return (blip, vilt), each a (processor, model) pair or None if skipped.
+    With backend "onnx" the models are onnx_backend wrappers over the graphs
+    in ONNX_DIR (ort_threads = intra-op, inter-op threads).
+    """
+    if backend == "onnx":
+        from onnx_backend import OnnxBlip, OnnxVilt   # onnxruntime is only needed here
+
+    blip = vilt = None
+    if run_blip:
+        print(f"\nLoading BLIP ({BLIP_MODEL_ID}, {backend})...")
+        blip_proc, blip_model = load_pretrained("blip", BLIP_MODEL_ID, BlipForQuestionAnswering,
+                                                BlipProcessor, bundle_dir,
+                                                with_model=backend != "onnx")
+        if backend == "onnx":
+            blip_model = OnnxBlip(ONNX_DIR, *ort_threads)
+        else:
+            blip_model = blip_model.to(device)
+        blip = (blip_proc, blip_model)
+
+    if run_vilt:
+        print(f"Loading ViLT ({VILT_MODEL_ID}, {backend})...")
+        vilt_proc, vilt_model = load_pretrained("vilt", VILT_MODEL_ID, ViltForQuestionAnswering,
+                                                ViltProcessor, bundle_dir)
+        vilt_model = vilt_model.to(device)
+        if backend == "onnx":
+            vilt_model = OnnxVilt(ONNX_DIR, vilt_model, *ort_threads)
+        vilt = (vilt_proc, vilt_model)
+    return blip, vilt
+
+
+def quantize_int8(model_pair):
+    """Dynamic int8 quantization of every nn.Linear (weights int8, activations
+    quantized per batch at run time) — CPU only."""
+    proc, model = model_pair
+    return proc, torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def stratified_sample(data: dict, per_cell: int) -> dict:
+    """
+    Up to per_cell questions from every (structural, semantic) cell. Questions
+    are taken in crc32(qid) order, so the sample is deterministic and a run
+    with the same N (fp32 or int8) always covers the same questions.
+    """
+    cells = {}
+    for qid, q in data.items():
+        cells.setdefault((q["types"]["structural"], q["types"]["semantic"]), []).append(qid)
+    keep = set()
+    for qids in cells.values():
+        qids.sort(key=lambda qid: zlib.crc32(qid.encode()))
+        keep.update(qids[:per_cell])
+    return {qid: q for qid, q in data.items() if qid in keep}
+
+
+# ── Batched model calls ────────────────────────────────────────────────────────
+# Per-stage timer for the current run; main() attaches a MetricsWriter.
+_timer = StageTimer()
+
+
+def estimate_path(path: Path) -> Path:
+    """all_predictions.estimate.jsonl → all_predictions.estimate.csv"""
+    return path.with_suffix(".csv")
+
+
+def metrics_path(path: Path) -> Path:
+    """all_predictions.jsonl → all_predictions.metrics.jsonl"""
+    return path.with_name(f"{path.stem}.metrics{path.suffix}")
+
+
+# ── Per-image processor outputs ────────────────────────────────────────────────
+# Pixel caches by model name ("blip" / "vilt"); empty when caching is off.
+_pixel_caches: dict[str, PixelCache] = {}
+
+
+def image_inputs(name: str, proc, image_id: str, image) -> dict[str, torch.Tensor]:
+    """Image-processor outputs for one image, without the batch dimension,
+    served from the in-memory LRU or the model's pixel cache when present and
+    added to them otherwise."""
+    feats = _memory.get((name, image_id))
+    if feats is not None:
+        return feats
+    cache = _pixel_caches.get(name)
+    if cache is not None:
+        feats = cache.get(image_id)
+    if feats is None:
+        feats = {k: v[0] for k, v in proc.image_processor(image, return_tensors="pt").items()}
+        if cache is not None:
+            cache.put(image_id, feats)
+    _memory.put((name, image_id), feats)
+    return feats
+
+
+def pad_vilt_pixels(feats: list[dict]) -> dict[str, torch.Tensor]:
+    """Stack per-image ViLT pixel_values / pixel_mask, zero-padding bottom and
+    right to the largest image — what ViltImageProcessor does for a batch."""
+    height = max(f["pixel_values"].shape[-2] for f in feats)
+    width  = max(f["pixel_values"].shape[-1] for f in feats)
+    pixel_values = torch.zeros(len(feats), feats[0]["pixel_values"].shape[0], height, width,
+                               dtype=feats[0]["pixel_values"].dtype)
+    pixel_mask = torch.zeros(len(feats), height, width, dtype=torch.long)
+    for i, f in enumerate(feats):
+        h, w = f["pixel_values"].shape[-2:]
+        pixel_values[i, :, :h, :w] = f["pixel_values"]
+        pixel_mask[i, :h, :w] = f["pixel_mask"]
+    return {"pixel_values": pixel_values, "pixel_mask": pixel_mask}
+
+
+def is_onnx(model) -> bool:
+    """True for onnx_backend models (--backend onnx), False for PyTorch modules."""
+    return not isinstance(model, torch.nn.Module)
+
+
+def blip_encode_images(model, pixel_values):
+    """Run BLIP's ViT image encoder; returns image_embeds (n_images, n_patches+1, dim)."""
+    if is_onnx(model):
+        return model.encode_images(pixel_values)
+    return model.vision_model(pixel_values=pixel_values)[0]
+
+
+def blip_encode_questions(model, image_embeds, input_ids, attention_mask):
+    """BLIP's question encoder, cross-attending to image_embeds (one row per question)."""
+    if is_onnx(model):
+        return model.encode_questions(image_embeds, input_ids, attention_mask)
+    image_attention_mask = torch.ones(image_embeds.size()[:-1], dtype=torch.long,
+                                      device=image_embeds.device)
+    return model.text_encoder(
+        input_ids=input_ids,
+        attention_mask=attention_mask,
+        encoder_hidden_states=image_embeds,
+        encoder_attention_mask=image_attention_mask,
+        return_dict=False,
+    )[0]
+
+
+def _by_question_length(attention_mask):
+    """
+    Yield (question length, row indices) groups. The stock generate lets the
+    decoder cross-attend over every question position, padding included (it
+    passes an all-ones mask, and some transformers versions drop the
+    cross-attention mask altogether), so the decoder is run once per distinct
+    question length on unpadded question embeddings; each answer then matches
+    the unbatched one. Assumes right padding (the BLIP tokenizer default).
+    """
+    lengths = attention_mask.sum(dim=1)
+    for length in lengths.unique().tolist():
+        yield length, (lengths == length).nonzero(as_tuple=True)[0]
+
+
+def blip_decode(model, question_embeds, attention_mask) -> list[list[int]]:
+    """BLIP's autoregressive answer decoder on encoded questions."""
+    outputs = [None] * len(question_embeds)
+    for length, idx in _by_question_length(attention_mask):
+        embeds = question_embeds[idx, :length]
+        if is_onnx(model):
+            for i, seq in zip(idx.tolist(), model.generate(embeds)):
+                outputs[i] = seq
+            continue
+        bos_ids = torch.full((len(idx), 1), fill_value=model.decoder_start_token_id,
+                             device=embeds.device)
+        out = model.text_decoder.generate(
+            input_ids=bos_ids,
+            eos_token_id=model.config.text_config.sep_token_id,
+            pad_token_id=model.config.text_config.pad_token_id,
+            encoder_hidden_states=embeds,
+            encoder_attention_mask=torch.ones(embeds.size()[:-1], dtype=torch.long,
+                                              device=embeds.device),
+        )
+        for i, seq in zip(idx.tolist(), out.tolist()):
+            outputs[i] = seq
+    return outputs
+
+
+def blip_score(model, tokenizer, question_embeds, attention_mask,
+               candidates: list[list[str]]) -> list[str]:
+    """
+    Pick each question's answer from its candidate list by decoder likelihood:
+    every (question, candidate) pair is teacher-forced through the decoder in
+    one forward pass per question length, and the candidate with the highest
+    summed log-probability — answer tokens plus the closing [SEP], so a
+    candidate is also scored on ending there — wins.
+    """
+    rows  = [i for i, cands in enumerate(candidates) for _ in cands]
+    texts = [c for cands in candidates for c in cands]
+    cand = tokenizer(texts, padding=True, return_tensors="pt").to(question_embeds.device)
+    input_ids = cand["input_ids"].clone()
+    input_ids[:, 0] = model.decoder_start_token_id       # [CLS] → [DEC], as in BLIP training
+    rows_t = torch.tensor(rows, device=question_embeds.device)
+
+    scores = torch.empty(len(rows), device=question_embeds.device)
+    for length, idx in _by_question_length(attention_mask):
+        pair_idx = (rows_t.unsqueeze(1) == idx.unsqueeze(0)).any(dim=1).nonzero(as_tuple=True)[0]
+        embeds = question_embeds[rows_t[pair_idx], :length]
+        if is_onnx(model):
+            logits = model.decoder_logits(input_ids[pair_idx], cand["attention_mask"][pair_idx],
+                                          embeds)
+        else:
+            logits = model.text_decoder(
+                input_ids=input_ids[pair_idx],
+                attention_mask=cand["attention_mask"][pair_idx],
+                encoder_hidden_states=embeds,
+                encoder_attention_mask=torch.ones(embeds.size()[:-1], dtype=torch.long,
+                                                  device=embeds.device),
+                return_dict=True,
+            ).logits
+        logp = torch.log_softmax(logits[:, :-1].float(), dim=-1)
+        target = input_ids[pair_idx, 1:]
+        token_logp = logp.gather(-1, target.unsqueeze(-1)).squeeze(-1)
+        scores[pair_idx] = (token_logp * cand["attention_mask"][pair_idx, 1:]).sum(dim=1)
+
+    answers, start = [], 0
+    for cands in candidates:
+        best = int(scores[start : start + len(cands)].argmax())
+        answers.append(cands[best])
+        start += len(cands)
+    return answers
+
+
+def blip_generate_from_embeds(model, image_embeds, input_ids, attention_mask) -> list[list[int]]:
+    """
+    The text half of BlipForQuestionAnswering.generate: question encoder
+    (cross-attending to precomputed image_embeds, one row per question) and
+    answer decoder, safe for padded question batches.
+    """
+    question_embeds = blip_encode_questions(model, image_embeds, input_ids, attention_mask)
+    return blip_decode(model, question_embeds, attention_mask)
+
+
+def blip_generate(model, pixel_values, input_ids, attention_mask) -> list[list[int]]:
+    """BlipForQuestionAnswering.generate, made safe for padded batches."""
+    image_embeds = blip_encode_images(model, pixel_values)
+    return blip_generate_from_embeds(model, image_embeds, input_ids, attention_mask)
+
+
+def blip_answer_batch(blip, image_ids: list[str], images: list, questions: list[str],
+                      device: str, candidates: list | None = None) -> list[str]:
+    """
+    Answer a batch with the vision tower run once per distinct image: each
+    image is encoded once and its embedding shared by all of its questions
+    (and kept in the LRU cache for later batches on the same image), then the
+    text encoder runs on the padded question batch. Questions with a
+    candidate list are answered by blip_score, the rest by generation.
+    """
+    proc, model = blip
+
+    embeds = {}
+    first = {}
+    for image_id, image in zip(image_ids, images):
+        if image_id in embeds or image_id in first:
+            continue
+        cached = _memory.get(("blip.embed", image_id))
+        if cached is not None:
+            embeds[image_id] = cached
+        else:
+            first[image_id] = image
+    with _timer.stage("blip.processor"):
+        pixel_values = None
+        if first:
+            pixel_values = torch.stack([image_inputs("blip", proc, image_id, image)["pixel_values"]
+                                        for image_id, image in first.items()])
+        text = proc.tokenizer(questions, padding=True, return_tensors="pt")
+    with _timer.stage("blip.transfer"):
+        text = text.to(device)
+        if pixel_values is not None:
+            pixel_values = pixel_values.to(device)
+    with _timer.stage("blip.forward"):
+        if pixel_values is not None:
+            encoded = blip_encode_images(model, pixel_values)
+            for i, image_id in enumerate(first):
+                embeds[image_id] = encoded[i : i + 1]
+                _memory.put(("blip.embed", image_id), embeds[image_id])
+        image_embeds = torch.cat([embeds[image_id] for image_id in image_ids])
+        mask = text["attention_mask"]
+        question_embeds = blip_encode_questions(model, image_embeds, text["input_ids"], mask)
+
+        candidates = candidates or [None] * len(questions)
+        closed = [i for i, c in enumerate(candidates) if c]
+        open_ = [i for i, c in enumerate(candidates) if not c]
+        answers = [None] * len(questions)
+        if closed:
+            scored = blip_score(model, proc.tokenizer, question_embeds[closed], mask[closed],
+                                [candidates[i] for i in closed])
+            for i, answer in zip(closed, scored):
+                answers[i] = answer
+        if open_:
+            out = blip_decode(model, question_embeds[open_], mask[open_])
+
+    if open_:
+        with _timer.stage("blip.decode"):
+            for i, answer in zip(open_, proc.batch_decode(out, skip_special_tokens=True)):
+                answers[i] = answer
+    return answers
+
+
+def blip_answer_batch_uncached(blip, image_ids: list[str], images: list, questions: list[str],
+                               device: str, candidates: list | None = None) -> list[str]:
+    """Reference path: full processor call, vision encode and generation for
+    every question (candidates are ignored)."""
+    proc, model = blip
+    with _timer.stage("blip.processor"):
+        inputs = proc(images=images, text=questions, padding=True, return_tensors="pt")
+    with _timer.stage("blip.transfer"):
+        inputs = inputs.to(device)
+    with _timer.stage("blip.forward"):
+        out = blip_generate(model, inputs["pixel_values"], inputs["input_ids"], inputs["attention_mask"])
+    with _timer.stage("blip.decode"):
+        return proc.batch_decode(out, skip_special_tokens=True)
+
+
+def blip_method(answer_fn, candidates) -> str:
+    """How answer_fn answers a question with these candidates: blip_answer_batch
+    scores them, the --no-embed-reuse reference path always generates."""
+    return "score" if candidates and answer_fn is blip_answer_batch else "generate"
+
+
+# --vilt-topk: store writer, and the top-k (label ids, logits) of the questions
+# answered since process_batch last cleared it, keyed on (imageId, question) —
+# identical inputs give identical logits, and keys survive run_batched's
+# per-question fallback. Duplicates get their record through dedup_of
+# (topk_records).
+_vilt_topk: TopkWriter | None = None
+_vilt_topk_out: dict[tuple[str, str], tuple] = {}
+
+# --answer-cache: persistent answers by content (answer_cache.py); None if off.
+_answer_cache: AnswerCache | None = None
+
+# Serializes writes to the prediction log, top-k store and metrics: under
+# --parallel-models the main thread writes answer-cache rows while the joiner
+# thread writes the workers' rows, and neither log nor MetricsWriter is
+# thread-safe.
+_write_lock = threading.Lock()
+
+
+def vilt_logits(vilt, image_ids: list[str], images: list, questions: list[str],
+                device: str) -> torch.Tensor:
+    """One padded forward pass for a batch; images are padded as the processor would.
+    Returns the answer logits, (batch, n_labels)."""
+    proc, model = vilt
+    with _timer.stage("vilt.processor"):
+        feats = {}
+        for image_id, image in zip(image_ids, images):
+            if image_id not in feats:
+                feats[image_id] = image_inputs("vilt", proc, image_id, image)
+        pixels = pad_vilt_pixels([feats[image_id] for image_id in image_ids])
+        inputs = proc.tokenizer(questions, padding=True, return_tensors="pt")
+        inputs.update(pixels)
+    with _timer.stage("vilt.transfer"):
+        inputs = inputs.to(device)
+    with _timer.stage("vilt.forward"):
+        return model(**inputs).logits
+
+
+def vilt_answer_batch(vilt, image_ids: list[str], images: list, questions: list[str],
+                      device: str, candidates: list | None = None) -> list[str]:
+    """ViLT's top answer label per question (candidates are ignored)."""
+    model = vilt[1]
+    logits = vilt_logits(vilt, image_ids, images, questions, device)
+    with _timer.stage("vilt.decode"):
+        if _vilt_topk is not None:
+            top = logits.float().topk(_vilt_topk.k, dim=-1)
+            ids, values = top.indices.cpu().numpy(), top.values.cpu().numpy()
+            for i, key in enumerate(zip(image_ids, questions)):
+                _vilt_topk_out[key] = (ids[i], values[i])
+        return [model.config.id2label[i] for i in logits.argmax(-1).tolist()]
+
+
+def run_batched(answer_fn, model, image_ids: list[str], images: list, questions: list[str],
+                device: str, candidates: list | None = None):
+    """
+    Run answer_fn on the whole batch. If the batched call raises, retry each
+    question on its own so a single bad input only costs its own answer ("").
+    Returns (answers, per-question seconds, n_errors); the time is the batch
+    wall time divided evenly across its questions.
+    """
+    t0 = time.perf_counter()
+    n_errors = 0
+    try:
+        answers = answer_fn(model, image_ids, images, questions, device, candidates)
+    except Exception:
+        answers = []
+        candidates = candidates or [None] * len(questions)
+        for image_id, image, question, cands in zip(image_ids, images, questions, candidates):
+            try:
+                answers.append(answer_fn(model, [image_id], [image], [question], device, [cands])[0])
+            except Exception:
+                answers.append("")
+                n_errors += 1
+    per_q = round((time.perf_counter() - t0) / len(questions), 4)
+    return answers, per_q, n_errors
+
+
+def make_row(qid: str, q: dict, blip_answer, vilt_answer, blip_time, vilt_time,
+             blip_method: str | None = None, precision: str = "fp32",
+             dedup_of: str | None = None) -> dict:
+    gt_answer = q["answer"]
+    blip_correct = (
+        normalize(blip_answer) == normalize(gt_answer)
+        if blip_answer is not None else None
+    )
+    vilt_correct = (
+        normalize(vilt_answer) == normalize(gt_answer)
+        if vilt_answer is not None else None
+    )
+    row = {
+        "qid":           qid,
+        "imageId":       q["imageId"],
+        "question":      q["question"],
+        "gt_answer":     gt_answer,
+        "structural":    q["types"]["structural"],
+        "semantic":      q["types"]["semantic"],
+        "program_depth": program_depth(q),
+        "blip_answer":   blip_answer,
+        "vilt_answer":   vilt_answer,
+        "blip_correct":  blip_correct,
+        "vilt_correct":  vilt_correct,
+        "blip_time":     blip_time,
+        "vilt_time":     vilt_time,
+        "blip_method":   blip_method,
+        "precision":     precision,
+        "dedup_of":      dedup_of,
+    }
+    if "route" in q:
+        row["route"] = q["route"]
+    cached = q.get("cache", {}).get("hits")
+    if cached:
+        row["cached"] = sorted(cached)   # models answered from the answer cache
+    return row
+
+
+def routed_to(q: dict, name: str) -> bool:
+    """True unless a --route policy sent q to the other model."""
+    return q.get("route", name) == name
+
+
+def process_batch(batch: list, blip, vilt, device: str, log: PredictionLog,
+                  blip_answer_fn=blip_answer_batch, precision: str = "fp32") -> int:
+    """
+    Run both models on a batch of (qid, question, image) triples and append one
+    JSONL row per question, plus one per duplicate of it (see dedup_todo) with
+    the same answers and timings. Rows are written (and checkpointed) only
+    after the whole batch has finished, so an interrupted batch is simply
+    redone on resume. Returns the number of inference errors.
+    """
+    n_errors  = 0
+    blip_answers = blip_times = blip_methods = [None] * len(batch)
+    if blip is not None:
+        candidates = [q.get("candidates") for _, q, _ in batch]
+        blip_answers, blip_times, n = run_uncached("blip", blip_answer_fn, blip, batch, device,
+                                                   candidates)
+        blip_methods = [None if a is None else blip_method(blip_answer_fn, c)
+                        for a, c in zip(blip_answers, candidates)]
+        n_errors += n
+
+    vilt_answers = vilt_times = [None] * len(batch)
+    _vilt_topk_out.clear()
+    if vilt is not None:
+        vilt_answers, vilt_times, n = run_uncached("vilt", vilt_answer_batch, vilt, batch, device)
+        n_errors += n
+
+    with _timer.stage("write"):
+        rows = batch_rows(batch, blip_answers, vilt_answers, blip_times, vilt_times, blip_methods,
+                          precision)
+        write_topk(rows, _vilt_topk_out)   # a redone batch re-appends (see topk_store.py)
+        log.append(rows)
+    _timer.end_batch(len(rows), len({q["imageId"] for _, q, _ in batch}))
+    return n_errors
+
+
+def uncached(name: str, batch: list) -> list[int]:
+    """Indices of the questions of batch that `name` must answer: routed to it
+    (all, without --route) and with no cached answer (see answer_from_cache)."""
+    return [i for i, (_, q, *_) in enumerate(batch)
+            if routed_to(q, name) and name not in q.get("cache", {}).get("hits", {})]
+
+
+def run_uncached(name: str, answer_fn, model, batch: list, device: str,
+                 candidates: list | None = None):
+    """
+    run_batched on the questions of batch `name` must answer (see uncached);
+    cached ones keep their answer, questions routed elsewhere get None. Fresh
+    answers are added to the answer cache. Returns (answers, per-question
+    seconds, n_errors).
+    """
+    answers = [None] * len(batch)
+    times   = [None] * len(batch)
+    for i, (_, q, _) in enumerate(batch):
+        hit = q.get("cache", {}).get("hits", {}).get(name)
+        if hit is not None and routed_to(q, name):
+            answers[i], times[i] = hit
+    todo = uncached(name, batch)
+    if not todo:
+        return answers, times, 0
+    sub = [batch[i] for i in todo]
+    out, per_q, n_errors = run_batched(answer_fn, model, [q["imageId"] for _, q, _ in sub],
+                                       [image for _, _, image in sub],
+                                       [q["question"] for _, q, _ in sub], device,
+                                       [candidates[i] for i in todo] if candidates else None)
+    for i, answer in zip(todo, out):
+        answers[i], times[i] = answer, per_q
+    fill_cache(name, sub, out, [per_q] * len(sub))
+    return answers, times, n_errors
+
+
+def batch_rows(batch: list, blip_answers: list, vilt_answers: list, blip_times: list,
+               vilt_times: list, blip_methods: list, precision: str) -> list[dict]:
+    """One row per question of the batch, plus one per duplicate of it (see
+    dedup_todo) with the same answers and timings."""
+    rows = []
+    for (qid, q, *_), blip_answer, vilt_answer, blip_time, vilt_time, blip_method in zip(
+            batch, blip_answers, vilt_answers, blip_times, vilt_times, blip_methods):
+        rows.append(make_row(qid, q, blip_answer, vilt_answer, blip_time, vilt_time,
+                             blip_method, precision))
+        for dup_qid, dup_q in q.get("duplicates", ()):
+            rows.append(make_row(dup_qid, dup_q, blip_answer, vilt_answer, blip_time,
+                                 vilt_time, blip_method, precision, dedup_of=qid))
+    return rows
+
+
+def topk_records(rows: list[dict], topk_out: dict) -> list[tuple[str, tuple]]:
+    """
+    (qid, top-k record) for every row with one: answered rows look theirs up
+    by (imageId, question) in topk_out; dedup fan-out copies, whose text may
+    differ in case or whitespace, take the record of the row they copy.
+    """
+    answered = {row["qid"]: topk_out[(row["imageId"], row["question"])] for row in rows
+                if row["dedup_of"] is None and (row["imageId"], row["question"]) in topk_out}
+    return [(row["qid"], answered[row["dedup_of"] or row["qid"]]) for row in rows
+            if (row["dedup_of"] or row["qid"]) in answered]
+
+
+def write_topk(rows: list[dict], topk_out: dict):
+    """Store the ViLT top-k of every row that has one (see topk_records)."""
+    if _vilt_topk is None:
+        return
+    topk = topk_records(rows, topk_out)
+    if topk:
+        _vilt_topk.append([qid for qid, _ in topk], np.stack([t[0] for _, t in topk]),
+                          np.stack([t[1] for _, t in topk]))
+
+
+# ── Deduplication ─────────────────────────────────────────────────────────────
+def model_revision(args, precision: str) -> str:
+    """Everything besides the image and question text that decides an answer."""
+    return "|".join([BLIP_MODEL_ID, VILT_MODEL_ID, args.backend, precision,
+                     "score" if args.blip_scoring else "generate"])
+
+
+def dedup_key(q: dict, revision: str) -> tuple:
+    """
+    Questions with equal keys give both models identical input. Text is only
+    lowercased and whitespace-collapsed — both tokenizers are uncased, so that
+    changes no token; closed-answer candidates are part of the input, and so
+    is the --route model, which the question's types decide.
+    """
+    text = " ".join(q["question"].lower().split())
+    return q["imageId"], text, tuple(q.get("candidates") or ()), q.get("route"), revision
+
+
+def dedup_todo(todo: list, revision: str) -> tuple[list, int]:
+    """
+    Keep the first of each group of identical (qid, question) pairs and attach
+    the rest to it as q["duplicates"], for process_batch to fan its answers
+    out to. Returns (deduplicated todo, number of duplicates removed).
+    """
+    first = {}
+    out = []
+    for qid, q in todo:
+        key = dedup_key(q, revision)
+        if key in first:
+            first[key].setdefault("duplicates", []).append((qid, q))
+        else:
+            q.pop("duplicates", None)
+            first[key] = q
+            out.append((qid, q))
+    return out, len(todo) - len(out)
+
+
+def fan_out_count(todo: list) -> int:
+    return sum(len(q.get("duplicates", ())) for _, q in todo)
+
+
+# ── Answer cache (--answer-cache) ─────────────────────────────────────────────
+# Images per answer-cache window: infer hashes and looks up one window of the
+# todo list at a time, just before running it, so the first batch does not
+# wait for every image of the split to be hashed.
+CACHE_WINDOW_IMAGES = 256
+
+
+def image_windows(todo: list, n_images: int):
+    """Consecutive slices of todo holding up to n_images distinct images each."""
+    window, seen = [], set()
+    for qid, q in todo:
+        if q["imageId"] not in seen and len(seen) >= n_images:
+            yield window
+            window, seen = [], set()
+        seen.add(q["imageId"])
+        window.append((qid, q))
+    if window:
+        yield window
+
+
+def answer_from_cache(todo: list, log, precision: str, workers: int, timer: StageTimer,
+                      blip_answer_fn=blip_answer_batch) -> tuple[list, int]:
+    """
+    Look up every question of todo in the answer cache. Questions that every
+    model of the run (their routed model, with --route) has answered before
+    are written straight from it, their images never read; the rest are
+    returned, each with q["cache"] holding its keys and any single-model hits
+    for run_uncached to skip. Cached BLIP answers come from blip_answer_fn's
+    path (its revision names it). Returns (the rest, number of rows written).
+    """
+    cache = _answer_cache
+    with timer.stage("cache.lookup"):
+        stamps = {}
+        for _, q in todo:
+            if q["imageId"] not in stamps:
+                stamps[q["imageId"]] = image_stamp(q["imageId"])
+        digests = cache.image_digests({k: v for k, v in stamps.items() if v is not None},
+                                      read_image_bytes, workers)
+
+        for _, q in todo:
+            q["cache"] = {"keys": {}, "hits": {}}
+            digest = digests.get(q["imageId"])
+            if digest is None:
+                continue   # missing image: counted by infer
+            for name in cache.revisions:
+                cands = q.get("candidates") if name == "blip" else None
+                q["cache"]["keys"][name] = cache.key(name, digest, q["question"], cands)
+        for name in cache.lookup:
+            keyed = [q for _, q in todo if name in q["cache"]["keys"] and routed_to(q, name)]
+            found = cache.get_many(name, [q["cache"]["keys"][name] for q in keyed])
+            for q in keyed:
+                hit = found.get(q["cache"]["keys"][name])
+                if hit is not None:
+                    q["cache"]["hits"][name] = hit
+
+    def needed(q):
+        return [name for name in cache.revisions if routed_to(q, name)]
+
+    done = [(qid, q, None) for qid, q in todo
+            if needed(q) and all(name in q["cache"]["hits"] for name in needed(q))]
+    if not done:
+        with _write_lock:
+            timer.end_batch(0, 0)   # the window's lookup time
+        return todo, 0
+    with _write_lock:
+        with timer.stage("write"):
+            def column(name, i):
+                return [q["cache"]["hits"][name][i] if name in needed(q) else None
+                        for _, q, _ in done]
+            methods = [blip_method(blip_answer_fn, q.get("candidates")) if "blip" in needed(q)
+                       else None for _, q, _ in done]
+            rows = batch_rows(done, column("blip", 0), column("vilt", 0), column("blip", 1),
+                              column("vilt", 1), methods, precision)
+            log.append(rows)
+        timer.end_batch(len(rows), len({q["imageId"] for _, q, _ in done}))
+    served = {qid for qid, _, _ in done}
+    return [(qid, q) for qid, q in todo if qid not in served], len(rows)
+
+
+def fill_cache(name: str, batch: list, answers: list, times: list):
+    """Add the fresh `name` answers of batch's questions to the answer cache
+    (failed questions, answered "", are left out)."""
+    if _answer_cache is None:
+        return
+    entries = []
+    for (_, q, *_), answer, seconds in zip(batch, answers, times):
+        key = q.get("cache", {}).get("keys", {}).get(name)
+        if key is not None and answer and name not in q["cache"]["hits"]:
+            entries.append((key, answer, seconds))
+    _answer_cache.put_many(name, entries)
+
+
+# ── Parallel models (--parallel-models) ───────────────────────────────────────
+# Module settings a worker process must share with its parent (they may have
+# been changed after import, e.g. by a wrapper script).
+WORKER_SETTINGS = ("BLIP_MODEL_ID", "VILT_MODEL_ID", "ONNX_DIR", "BUNDLE_DIR", "PIXEL_CACHE_DIR")
+
+
+def split_threads(spec: str) -> dict[str, int]:
+    """--model-threads "B,V" → {"blip": B, "vilt": V}; "auto" gives BLIP four
+    of every five cores, matching its ~4× longer per-question time."""
+    if spec != "auto":
+        blip, vilt = (int(x) for x in spec.split(","))
+        return {"blip": blip, "vilt": vilt}
+    cores = os.cpu_count() or 1
+    blip = max(1, round(cores * 0.8))
+    return {"blip": blip, "vilt": max(1, cores - blip)}
+
+
+def model_worker(name: str, settings: dict, opts: dict, ring_spec: tuple, tasks, results):
+    """
+    Entry point of one --parallel-models worker process: load one model, then
+    answer batches from `tasks` until None, reading images from the shared
+    ring, and put (batch id, answers, per-question time, errors, stage times,
+    ViLT top-k) on `results`.
+    """
+    global _vilt_topk
+    globals().update(settings)
+    try:
+        if opts["threads"] > 0:
+            torch.set_num_threads(opts["threads"])
+        _memory.max_bytes = opts["cache_mb"] * 2**20
+        device = pick_device(opts["quantize"], opts["backend"])
+        blip, vilt = load_models(name == "blip", name == "vilt", device, opts["backend"],
+                                 opts["ort_threads"], opts["bundle_dir"])
+        pair = blip or vilt
+        if opts["quantize"] == "int8":
+            pair = quantize_int8(pair)
+        if opts["pixel_cache"]:
+            model_id = BLIP_MODEL_ID if name == "blip" else VILT_MODEL_ID
+            _pixel_caches[name] = PixelCache(PIXEL_CACHE_DIR, model_id, pair[0].image_processor)
+        if name == "blip":
+            answer_fn = blip_answer_batch_uncached if opts["no_embed_reuse"] else blip_answer_batch
+        else:
+            answer_fn = vilt_answer_batch
+            if opts["vilt_topk"] > 0:
+                _vilt_topk = SimpleNamespace(k=opts["vilt_topk"])   # collect only; parent writes
+        ring = ImageRing.attach(*ring_spec)
+    except Exception as e:
+        results.put(("failed", name, repr(e)))
+        return
+    id2label = dict(pair[1].config.id2label) if name == "vilt" else None
+    results.put(("ready", name, id2label))
+
+    def image(spec):
+        if spec[0] == "slot":
+            return ring.view(spec[1], spec[2])
+        return spec[1] if spec[0] == "inline" else PIXELS_CACHED
+
+    with torch.no_grad():
+        while (task := tasks.get()) is not None:
+            batch_id, image_ids, specs, questions, candidates = task
+            images = [image(specs[image_id]) for image_id in image_ids]
+            _vilt_topk_out.clear()
+            answers, per_q, n_errors = run_batched(answer_fn, pair, image_ids, images, questions,
+                                                   device, candidates)
+            topk = ([_vilt_topk_out.get(key) for key in zip(image_ids, questions)]
+                    if _vilt_topk is not None else None)
+            del images
+            results.put(("done", name, (batch_id, answers, per_q, n_errors, _timer.take(), topk)))
+    ring.close()
+
+
+class ParallelModels:
+    """
+    Parent side of --parallel-models: starts one worker process per model,
+    copies each batch's decoded images into the shared ring once, sends each
+    worker the questions of the batch it has no cached answer for (see
+    uncached), and joins their answers with the cached ones into rows on a
+    joiner thread.
+    submit(batch) is process_batch's drop-in for infer(); drain() waits for
+    every submitted batch and returns the number of inference errors.
+    """
+
+    def __init__(self, args, precision: str, log, threads: dict[str, int]):
+        self.precision = precision
+        self.log       = log
+        self.blip_fn   = blip_answer_batch_uncached if args.no_embed_reuse else blip_answer_batch
+        self.ring      = ImageRing(args.ring_slots, args.ring_slot_mb * 2**20)
+        self.timer     = StageTimer(_timer.writer)   # joiner thread's own timer
+        self.pending: dict[int, dict] = {}
+        self.next_id   = 0
+        self.n_errors  = 0
+        self.error: str | None = None
+        self.id2label  = None
+        self._cond     = threading.Condition()
+
+        ctx = multiprocessing.get_context("spawn")
+        settings = {k: globals()[k] for k in WORKER_SETTINGS}
+        self.results = ctx.Queue()
+        self.workers = {}
+        for name in ("blip", "vilt"):
+            opts = {
+                "threads":        threads[name],
+                "cache_mb":       args.cache_mb,
+                "quantize":       args.quantize,
+                "backend":        args.backend,
+                "ort_threads":    (args.ort_intra_threads, args.ort_inter_threads),
+                "bundle_dir":     None if args.no_bundle else BUNDLE_DIR,
+                "pixel_cache":    name in _pixel_caches,
+                "no_embed_reuse": args.no_embed_reuse,
+                "vilt_topk":      args.vilt_topk,
+            }
+            tasks = ctx.Queue()
+            proc = ctx.Process(target=model_worker, name=f"{name}-worker", daemon=True,
+                               args=(name, settings, opts,
+                                     (self.ring.name, self.ring.n_slots, self.ring.slot_bytes),
+                                     tasks, self.results))
+            proc.start()
+            self.workers[name] = (proc, tasks)
+            print(f"Started {name} worker (pid {proc.pid}, {threads[name]} threads)")
+
+        ready = set()
+        while len(ready) < len(self.workers):
+            try:
+                kind, name, payload = self.results.get(timeout=5.0)
+            except queue.Empty:
+                if self._dead():
+                    self.close()
+                    raise RuntimeError(f"model worker(s) {self._dead()} exited during startup")
+                continue
+            if kind == "failed":
+                self.close()
+                raise RuntimeError(f"{name} worker failed to load: {payload}")
+            ready.add(name)
+            if name == "vilt":
+                self.id2label = payload
+        self._joiner = threading.Thread(target=self._join, name="joiner", daemon=True)
+        self._joiner.start()
+
+    def _dead(self) -> list[str]:
+        return [name for name, (proc, _) in self.workers.items() if not proc.is_alive()]
+
+    def submit(self, batch: list) -> int:
+        if self.error:
+            raise RuntimeError(self.error)
+        distinct = {}
+        for _, q, image in batch:
+            distinct.setdefault(q["imageId"], image)
+        arrays = {image_id: np.asarray(image) for image_id, image in distinct.items()
+                  if image is not PIXELS_CACHED}
+        fitting = [image_id for image_id, a in arrays.items() if self.ring.fits(a)]
+        slots = self.ring.acquire(len(fitting), abort=lambda: self.error is not None)
+        specs = {image_id: ("cached",) for image_id, image in distinct.items()
+                 if image is PIXELS_CACHED}
+        for image_id, slot in zip(fitting, slots):
+            specs[image_id] = ("slot", slot, self.ring.put(slot, arrays[image_id]))
+        for image_id, a in arrays.items():
+            specs.setdefault(image_id, ("inline", a))   # larger than a slot
+
+        batch_id, self.next_id = self.next_id, self.next_id + 1
+        todo = {name: uncached(name, batch) for name in self.workers}
+        with self._cond:
+            self.pending[batch_id] = {
+                "batch":   [(qid, q) for qid, q, _ in batch],
+                "todo":    todo,
+                "slots":   slots,
+                # a model with every answer cached gets no task (answer_from_cache
+                # has already written the questions neither model needs)
+                "results": {name: (batch_id, [], None, 0, {}, None)
+                            for name, idx in todo.items() if not idx},
+                "stages":  _timer.take(),   # producer side: image fetch
+            }
+        for name, idx in todo.items():
+            if not idx:
+                continue
+            sub = [batch[i][1] for i in idx]
+            candidates = [q.get("candidates") for q in sub] if name == "blip" else None
+            self.workers[name][1].put((batch_id, [q["imageId"] for q in sub], specs,
+                                       [q["question"] for q in sub], candidates))
+        return 0
+
+    def _join(self):
+        while True:
+            try:
+                kind, name, payload = self.results.get(timeout=1.0)
+            except queue.Empty:
+                if self._dead() and self.pending:
+                    self._fail(f"model worker(s) {self._dead()} exited")
+                    return
+                continue
+            if kind == "stop":
+                return
+            if kind == "failed":
+                self._fail(f"{name} worker failed: {payload}")
+                return
+            batch_id = payload[0]
+            with self._cond:
+                entry = self.pending[batch_id]
+                entry["results"][name] = payload
+                if len(entry["results"]) < len(self.workers):
+                    continue
+            try:
+                self._finish(entry)
+            except Exception as e:
+                self._fail(f"joining batch {batch_id} failed: {e!r}")
+                return
+            self.ring.release(entry["slots"])
+            with self._cond:
+                del self.pending[batch_id]
+                self._cond.notify_all()
+
+    def _answers(self, entry: dict, name: str) -> tuple[list, list]:
+        """Per question of the batch, `name`'s answer and seconds: cached hits
+        as they are, the worker's answers for the rest."""
+        _, out, per_q, *_ = entry["results"][name]
+        answers, times = [], []
+        for _, q in entry["batch"]:
+            answer, seconds = q.get("cache", {}).get("hits", {}).get(name, (None, None))
+            answers.append(answer)
+            times.append(seconds)
+        for i, answer in zip(entry["todo"][name], out):
+            answers[i], times[i] = answer, per_q
+        return answers, times
+
+    def _finish(self, entry: dict):
+        """Merge both workers' answers with the cached ones into rows and write them."""
+        *_, blip_errors, blip_stages, _ = entry["results"]["blip"]
+        *_, vilt_errors, vilt_stages, topk = entry["results"]["vilt"]
+        batch = entry["batch"]
+        with self.timer.stage("write"):
+            blip_answers, blip_times = self._answers(entry, "blip")
+            vilt_answers, vilt_times = self._answers(entry, "vilt")
+            methods = [None if a is None else blip_method(self.blip_fn, q.get("candidates"))
+                       for a, (_, q) in zip(blip_answers, batch)]
+            rows = batch_rows(batch, blip_answers, vilt_answers, blip_times, vilt_times, methods,
+                              self.precision)
+            fill_cache("blip", batch, blip_answers, blip_times)
+            fill_cache("vilt", batch, vilt_answers, vilt_times)
+            with _write_lock:
+                if topk is not None:
+                    sub = [batch[i][1] for i in entry["todo"]["vilt"]]
+                    write_topk(rows, {(q["imageId"], q["question"]): t
+                                      for q, t in zip(sub, topk) if t is not None})
+                self.log.append(rows)
+        stages = dict(entry["stages"])
+        for k, v in {**blip_stages, **vilt_stages}.items():
+            stages[k] = stages.get(k, 0.0) + v
+        with _write_lock:
+            self.timer.end_batch(len(rows), len({q["imageId"] for _, q in batch}), stages)
+        self.n_errors += blip_errors + vilt_errors
+
+    def _fail(self, message: str):
+        with self._cond:
+            self.error = message
+            self._cond.notify_all()
+
+    def drain(self) -> int:
+        """Wait for every submitted batch; returns (and resets) the error count."""
+        with self._cond:
+            while self.pending and not self.error:
+                self._cond.wait(timeout=1.0)
+        if self.error:
+            raise RuntimeError(self.error)
+        n, self.n_errors = self.n_errors, 0
+        return n
+
+    def close(self):
+        for proc, tasks in self.workers.values():
+            if proc.is_alive():
+                tasks.put(None)
+        for proc, _ in self.workers.values():
+            proc.join(timeout=30)
+            if proc.is_alive():
+                proc.terminate()
+        if getattr(self, "_joiner", None) is not None and self._joiner.is_alive():
+            self.results.put(("stop", None, None))
+            self._joiner.join()
+        self.ring.close()
 
 
 # ── Main ───────────────────────────────────────────────────────────────────────
+def pick_device(quantize: str = "none", backend: str = "torch") -> str:
+    """cuda, then mps, then cpu; int8 and ONNX Runtime always run on CPU."""
+    if torch.cuda.is_available():
+        device = "cuda"
+    elif torch.backends.mps.is_available():
+        device = "mps"
+    else:
+        device = "cpu"
+    if (quantize == "int8" or backend == "onnx") and device != "cpu":
+        print(f"--quantize int8 / --backend onnx run on CPU only — ignoring {device}")
+        device = "cpu"
+    return device
+
+
+def order_todo(todo: list, order: str) -> list:
+    """Sort (qid, question) pairs by imageId (each image read once), or by the
+    image's offset in images.zip for --order archive."""
+    todo.sort(key=lambda x: x[1]["imageId"])
+    if order == "archive":
+        if IMAGES_DIR.exists() or not IMAGES_ZIP.exists():
+            print("--order archive: images are not read from images.zip — keeping imageId order")
+        else:
+            archive = _open_zip()
+            todo.sort(key=lambda x: archive.offset(x[1]["imageId"]))   # stable: ties keep imageId order
+    return todo
+
+
+def infer(todo: list, blip, vilt, device: str, log: PredictionLog, args, blip_answer_fn,
+          precision: str, is_cached, batcher: LengthBatcher | None,
+          parallel: ParallelModels | None = None) -> tuple[int, int]:
+    """
+    Stream the todo list's images, batch its questions and write their rows —
+    in this process, or through the model worker processes of `parallel`.
+    Returns (n_missing, n_errors).
+    """
+    n_missing = n_errors = n_served = 0
+    batch_size = args.batch_size or 1
+    cache_timer = StageTimer(_timer.writer)   # cached rows are their own batches
+
+    def run(batch):
+        if parallel is not None:
+            return parallel.submit(batch)
+        return process_batch(batch, blip, vilt, device, log, blip_answer_fn, precision)
+
+    batch = []
+    last_failed = None
+    progress = tqdm(total=len(todo), desc="Inference", unit="q", dynamic_ncols=True)
+    windows = [todo] if _answer_cache is None else image_windows(todo, CACHE_WINDOW_IMAGES)
+    for window in windows:
+        if _answer_cache is not None:
+            rest, n = answer_from_cache(window, log, precision, args.prefetch_workers,
+                                        cache_timer, blip_answer_fn)
+            progress.update(len(window) - len(rest))
+            n_served += n
+            window = rest
+        if batcher is not None:
+            add_token_costs(window, (blip or vilt)[0].tokenizer, with_answers=blip is not None)
+
+        stream = _timer.timed_iter(
+            iter_images(window, args.prefetch, args.prefetch_workers, is_cached), "image_fetch")
+        for qid, q, image, err in stream:
+            progress.update()
+            if err is not None and q["imageId"] != last_failed:
+                last_failed = q["imageId"]
+                tqdm.write(f"  Failed to load image {q['imageId']}: {err}")
+            if image is None:
+                n_missing += 1 + len(q.get("duplicates", ()))
+                continue
+
+            if batcher is not None:
+                for ready in batcher.add((qid, q, image), q["imageId"]):
+                    n_errors += run(ready)
+                continue
+            batch.append((qid, q, image))
+            if len(batch) >= batch_size:
+                n_errors += run(batch)
+                batch = []
+    progress.close()
+    if n_served:
+        tqdm.write(f"Answer cache: {n_served:,} questions answered from cache")
+
+    if batcher is not None:
+        for ready in batcher.flush():
+            n_errors += run(ready)
+    if batch:
+        n_errors += run(batch)
+    if parallel is not None:
+        n_errors += parallel.drain()
+    return n_missing, n_errors
+
+
 def main():
     parser = argparse.ArgumentParser(description="Run BLIP + ViLT inference on GQA val balanced")
     parser.add_argument("--dry-run", type=int, default=0, metavar="N",
                         help="Process only the first N questions (for testing)")
     parser.add_argument("--skip-blip", action="store_true", help="Skip BLIP inference")
     parser.add_argument("--skip-vilt", action="store_true", help="Skip ViLT inference")
+    parser.add_argument("--batch-size", type=int, default=None, metavar="B",
+                        help="Questions per padded model call (default 1 = unbatched); "
+                             "with --token-budget, an upper bound per batch (default none)")
+    parser.add_argument("--token-budget", type=int, default=0, metavar="T",
+                        help="Dynamic batching: sort questions by token length and cut "
+                             "batches of at most T padded tokens (default 0 = fixed batches)")
+    parser.add_argument("--batch-window", type=int, default=16, metavar="N",
+                        help="With --token-budget: consecutive images whose questions are "
+                             "length-sorted together (default 16)")
+    parser.add_argument("--no-embed-reuse", action="store_true",
+                        help="Re-run BLIP's vision encoder for every question (reference path)")
+    parser.add_argument("--num-shards", type=int, default=1, metavar="N",
+                        help="Split images into N deterministic shards")
+    parser.add_argument("--shard-index", type=int, default=0, metavar="K",
+                        help="Shard processed by this worker (0 ≤ K < N)")
+    parser.add_argument("--launch", type=int, default=0, metavar="N",
+                        help="Start N local shard workers, wait, then merge their outputs")
+    parser.add_argument("--merge-shards", type=int, default=0, metavar="N",
+                        help="Only merge N shard files into the predictions file")
+    parser.add_argument("--num-threads", type=int, default=0, metavar="T",
+                        help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--interop-threads", type=int, default=0, metavar="T",
+                        help="torch inter-op threads (default: torch's choice)")
+    parser.add_argument("--profile", type=Path, default=None, metavar="PATH",
+                        help="autotune.py profile supplying defaults for --batch-size, "
+                             "--num-threads, --interop-threads and --backend "
+                             "(default results/autotune/<host>.json if present)")
+    parser.add_argument("--no-profile", action="store_true",
+                        help="Ignore this host's autotune profile")
+    parser.add_argument("--order", choices=["image", "archive"], default="image",
+                        help="Process questions by imageId (default) or by images.zip offset, "
+                             "so zip reads are sequential")
+    parser.add_argument("--no-bundle", action="store_true",
+                        help="Load models with from_pretrained even if local bundles exist "
+                             "(see prepare_bundle.py)")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch",
+                        help="Run models in PyTorch (default) or ONNX Runtime on CPU "
+                             "(graphs from src/inference/export_onnx.py)")
+    parser.add_argument("--ort-intra-threads", type=int, default=0, metavar="T",
+                        help="--backend onnx: intra-op threads (default: onnxruntime's choice)")
+    parser.add_argument("--ort-inter-threads", type=int, default=0, metavar="T",
+                        help="--backend onnx: inter-op threads (default: onnxruntime's choice)")
+    parser.add_argument("--quantize", choices=["none", "int8"], default="none",
+                        help="int8: dynamic quantization of both models' Linear layers "
+                             "(CPU only; default output all_predictions.int8.jsonl)")
+    parser.add_argument("--stratified-sample", type=int, default=0, metavar="N",
+                        help="Process a deterministic sample of up to N questions per "
+                             "(structural, semantic) cell")
+    parser.add_argument("--estimate", type=float, default=0.0, metavar="W",
+                        help="Quick estimate: sample questions stratified by cell and program "
+                             "depth, adding samples until every cell's 95%% CI on the BLIP − ViLT "
+                             "gap is at most W wide (e.g. 0.1); output all_predictions.estimate.jsonl")
+    parser.add_argument("--estimate-initial", type=int, default=50, metavar="N",
+                        help="--estimate: questions per cell in the first round (default 50)")
+    parser.add_argument("--estimate-max", type=int, default=20000, metavar="N",
+                        help="--estimate: stop after N sampled questions (default 20000)")
+    parser.add_argument("--output", type=Path, default=None, metavar="PATH",
+                        help="Predictions file (default results/predictions/all_predictions.jsonl)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Run every question, even ones identical to another on the same image")
+    parser.add_argument("--route", nargs="?", const="default", default=None, metavar="POLICY",
+                        help="Answer each question with one model chosen by a routing policy "
+                             "over its types and program depth (routing.py; a JSON file, or the "
+                             "built-in default: ViLT for verify / logical / compare, BLIP "
+                             "otherwise); output all_predictions.routed.jsonl")
+    parser.add_argument("--backfill", choices=["blip", "vilt"], default=None,
+                        help="Run only this model, on questions whose rows lack its answer, "
+                             "then merge its columns into the predictions file")
+    parser.add_argument("--backfill-as", default=None, metavar="NAME",
+                        help="--backfill: column prefix to write (default the model name), "
+                             "e.g. blip_int8 to add an int8 BLIP next to the fp32 one")
+    parser.add_argument("--merge-backfill", action="store_true",
+                        help="Only merge the --backfill / --backfill-as part file into the "
+                             "predictions file")
+    parser.add_argument("--parallel-models", action="store_true",
+                        help="Run BLIP and ViLT concurrently in two worker processes fed from a "
+                             "shared-memory image ring")
+    parser.add_argument("--model-threads", default="auto", metavar="B,V",
+                        help="--parallel-models: torch threads for the BLIP and ViLT workers "
+                             "(default auto: 4/5 of the cores to BLIP)")
+    parser.add_argument("--ring-slots", type=int, default=32, metavar="N",
+                        help="--parallel-models: images held in the shared ring (default 32)")
+    parser.add_argument("--ring-slot-mb", type=int, default=8, metavar="MB",
+                        help="--parallel-models: bytes per ring slot; larger images are sent "
+                             "inline (default 8 MB)")
+    parser.add_argument("--blip-scoring", action="store_true",
+                        help="Answer verify/logical/choose questions with BLIP by scoring the "
+                             "candidate answers instead of free generation")
+    parser.add_argument("--vilt-topk", type=int, default=0, metavar="K",
+                        help="Also store ViLT's top-K answer ids and logits per question "
+                             "(all_predictions.vilt_topk.*; see src/analysis/vilt_topk.py)")
+    parser.add_argument("--pixel-cache", choices=["auto", "fill", "off"], default="auto",
+                        help="Per-image preprocessed pixel cache: use (and extend) it if it "
+                             "exists (auto), create it if needed (fill), or ignore it (off)")
+    parser.add_argument("--answer-cache", type=Path, default=None, metavar="PATH",
+                        help="Persistent answer cache keyed on model revision, image content "
+                             "and question (default results/cache/answers.sqlite)")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="Neither read nor fill the answer cache")
+    parser.add_argument("--commit-interval", type=float, default=10.0, metavar="S",
+                        help="Seconds between crash-safe commits of the background prediction "
+                             "writer (default 10; 0 = write each batch synchronously)")
+    parser.add_argument("--metrics-interval", type=float, default=60.0, metavar="S",
+                        help="Seconds between throughput reports in the metrics file (default 60)")
+    parser.add_argument("--cache-mb", type=int, default=1024, metavar="MB",
+                        help="In-memory LRU budget for decoded images, processor outputs and "
+                             "BLIP image embeddings (default 1024; 0 disables)")
+    parser.add_argument("--prefetch", type=int, default=8, metavar="K",
+                        help="Decode up to K images ahead in background threads (0 = synchronous)")
+    parser.add_argument("--prefetch-workers", type=int, default=2, metavar="W",
+                        help="Threads used for image prefetch (default 2)")
+
+    # This host's autotune profile supplies defaults; flags given explicitly win.
+    pre, _ = parser.parse_known_args()
+    if not pre.no_profile:
+        path = pre.profile or profile_path(AUTOTUNE_DIR)
+        profile = load_profile(path)
+        if profile is not None:
+            defaults = profile_defaults(profile,
+                                        run_blip=not pre.skip_blip and pre.backfill != "vilt",
+                                        run_vilt=not pre.skip_vilt and pre.backfill != "blip",
+                                        with_batch_size=pre.token_budget <= 0)
+            parser.set_defaults(**defaults)
+            print(f"Autotune profile {path.name}: "
+                  + ", ".join(f"{k}={v}" for k, v in defaults.items()))
     args = parser.parse_args()
 
+    # A backfill adds columns to the consolidated file, whatever the precision.
+    tags = (([".estimate"] if args.estimate > 0 else [])
+            + ([".routed"] if args.route else [])
+            + ([".int8"] if args.quantize == "int8" and not args.backfill else []))
+    pred_file = args.output or PREDICTIONS_FILE.with_name(
+        f"{PREDICTIONS_FILE.stem}{''.join(tags)}{PREDICTIONS_FILE.suffix}")
+    backfill_name = args.backfill_as or args.backfill
+
+    if args.merge_backfill:
+        if not args.backfill:
+            parser.error("--merge-backfill needs --backfill MODEL (and --backfill-as if used)")
+        finish_backfill(pred_file, args.backfill, backfill_name)
+        return
+
+    if args.merge_shards > 0:
+        merge_shards(pred_file, args.merge_shards)
+        return
+
+    if args.launch > 0:
+        argv, skip = [], False
+        for a in sys.argv[1:]:
+            if skip or a.startswith("--launch="):
+                skip = False
+            elif a == "--launch":
+                skip = True
+            else:
+                argv.append(a)
+        launch_shards(args.launch, argv, pred_file)
+        return
+
+    if not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard-index must be in [0, --num-shards)")
+    if args.backend == "onnx" and args.quantize != "none":
+        parser.error("--quantize applies to the PyTorch backend only")
+    if args.parallel_models and (args.skip_blip or args.skip_vilt):
+        parser.error("--parallel-models runs both models: drop --skip-blip / --skip-vilt")
+    if args.backfill:
+        if args.launch or args.num_shards > 1 or args.estimate > 0 or args.parallel_models:
+            parser.error("--backfill runs one model in one process: drop --launch / "
+                         "--num-shards / --estimate / --parallel-models")
+        if getattr(args, f"skip_{args.backfill}"):
+            parser.error(f"--backfill {args.backfill} runs {args.backfill}: "
+                         f"drop --skip-{args.backfill}")
+        args.skip_blip = args.backfill == "vilt"
+        args.skip_vilt = args.backfill == "blip"
+    if args.route and (args.skip_blip or args.skip_vilt or args.parallel_models
+                       or args.backfill or args.estimate > 0):
+        parser.error("--route picks one model per question: drop --skip-blip / --skip-vilt / "
+                     "--parallel-models / --backfill / --estimate")
+    policy = None
+    if args.route:
+        try:
+            policy = load_policy(args.route)
+        except (OSError, ValueError) as e:
+            parser.error(f"--route: {e}")
+    if args.blip_scoring and args.no_embed_reuse:
+        parser.error("--blip-scoring scores candidates on the embedding-reuse path: "
+                     "drop --no-embed-reuse")
+    if args.vilt_topk > 0 and args.skip_vilt:
+        parser.error("--vilt-topk needs ViLT: drop --skip-vilt")
+    if args.estimate > 0 and (args.launch or args.num_shards > 1 or args.dry_run
+                              or args.stratified_sample):
+        parser.error("--estimate picks its own sample: drop --launch / --num-shards / "
+                     "--dry-run / --stratified-sample")
+
+    if args.interop_threads > 0:
+        torch.set_num_interop_threads(args.interop_threads)
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    _memory.max_bytes = args.cache_mb * 2**20
+
     run_blip = not args.skip_blip
     run_vilt = not args.skip_vilt
 
     # ── Device ────────────────────────────────────────────────────────────────
-    if torch.cuda.is_available():
-        device = "cuda"
-    elif torch.backends.mps.is_available():
-        device = "mps"
-    else:
-        device = "cpu"
-    print(f"Device: {device}")
+    device = pick_device(args.quantize, args.backend)
+    precision = "int8" if args.quantize == "int8" else "fp32"
+    print(f"Device: {device} ({precision})")
 
-    # ── Output directory ──────────────────────────────────────────────────────
-    PREDICTIONS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    # ── Output file ───────────────────────────────────────────────────────────
+    pred_file.parent.mkdir(parents=True, exist_ok=True)
+    sharded  = args.num_shards > 1
+    out_path = shard_path(pred_file, args.shard_index) if sharded else pred_file
+    if sharded:
+        print(f"Shard {args.shard_index}/{args.num_shards} → {out_path.name}")
+    if args.backfill:
+        out_path = backfill_path(pred_file, backfill_name)
+        print(f"Backfill {args.backfill} as {backfill_name}_* → {out_path.name}")
 
     # ── Load questions ─────────────────────────────────────────────────────────
     print("Loading questions...")
-    with open(QUESTIONS_PATH) as f:
-        data = json.load(f)
+    fields = QUESTION_FIELDS + (("semantic",) if args.blip_scoring and run_blip else ())
+    data = load_questions(QUESTIONS_PATH, fields)
+    if "semantic" in fields:
+        for q in data.values():
+            q["candidates"] = closed_candidates(q)
+            del q["semantic"]   # only needed for the choose options
     print(f"Total questions in val_balanced: {len(data):,}")
 
+    if args.stratified_sample > 0:
+        data = stratified_sample(data, args.stratified_sample)
+        print(f"Stratified sample: {len(data):,} questions "
+              f"(≤ {args.stratified_sample} per structural × semantic cell)")
+
+    if sharded:
+        data = {qid: q for qid, q in data.items()
+                if shard_of(q["imageId"], args.num_shards) == args.shard_index}
+        print(f"Questions in this shard: {len(data):,}")
+
+    if policy is not None:
+        for q in data.values():
+            q["route"] = route(policy, q["types"]["structural"], q["types"]["semantic"],
+                               program_depth(q))
+        n_vilt = sum(q["route"] == "vilt" for q in data.values())
+        print(f"Routing policy {args.route}:\n{describe(policy)}")
+        print(f"Routed: {len(data) - n_vilt:,} questions to BLIP, {n_vilt:,} to ViLT")
+
     # ── Resume: find already-processed qids ───────────────────────────────────
-    done_qids = load_done_qids(PREDICTIONS_FILE)
+    # A shard worker also skips rows already merged into the canonical file; a
+    # backfill skips rows that already have its model's answer.
+    n_recovered = recover_segments(out_path)
+    if n_recovered:
+        print(f"Recovered {n_recovered:,} rows from committed segments of an interrupted run")
+    if args.backfill:
+        done_qids = backfill_done_qids(pred_file, backfill_name)
+    else:
+        done_qids = load_done_qids(out_path)
+    if sharded:
+        done_qids |= load_done_qids(pred_file, repair=False)
+    done_qids &= data.keys()
     if done_qids:
         print(f"Resuming — already done: {len(done_qids):,} | remaining: {len(data) - len(done_qids):,}")
 
     # ── Build to-do list, sort by imageId for cache efficiency ────────────────
-    todo = [(qid, q) for qid, q in data.items() if qid not in done_qids]
-    todo.sort(key=lambda x: x[1]["imageId"])
+    # An estimate builds one to-do list per sampling round instead.
+    revision = model_revision(args, precision)
+    estimator = None
+    if args.estimate > 0:
+        estimator = AdaptiveEstimate(data, program_depth, args.estimate, args.estimate_initial,
+                                     max_total=args.estimate_max)
+        print(f"Quick estimate: sampling {len(estimator.orders)} cells until every BLIP − ViLT "
+              f"gap CI is ≤ {args.estimate:.3f} wide (≤ {args.estimate_max:,} questions)")
+    else:
+        todo = order_todo([(qid, q) for qid, q in data.items() if qid not in done_qids],
+                          args.order)
+        if not args.no_dedup:
+            todo, n_dups = dedup_todo(todo, revision)
+            if n_dups:
+                print(f"Deduplicated: {n_dups:,} questions repeat another on the same image "
+                      f"— answered by fan-out")
 
-    if args.dry_run > 0:
-        todo = todo[: args.dry_run]
-        print(f"Dry-run mode: processing {len(todo)} questions")
+        if args.dry_run > 0:
+            todo = todo[: args.dry_run]
+            print(f"Dry-run mode: processing {len(todo)} questions")
 
-    if not todo:
-        print("Nothing to process — all questions already done.")
-        return
+        if not todo:
+            print("Nothing to process — all questions already done.")
+            if args.backfill:
+                finish_backfill(pred_file, args.backfill, backfill_name)
+            return
 
     # ── Load models ────────────────────────────────────────────────────────────
-    if run_blip:
-        print("\nLoading BLIP (Salesforce/blip-vqa-base)...")
-        blip_proc  = BlipProcessor.from_pretrained("Salesforce/blip-vqa-base")
-        blip_model = BlipForQuestionAnswering.from_pretrained(
-            "Salesforce/blip-vqa-base"
-        ).to(device).eval()
-
-    if run_vilt:
-        print("Loading ViLT (dandelin/vilt-b32-finetuned-vqa)...")
-        vilt_proc  = ViltProcessor.from_pretrained("dandelin/vilt-b32-finetuned-vqa")
-        vilt_model = ViltForQuestionAnswering.from_pretrained(
-            "dandelin/vilt-b32-finetuned-vqa"
-        ).to(device).eval()
+    # With --parallel-models this process only needs the processors (token
+    # costs, pixel cache keys); the models load in the worker processes.
+    bundle_dir = None if args.no_bundle else BUNDLE_DIR
+    if args.parallel_models:
+        print("\nLoading processors (models load in the worker processes)...")
+        blip = load_pretrained("blip", BLIP_MODEL_ID, BlipForQuestionAnswering, BlipProcessor,
+                               bundle_dir, with_model=False)
+        vilt = load_pretrained("vilt", VILT_MODEL_ID, ViltForQuestionAnswering, ViltProcessor,
+                               bundle_dir, with_model=False)
+    else:
+        blip, vilt = load_models(run_blip, run_vilt, device, args.backend,
+                                 (args.ort_intra_threads, args.ort_inter_threads), bundle_dir)
+        if args.quantize == "int8":
+            blip = blip and quantize_int8(blip)
+            vilt = vilt and quantize_int8(vilt)
 
     # ── Inference loop ─────────────────────────────────────────────────────────
     n_missing = 0
     n_errors  = 0
+    n_todo    = 0     # questions to run, duplicates excluded
+    n_dedup   = 0     # duplicates answered by fan-out
     t_run_start = time.time()
 
-    with open(PREDICTIONS_FILE, "a", buffering=1) as out_f, torch.no_grad():
-        for qid, q in tqdm(todo, desc="Inference", unit="q", dynamic_ncols=True):
-            image_id      = q["imageId"]
-            question_text = q["question"]
-            gt_answer     = q["answer"]
-            structural    = q["types"]["structural"]
-            semantic      = q["types"]["semantic"]
-            depth         = program_depth(q)
+    blip_answer_fn = blip_answer_batch_uncached if args.no_embed_reuse else blip_answer_batch
 
-            image = load_image(image_id)
-            if image is None:
-                n_missing += 1
-                continue
+    # ── Pixel cache ────────────────────────────────────────────────────────────
+    # The --no-embed-reuse reference path always runs the full processor.
+    if args.pixel_cache == "fill" or (args.pixel_cache == "auto" and PIXEL_CACHE_DIR.exists()):
+        if blip is not None and not args.no_embed_reuse:
+            _pixel_caches["blip"] = PixelCache(PIXEL_CACHE_DIR, BLIP_MODEL_ID, blip[0].image_processor)
+        if vilt is not None:
+            _pixel_caches["vilt"] = PixelCache(PIXEL_CACHE_DIR, VILT_MODEL_ID, vilt[0].image_processor)
+        for name, cache in _pixel_caches.items():
+            print(f"Pixel cache [{name}]: {len(cache):,} images in {cache.dir}")
 
-            # ── BLIP ──────────────────────────────────────────────────────────
-            blip_answer = blip_time = None
-            if run_blip:
-                t0 = time.perf_counter()
-                try:
-                    inputs = blip_proc(image, question_text, return_tensors="pt").to(device)
-                    out = blip_model.generate(**inputs)
-                    blip_answer = blip_proc.decode(out[0], skip_special_tokens=True)
-                    blip_time = round(time.perf_counter() - t0, 4)
-                except Exception as e:
-                    blip_answer = ""
-                    n_errors += 1
-
-            # ── ViLT ──────────────────────────────────────────────────────────
-            vilt_answer = vilt_time = None
-            if run_vilt:
-                t0 = time.perf_counter()
-                try:
-                    inputs = vilt_proc(image, question_text, return_tensors="pt").to(device)
-                    out = vilt_model(**inputs)
-                    pred_id = out.logits.argmax(-1).item()
-                    vilt_answer = vilt_model.config.id2label[pred_id]
-                    vilt_time = round(time.perf_counter() - t0, 4)
-                except Exception as e:
-                    vilt_answer = ""
-                    n_errors += 1
-
-            # ── Correctness ───────────────────────────────────────────────────
-            blip_correct = (
-                normalize(blip_answer) == normalize(gt_answer)
-                if blip_answer is not None else None
-            )
-            vilt_correct = (
-                normalize(vilt_answer) == normalize(gt_answer)
-                if vilt_answer is not None else None
-            )
-
-            row = {
-                "qid":           qid,
-                "imageId":       image_id,
-                "question":      question_text,
-                "gt_answer":     gt_answer,
-                "structural":    structural,
-                "semantic":      semantic,
-                "program_depth": depth,
-                "blip_answer":   blip_answer,
-                "vilt_answer":   vilt_answer,
-                "blip_correct":  blip_correct,
-                "vilt_correct":  vilt_correct,
-                "blip_time":     blip_time,
-                "vilt_time":     vilt_time,
-            }
-            out_f.write(json.dumps(row) + "\n")
+    active = [name for name, m in (("blip", blip), ("vilt", vilt)) if m is not None]
+
+    # The answer cache's revision per model: everything besides the image and
+    # question that decides its answer. ViLT answers are always recomputed
+    # under --vilt-topk (the cache holds no logits), but still stored.
+    global _answer_cache
+    if not args.no_answer_cache:
+        revisions = {}
+        if run_blip:
+            revisions["blip"] = "|".join([
+                model_version(BLIP_MODEL_ID, bundle_dir and bundle_dir / "blip"), args.backend,
+                precision, "generate" if args.no_embed_reuse else "generate/score"])
+        if run_vilt:
+            revisions["vilt"] = "|".join([
+                model_version(VILT_MODEL_ID, bundle_dir and bundle_dir / "vilt"), args.backend,
+                precision, "argmax"])
+        lookup = [name for name in revisions if not (name == "vilt" and args.vilt_topk > 0)]
+        _answer_cache = AnswerCache(args.answer_cache or ANSWER_CACHE, revisions, lookup)
+        print(f"Answer cache: {len(_answer_cache):,} answers in {_answer_cache.path}")
+
+    def is_cached(image_id: str) -> bool:
+        return all(name in _pixel_caches and image_id in _pixel_caches[name] for name in active)
+
+    metrics = MetricsWriter(metrics_path(out_path), interval=args.metrics_interval)
+    _timer.writer = metrics
+
+    batcher = None
+    if args.token_budget > 0:
+        batcher = LengthBatcher(lambda item: item[1]["n_tokens"], args.token_budget,
+                                window=args.batch_window, max_batch=args.batch_size)
+
+    log = (SegmentLog(out_path, args.commit_interval) if args.commit_interval > 0
+           else PredictionLog(out_path))
+    parallel = None
+    if args.parallel_models:
+        parallel = ParallelModels(args, precision, log, split_threads(args.model_threads))
+
+    global _vilt_topk
+    if args.vilt_topk > 0:
+        id2label = parallel.id2label if parallel is not None else vilt[1].config.id2label
+        _vilt_topk = TopkWriter(topk_base(out_path), args.vilt_topk, VILT_MODEL_ID, id2label)
+
+    with log, torch.no_grad():
+        try:
+            if estimator is None:
+                n_todo, n_dedup = len(todo), fan_out_count(todo)
+                n_missing, n_errors = infer(todo, blip, vilt, device, log, args, blip_answer_fn,
+                                            precision, is_cached, batcher, parallel)
+            else:
+                while qids := estimator.next_round():
+                    todo = order_todo([(qid, data[qid]) for qid in qids if qid not in done_qids],
+                                      args.order)
+                    if not args.no_dedup:
+                        todo, _ = dedup_todo(todo, revision)
+                    done_qids.update(qids)
+                    tqdm.write(f"Estimate round {estimator.rounds}: +{len(qids):,} sampled, "
+                               f"{len(todo):,} to run")
+                    n_todo  += len(todo)
+                    n_dedup += fan_out_count(todo)
+                    missing, errors = infer(todo, blip, vilt, device, log, args, blip_answer_fn,
+                                            precision, is_cached, batcher, parallel)
+                    n_missing += missing
+                    n_errors  += errors
+                    log.sync()
+                    estimator.add_rows(out_path)
+        finally:
+            if parallel is not None:
+                parallel.close()
+
+    report = metrics.close()
+    if _vilt_topk is not None:
+        _vilt_topk.close()
 
     # ── Summary ────────────────────────────────────────────────────────────────
     elapsed = time.time() - t_run_start
-    total_processed = len(todo) - n_missing
+    total_processed = n_todo + n_dedup - n_missing
     print(f"\n{'='*60}")
     print(f"Done in {elapsed/3600:.2f} h ({elapsed:.0f} s)")
     print(f"Processed : {total_processed:,} questions")
     print(f"Missing images : {n_missing}")
+    if n_dedup:
+        n_models = (blip is not None) + (vilt is not None)
+        print(f"Deduplicated : {n_dedup:,} questions fanned out "
+              f"({n_dedup * n_models:,} model passes saved)")
+    for name, cache in _pixel_caches.items():
+        print(f"Pixel cache [{name}] : {cache.hits:,} hits / {cache.misses:,} misses")
+    if _memory.max_bytes > 0:
+        print(f"Memory cache : {_memory.hit_rate():.0%} hit rate")
+        print(_memory.summary())
+    if batcher is not None:
+        print(f"Batch padding : {batcher.tokens:,} real / {batcher.padded:,} padded tokens "
+              f"({batcher.efficiency:.0%} useful)")
     print(f"Inference errors : {n_errors}")
-    print(f"Predictions saved to: {PREDICTIONS_FILE}")
+    if _answer_cache is not None:
+        print("Answer cache :")
+        print(_answer_cache.summary())
+        _answer_cache.close()
+    print(format_report(report))
+    print(f"Predictions saved to: {out_path}")
+    print(f"Stage metrics saved to: {metrics_path(out_path)}")
+    if _vilt_topk is not None:
+        print(f"ViLT top-{args.vilt_topk} saved to: {topk_base(out_path)}.{{json,bin,qids}}")
+    if args.backfill:
+        finish_backfill(pred_file, args.backfill, backfill_name)
+
+    if estimator is not None:
+        stats = estimator.cell_stats()
+        overall = estimator.overall(stats)
+        write_estimates(estimate_path(out_path), stats, overall)
+        print(f"\nQuick estimate after {estimator.rounds - 1} rounds (strict match):")
+        print(format_estimates(stats, overall, args.estimate))
+        print(f"Estimates saved to: {estimate_path(out_path)}")
 
 
 if __name__ == "__main__":
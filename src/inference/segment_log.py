@@ -0,0 +1,198 @@
+"""
+src/inference/segment_log.py
+
+Asynchronous, crash-safe prediction writer (run_inference.py --commit-interval).
+
+SegmentLog has PredictionLog's append(rows) interface, but append only puts
+the batch on a bounded queue: JSON serialization and every write / fsync
+happen on a writer thread, off the model thread. The writer streams rows
+into a segment file under all_predictions.jsonl.segments/:
+
+  seg-000012.jsonl.tmp   — segment being written (never read back)
+  seg-000012.jsonl       — committed segment
+
+Every `interval` seconds (and on sync / close) the open segment is
+committed: flushed, fsync'd and renamed into place, then its rows are
+appended to the predictions JSONL through PredictionLog (checkpoint sidecar
+included), the JSONL is fsync'd and the segment deleted. A rename is atomic,
+so a segment is either complete or still .tmp; preemption at any point costs
+at most the rows of the uncommitted segment, and never leaves a torn row.
+
+recover_segments, run before resuming, discards .tmp segments and folds
+committed segments left by an interrupted run into the JSONL, skipping qids
+it already holds (a crash between folding and deleting a segment).
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from prediction_log import PredictionLog, _line_qid, load_done_qids
+
+_STOP = object()
+
+
+def segments_dir(path: Path) -> Path:
+    """all_predictions.jsonl → all_predictions.jsonl.segments/"""
+    return path.with_name(path.name + ".segments")
+
+
+def _fsync_dir(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def recover_segments(path: Path) -> int:
+    """Fold committed segments of an interrupted run into path and drop
+    uncommitted ones. Returns the number of rows recovered."""
+    seg_dir = segments_dir(path)
+    if not seg_dir.exists():
+        return 0
+    for tmp in seg_dir.glob("*.tmp"):
+        tmp.unlink()
+    committed = sorted(seg_dir.glob("seg-*.jsonl"))
+    if not committed:
+        return 0
+    done = load_done_qids(path)
+    n = 0
+    with PredictionLog(path) as log:
+        for seg in committed:
+            lines, qids = [], []
+            with open(seg, "rb") as f:
+                for line in f:
+                    qid = _line_qid(line) if line.endswith(b"\n") else None
+                    if qid is None or qid in done:
+                        continue
+                    done.add(qid)
+                    lines.append(line)
+                    qids.append(qid)
+            log.append_lines(b"".join(lines), qids)
+            log.fsync()
+            seg.unlink()
+            n += len(qids)
+    return n
+
+
+class SegmentLog:
+    """
+    Queue-fed writer of prediction rows to committed segments, folded into
+    `path` on every commit. Call recover_segments(path) and
+    load_done_qids(path) before opening, as for PredictionLog.
+    """
+
+    def __init__(self, path: Path, interval: float = 10.0, max_pending: int = 64):
+        self.path     = Path(path)
+        self.interval = interval
+        self.dir      = segments_dir(self.path)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.segments = 0         # committed so far
+        self._log     = PredictionLog(self.path)
+        self._queue   = queue.Queue(maxsize=max_pending)
+        self._error: BaseException | None = None
+        existing = [int(p.name[4:10]) for p in self.dir.glob("seg-*.jsonl*")]
+        self._next_id = max(existing, default=0) + 1
+        self._seg = None          # (file, tmp path, final path, lines, qids)
+        self._deadline = 0.0
+        self._thread = threading.Thread(target=self._run, name="segment-writer", daemon=True)
+        self._thread.start()
+
+    # ── caller side ───────────────────────────────────────────────────────────
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError("prediction writer thread failed") from self._error
+
+    def append(self, rows: list[dict]):
+        self._check()
+        if rows:
+            self._queue.put(rows)
+
+    def sync(self):
+        """Block until every appended row is committed and in the JSONL."""
+        self._check()
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        self._check()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._log.close()
+        try:
+            self.dir.rmdir()      # only if empty
+        except OSError:
+            pass
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # ── writer thread ─────────────────────────────────────────────────────────
+    def _run(self):
+        try:
+            while True:
+                timeout = max(0.0, self._deadline - time.monotonic()) if self._seg else None
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    self._commit()
+                    continue
+                if item is _STOP:
+                    self._commit()
+                    return
+                if isinstance(item, threading.Event):
+                    self._commit()
+                    item.set()
+                    continue
+                self._write(item)
+                if time.monotonic() >= self._deadline:
+                    self._commit()
+        except BaseException as e:
+            self._error = e
+            # unblock sync() / close() callers still waiting on the queue
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write(self, rows: list[dict]):
+        if self._seg is None:
+            final = self.dir / f"seg-{self._next_id:06d}.jsonl"
+            tmp = final.with_name(final.name + ".tmp")
+            self._next_id += 1
+            self._seg = (open(tmp, "wb"), tmp, final, [], [])
+            self._deadline = time.monotonic() + self.interval
+        f, _, _, lines, qids = self._seg
+        data = "".join(json.dumps(row) + "\n" for row in rows).encode()
+        f.write(data)
+        lines.append(data)
+        qids.extend(row["qid"] for row in rows)
+
+    def _commit(self):
+        if self._seg is None:
+            return
+        f, tmp, final, lines, qids = self._seg
+        self._seg = None
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.replace(tmp, final)
+        _fsync_dir(self.dir)
+        self._log.append_lines(b"".join(lines), qids)
+        self._log.fsync()
+        final.unlink()
+        self.segments += 1
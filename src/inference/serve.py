@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+src/inference/serve.py
+
+Long-running local VQA service on top of run_inference.py's model loading
+and batched answer functions: models load once, then every request costs a
+forward pass instead of a multi-second process start.
+
+Requests are answered by one model thread. Concurrent requests are gathered
+into micro-batches: a batch closes when it holds --max-batch requests or when
+its oldest request has waited --max-wait-ms, whichever comes first, and runs
+through the same padded BLIP / ViLT calls as batch inference (image
+embedding reuse and the in-memory LRU cache included). Images are decoded on
+the HTTP handler threads, off the model thread.
+
+Endpoints (JSON in, JSON out):
+  POST /answer   {"question": "...", "imageId": "n12345"}           — GQA image
+                 {"question": "...", "image": "<base64 JPEG/PNG>"}  — uploaded image
+                 optional "candidates": ["red", "blue"] → BLIP scores them
+                 instead of generating (as run_inference.py --blip-scoring)
+    → {"blip_answer", "vilt_answer", "vilt_confidence", "latency_ms",
+       "queue_ms", "compute_ms", "batch_size"}
+  GET  /health   → {"status": "ok", "models", "device", "requests", "batches", ...}
+
+vilt_confidence is sigmoid(top logit): ViLT's VQA head scores each label with
+its own binary cross-entropy, so this is the answer's own probability.
+
+Usage:
+  python src/inference/serve.py                           # http://127.0.0.1:8765
+  python src/inference/serve.py --port 9000 --max-batch 32 --max-wait-ms 20
+  python src/inference/serve.py --socket /tmp/vqa.sock --skip-blip
+  curl -s localhost:8765/answer -d '{"imageId": "n161313", "question": "Is it sunny?"}'
+  curl -s --unix-socket /tmp/vqa.sock http://vqa/answer -d '{"imageId": ..., "question": ...}'
+"""
+
+import argparse
+import base64
+import binascii
+import hashlib
+import io
+import json
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+import torch
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import run_inference as ri
+
+
+# ── Micro-batching ─────────────────────────────────────────────────────────────
+class Request:
+    def __init__(self, image_id: str, image, question: str, candidates: list[str] | None):
+        self.image_id   = image_id
+        self.image      = image
+        self.question   = question
+        self.candidates = candidates
+        self.t0         = time.perf_counter()
+        self.future     = Future()
+
+
+class MicroBatcher:
+    """
+    Feeds requests to run_fn(batch) on one worker thread, in batches of up to
+    max_batch closed max_wait seconds after their first request arrived.
+    run_fn sets each request's future.
+    """
+
+    def __init__(self, run_fn, max_batch: int = 16, max_wait: float = 0.01):
+        self.run_fn     = run_fn
+        self.max_batch  = max_batch
+        self.max_wait   = max_wait
+        self.n_requests = 0
+        self.n_batches  = 0
+        self._queue     = queue.Queue()
+        self._thread    = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, request: Request) -> Future:
+        self._queue.put(request)
+        return request.future
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first.t0 + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    item = (self._queue.get(timeout=timeout) if timeout > 0
+                            else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self.n_requests += len(batch)
+            self.n_batches  += 1
+            try:
+                self.run_fn(batch)
+            except Exception as e:
+                # run_fn failed outside its own per-request handling: fail
+                # what it left unanswered and keep serving
+                for r in batch:
+                    if not r.future.done():
+                        r.future.set_exception(e)
+            if stop:
+                return
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+# ── Model side ─────────────────────────────────────────────────────────────────
+class VqaService:
+    def __init__(self, blip, vilt, device: str):
+        self.blip   = blip
+        self.vilt   = vilt
+        self.device = device
+
+    def _answer(self, batch: list[Request]) -> list[dict]:
+        image_ids = [r.image_id for r in batch]
+        images    = [r.image for r in batch]
+        questions = [r.question for r in batch]
+        out = [{"blip_answer": None, "vilt_answer": None, "vilt_confidence": None} for _ in batch]
+        if self.blip is not None:
+            answers = ri.blip_answer_batch(self.blip, image_ids, images, questions, self.device,
+                                           [r.candidates for r in batch])
+            for o, answer in zip(out, answers):
+                o["blip_answer"] = answer
+        if self.vilt is not None:
+            logits = ri.vilt_logits(self.vilt, image_ids, images, questions, self.device)
+            conf, idx = torch.sigmoid(logits.float()).max(dim=-1)
+            id2label = self.vilt[1].config.id2label
+            for o, i, c in zip(out, idx.tolist(), conf.tolist()):
+                o["vilt_answer"], o["vilt_confidence"] = id2label[i], round(c, 4)
+        return out
+
+    def run(self, batch: list[Request]):
+        """Answer a micro-batch; if it fails, retry each request on its own so
+        one bad input only fails its own request."""
+        t_start = time.perf_counter()
+        with torch.no_grad():
+            try:
+                results = [(r, res, len(batch)) for r, res in zip(batch, self._answer(batch))]
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0].future.set_exception(e)
+                    return
+                results = []
+                for r in batch:
+                    try:
+                        results.append((r, self._answer([r])[0], 1))
+                    except Exception as e1:
+                        r.future.set_exception(e1)
+        t_end = time.perf_counter()
+        ri._timer.end_batch(len(batch), len(set(r.image_id for r in batch)))
+        for r, res, size in results:
+            res.update({
+                "latency_ms": round((t_end - r.t0) * 1000, 2),
+                "queue_ms":   round((t_start - r.t0) * 1000, 2),
+                "compute_ms": round((t_end - t_start) * 1000, 2),
+                "batch_size": size,
+            })
+            r.future.set_result(res)
+
+
+def decode_upload(data: bytes) -> tuple[str, Image.Image]:
+    """Uploaded image → (content-hash id, decoded image). The id keys the LRU
+    and embedding caches, so re-sending the same image reuses its work."""
+    image_id = "sha256:" + hashlib.sha256(data).hexdigest()[:32]
+    image = ri._memory.get(("image", image_id))
+    if image is None:
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        ri._memory.put(("image", image_id), image)
+    return image_id, image
+
+
+# ── HTTP ───────────────────────────────────────────────────────────────────────
+# GQA image ids ("n161313", or Visual Genome's numeric "2354786"). Anything
+# else is refused before it reaches a file path.
+_IMAGE_ID = re.compile(r"n?\d+")
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def content_length(headers) -> int:
+    """The request's Content-Length (0 if absent); HttpError 400 if it is not
+    a non-negative integer."""
+    value = headers.get("Content-Length", "0")
+    try:
+        n = int(value)
+    except ValueError:
+        raise HttpError(400, f"invalid Content-Length: {value!r}")
+    if n < 0:
+        raise HttpError(400, f"invalid Content-Length: {value!r}")
+    return n
+
+
+def parse_request(body: bytes) -> Request:
+    try:
+        req = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise HttpError(400, "body must be a JSON object")
+    if not isinstance(req, dict):
+        raise HttpError(400, "body must be a JSON object")
+    question = req.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise HttpError(400, "'question' must be a non-empty string")
+    candidates = req.get("candidates")
+    if candidates is not None and (not isinstance(candidates, list) or len(candidates) < 2
+                                   or not all(isinstance(c, str) and c for c in candidates)):
+        raise HttpError(400, "'candidates' must be a list of at least two strings")
+
+    if "image" in req:
+        try:
+            image_id, image = decode_upload(base64.b64decode(req["image"], validate=True))
+        except (binascii.Error, TypeError, ValueError, OSError) as e:
+            raise HttpError(400, f"'image' is not a base64-encoded image: {e}")
+    elif isinstance(req.get("imageId"), str):
+        image_id = req["imageId"]
+        if not _IMAGE_ID.fullmatch(image_id):
+            raise HttpError(400, f"'imageId' is not a GQA image id: {image_id!r}")
+        try:
+            image = ri.load_image(image_id)
+        except (OSError, ValueError) as e:
+            raise HttpError(500, f"image {image_id} could not be read: {e}")
+        if image is None:
+            raise HttpError(404, f"image {image_id} not found")
+    else:
+        raise HttpError(400, "give either 'imageId' or base64 'image'")
+    return Request(image_id, image, question, candidates)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "vqa-serve/1"
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": f"no route {self.path}"})
+            return
+        svc, batcher = self.server.service, self.server.batcher
+        self._send(200, {
+            "status":     "ok",
+            "models":     [m for m, pair in (("blip", svc.blip), ("vilt", svc.vilt)) if pair],
+            "device":     svc.device,
+            "requests":   batcher.n_requests,
+            "batches":    batcher.n_batches,
+            "mean_batch": round(batcher.n_requests / batcher.n_batches, 2) if batcher.n_batches else 0,
+            "cache_hit_rate": round(ri._memory.hit_rate(), 4),
+        })
+
+    def do_POST(self):
+        if self.path != "/answer":
+            self._send(404, {"error": f"no route {self.path}"})
+            return
+        try:
+            n = content_length(self.headers)
+        except HttpError as e:
+            self.close_connection = True   # the body's extent is unknown
+            self._send(e.status, {"error": str(e)})
+            return
+        try:
+            request = parse_request(self.rfile.read(n))
+        except HttpError as e:
+            self._send(e.status, {"error": str(e)})
+            return
+        try:
+            result = self.server.batcher.submit(request).result()
+        except Exception as e:
+            self._send(500, {"error": f"inference failed: {e}"})
+            return
+        self._send(200, {"imageId": request.image_id, "question": request.question, **result})
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+# ── Main ───────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Local BLIP + ViLT VQA server with micro-batching")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port (default 8765)")
+    parser.add_argument("--socket", type=Path, default=None, metavar="PATH",
+                        help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-batch", type=int, default=16, metavar="B",
+                        help="Largest micro-batch (default 16)")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, metavar="MS",
+                        help="Longest a request waits for others to batch with (default 10)")
+    parser.add_argument("--skip-blip", action="store_true", help="Serve ViLT only")
+    parser.add_argument("--skip-vilt", action="store_true", help="Serve BLIP only")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch",
+                        help="PyTorch (default) or ONNX Runtime on CPU")
+    parser.add_argument("--quantize", choices=["none", "int8"], default="none",
+                        help="int8: dynamic quantization of Linear layers (CPU only)")
+    parser.add_argument("--no-bundle", action="store_true",
+                        help="Load models with from_pretrained even if local bundles exist")
+    parser.add_argument("--num-threads", type=int, default=0, metavar="T",
+                        help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--cache-mb", type=int, default=1024, metavar="MB",
+                        help="In-memory LRU budget for images, processor outputs and "
+                             "BLIP embeddings (default 1024)")
+    parser.add_argument("--verbose", action="store_true", help="Log every HTTP request")
+    args = parser.parse_args()
+
+    if args.skip_blip and args.skip_vilt:
+        parser.error("nothing to serve: drop --skip-blip or --skip-vilt")
+    if args.backend == "onnx" and args.quantize != "none":
+        parser.error("--quantize applies to the PyTorch backend only")
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    ri._memory.max_bytes = args.cache_mb * 2**20
+
+    device = ri.pick_device(args.quantize, args.backend)
+    blip, vilt = ri.load_models(not args.skip_blip, not args.skip_vilt, device, args.backend,
+                                bundle_dir=None if args.no_bundle else ri.BUNDLE_DIR)
+    if args.quantize == "int8":
+        blip = blip and ri.quantize_int8(blip)
+        vilt = vilt and ri.quantize_int8(vilt)
+
+    service = VqaService(blip, vilt, device)
+    batcher = MicroBatcher(service.run, args.max_batch, args.max_wait_ms / 1000)
+
+    if args.socket is not None:
+        args.socket.unlink(missing_ok=True)
+        server = UnixHTTPServer(str(args.socket), Handler)
+        where = f"unix:{args.socket}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), Handler)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    server.service, server.batcher, server.verbose = service, batcher, args.verbose
+    print(f"Serving on {where} (device {device}, max batch {args.max_batch}, "
+          f"max wait {args.max_wait_ms:g} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down")
+    finally:
+        server.server_close()
+        batcher.close()
+        if args.socket is not None:
+            args.socket.unlink(missing_ok=True)
+        print(f"Served {batcher.n_requests:,} requests in {batcher.n_batches:,} batches")
+
+
+if __name__ == "__main__":
+    main()
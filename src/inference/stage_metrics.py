@@ -0,0 +1,149 @@
+"""
+src/inference/stage_metrics.py
+
+Per-stage timing for the inference loop.
+
+StageTimer accumulates wall time per named stage (image fetch, processor,
+host→device transfer, forward/generate, decode, JSON write) for the batch in
+progress; end_batch() closes the batch and hands its record to a
+MetricsWriter, which appends it to a JSONL metrics file next to the
+predictions and, every `interval` seconds (and at the end of the run), a
+throughput report:
+
+  {"type": "batch",  "t": …, "n_questions": …, "n_images": …,
+   "stages": {"image_fetch": s, "blip.forward": s, …}}
+  {"type": "report", "elapsed": …, "questions": …, "images": …,
+   "questions_per_s": …, "images_per_s": …,
+   "stages": {"blip.forward": {"total": s, "share": f, "p50": s, "p95": s, "p99": s}, …}}
+
+Percentiles are over per-batch stage times for the whole run so far. A stage
+that dominates "share" tells whether a run is I/O-bound (image_fetch) or
+compute-bound (*.forward).
+"""
+
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def _percentile(sorted_vals: list[float], pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class StageTimer:
+    def __init__(self, writer: "MetricsWriter | None" = None):
+        self.writer  = writer
+        self.current = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] += time.perf_counter() - t0
+
+    def timed_iter(self, iterable, name: str):
+        """Yield from iterable, charging the time spent waiting on it to `name`."""
+        it = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def take(self) -> dict[str, float]:
+        """Stage times of the batch in progress, resetting them."""
+        stages = {k: round(v, 6) for k, v in self.current.items()}
+        self.current = defaultdict(float)
+        return stages
+
+    def end_batch(self, n_questions: int, n_images: int, stages: dict | None = None) -> dict:
+        """Close the batch; `stages` (e.g. from other processes' take()) are
+        added to this timer's own."""
+        own = self.take()
+        for k, v in (stages or {}).items():
+            own[k] = round(own.get(k, 0.0) + v, 6)
+        record = {
+            "type":        "batch",
+            "t":           round(time.time(), 3),
+            "n_questions": n_questions,
+            "n_images":    n_images,
+            "stages":      own,
+        }
+        if self.writer is not None:
+            self.writer.add(record)
+        return record
+
+
+class MetricsWriter:
+    def __init__(self, path: Path, interval: float = 60.0):
+        self.path     = Path(path)
+        self.interval = interval
+        self._f       = open(self.path, "a", buffering=1)
+        self._t0      = time.perf_counter()
+        self._last    = self._t0
+        self._n_q = self._n_img = 0
+        self._stages: dict[str, list[float]] = defaultdict(list)
+
+    def add(self, record: dict):
+        self._f.write(json.dumps(record) + "\n")
+        self._n_q   += record["n_questions"]
+        self._n_img += record["n_images"]
+        for name, secs in record["stages"].items():
+            self._stages[name].append(secs)
+        if time.perf_counter() - self._last >= self.interval:
+            self.report()
+
+    def report(self) -> dict:
+        now = time.perf_counter()
+        self._last = now
+        elapsed = now - self._t0
+        grand_total = sum(sum(v) for v in self._stages.values()) or 1.0
+        stages = {}
+        for name, vals in sorted(self._stages.items()):
+            s = sorted(vals)
+            stages[name] = {
+                "total": round(sum(vals), 3),
+                "share": round(sum(vals) / grand_total, 4),
+                "p50":   round(_percentile(s, 50), 6),
+                "p95":   round(_percentile(s, 95), 6),
+                "p99":   round(_percentile(s, 99), 6),
+            }
+        report = {
+            "type":            "report",
+            "t":               round(time.time(), 3),
+            "elapsed":         round(elapsed, 3),
+            "questions":       self._n_q,
+            "images":          self._n_img,
+            "questions_per_s": round(self._n_q / elapsed, 3) if elapsed else 0.0,
+            "images_per_s":    round(self._n_img / elapsed, 3) if elapsed else 0.0,
+            "stages":          stages,
+        }
+        self._f.write(json.dumps(report) + "\n")
+        return report
+
+    def close(self) -> dict:
+        report = self.report()
+        self._f.close()
+        return report
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Throughput : {report['questions_per_s']:.2f} q/s, {report['images_per_s']:.2f} images/s",
+        f"{'stage':18s}{'total s':>10s}{'share':>8s}{'p50 ms':>10s}{'p95 ms':>10s}{'p99 ms':>10s}",
+    ]
+    for name, st in sorted(report["stages"].items(), key=lambda kv: -kv[1]["total"]):
+        lines.append(f"{name:18s}{st['total']:>10.1f}{st['share']:>8.1%}"
+                     f"{st['p50']*1e3:>10.1f}{st['p95']*1e3:>10.1f}{st['p99']*1e3:>10.1f}")
+    return "\n".join(lines)
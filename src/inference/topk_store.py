@@ -0,0 +1,180 @@
+"""
+src/inference/topk_store.py
+
+Compact per-question store of ViLT's top-k answer logits
+(run_inference.py --vilt-topk K), read back by src/analysis/vilt_topk.py.
+
+A store is three files sharing one base name next to the predictions file:
+  all_predictions.vilt_topk.json  — {"model_id", "k", "id2label"}
+  all_predictions.vilt_topk.bin   — fixed-size records, one per question:
+                                    k int32 label ids then k float16 logits,
+                                    highest logit first
+  all_predictions.vilt_topk.qids  — qid of each record, one per line
+
+Records and qids are appended batch by batch, records first, so a torn
+write leaves at most a tail that the next writer trims: the store holds as
+many records as both files agree on.
+
+A batch's records are written before its rows are handed to the prediction
+log, but nothing orders them against the rows reaching disk: with
+--commit-interval > 0 (segment_log.py) rows are committed up to that many
+seconds later. A crash in between leaves records whose rows were never
+committed; the resumed run redoes those questions and appends their records
+again. A qid that appears more than once therefore reads as its last
+record, and records of qids with no predictions row are simply never
+looked up.
+
+ViLT's VQA head is trained with a per-label binary cross-entropy, so
+sigmoid(logit) is that answer's own confidence and needs no normaliser
+over the full label set.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def topk_base(path: Path) -> Path:
+    """all_predictions.jsonl → all_predictions.vilt_topk (files add .json/.bin/.qids)."""
+    return path.with_name(f"{path.stem}.vilt_topk")
+
+
+def _files(base: Path) -> tuple[Path, Path, Path]:
+    return (base.with_name(base.name + ".json"), base.with_name(base.name + ".bin"),
+            base.with_name(base.name + ".qids"))
+
+
+def record_dtype(k: int) -> np.dtype:
+    return np.dtype([("ids", "<i4", (k,)), ("logits", "<f2", (k,))])
+
+
+def _read_qids(path: Path) -> list[str]:
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [line[:-1] for line in f if line.endswith("\n")]
+
+
+def store_exists(base: Path) -> bool:
+    return _files(base)[0].exists()
+
+
+class TopkWriter:
+    """
+    Appends (qid, top-k ids, top-k logits) records to the store at base,
+    creating it if needed. An existing store must have the same k and model.
+    """
+
+    def __init__(self, base: Path, k: int, model_id: str, id2label: dict):
+        meta_path, bin_path, qids_path = _files(base)
+        self.k = k
+        self.dtype = record_dtype(k)
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            if meta["k"] != k or meta["model_id"] != model_id:
+                raise ValueError(f"{meta_path.name} holds k={meta['k']} ({meta['model_id']}) "
+                                 f"— cannot append k={k} ({model_id})")
+        else:
+            meta_path.write_text(json.dumps({
+                "model_id": model_id,
+                "k":        k,
+                "id2label": {int(i): label for i, label in id2label.items()},
+            }))
+        self._trim(bin_path, qids_path)
+        self._bin  = open(bin_path, "ab")
+        self._qids = open(qids_path, "ab")
+
+    def _trim(self, bin_path: Path, qids_path: Path):
+        """Cut both files back to the records they agree on."""
+        qids = _read_qids(qids_path)
+        size = bin_path.stat().st_size if bin_path.exists() else 0
+        n = min(len(qids), size // self.dtype.itemsize)
+        if size != n * self.dtype.itemsize:
+            with open(bin_path, "r+b") as f:
+                f.truncate(n * self.dtype.itemsize)
+        if qids_path.exists() and (n < len(qids) or qids_path.stat().st_size
+                                   != sum(len(q.encode()) + 1 for q in qids)):
+            tmp = qids_path.with_name(qids_path.name + ".tmp")
+            tmp.write_text("".join(q + "\n" for q in qids[:n]))
+            os.replace(tmp, qids_path)
+
+    def append(self, qids: list[str], ids: np.ndarray, logits: np.ndarray):
+        """ids (n, k) label ids and logits (n, k), both sorted by logit descending."""
+        if not qids:
+            return
+        records = np.empty(len(qids), dtype=self.dtype)
+        records["ids"] = ids
+        records["logits"] = logits
+        self._bin.write(records.tobytes())
+        self._bin.flush()
+        self._qids.write("".join(q + "\n" for q in qids).encode())
+        self._qids.flush()
+
+    def close(self):
+        self._bin.close()
+        self._qids.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class TopkStore:
+    """Read-only view of a store: records memory-mapped, looked up by qid."""
+
+    def __init__(self, base: Path):
+        meta_path, bin_path, qids_path = _files(base)
+        if not meta_path.exists():
+            raise FileNotFoundError(f"{meta_path} not found — run run_inference.py --vilt-topk K")
+        meta = json.loads(meta_path.read_text())
+        self.base     = base
+        self.model_id = meta["model_id"]
+        self.k        = meta["k"]
+        self.id2label = {int(i): label for i, label in meta["id2label"].items()}
+        self.label2id = {label: i for i, label in self.id2label.items()}
+
+        dtype = record_dtype(self.k)
+        qids = _read_qids(qids_path)
+        size = bin_path.stat().st_size if bin_path.exists() else 0
+        n = min(len(qids), size // dtype.itemsize)
+        records = (np.memmap(bin_path, dtype=dtype, mode="r", shape=(n,)) if n
+                   else np.empty(0, dtype=dtype))
+        self.ids    = records["ids"]      # (n, k) int32
+        self.logits = records["logits"]   # (n, k) float16
+        self.index  = {qid: i for i, qid in enumerate(qids[:n])}   # last record wins
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, qid: str) -> bool:
+        return qid in self.index
+
+    def get(self, qid: str) -> tuple[list[str], np.ndarray] | None:
+        """(top-k labels, float32 logits) for qid, or None if it has no record."""
+        i = self.index.get(qid)
+        if i is None:
+            return None
+        return [self.id2label[j] for j in self.ids[i].tolist()], self.logits[i].astype(np.float32)
+
+
+def merge_stores(dst: Path, sources: list[Path]) -> int:
+    """Append the records of the source stores for qids dst does not hold yet;
+    returns the number of records copied."""
+    have = set(TopkStore(dst).index) if store_exists(dst) else set()
+    n = 0
+    for src in sources:
+        if not store_exists(src):
+            continue
+        store = TopkStore(src)
+        qids = [qid for qid in store.index if qid not in have]
+        rows = [store.index[qid] for qid in qids]
+        have.update(qids)
+        with TopkWriter(dst, store.k, store.model_id, store.id2label) as writer:
+            writer.append(qids, store.ids[rows], store.logits[rows])
+        n += len(qids)
+    return n
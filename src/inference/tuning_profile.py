@@ -0,0 +1,85 @@
+"""
+src/inference/tuning_profile.py
+
+Per-host throughput profiles written by autotune.py and read by
+run_inference.py at start-up.
+
+A profile is a JSON file named after the host (results/autotune/<host>.json)
+holding every measured configuration and the best single-process settings
+for BLIP alone, ViLT alone and both models in sequence:
+
+  "best": {"both": {"backend": "torch", "batch_size": 8, "num_threads": 16,
+                    "interop_threads": 1, "qps": 11.2, "peak_rss_mb": 3400}, ...}
+
+profile_defaults turns the entry matching a run's models into argparse
+defaults, so explicit command-line flags still win. A profile measured on a
+machine with a different CPU count is ignored: the settings would not carry
+over.
+"""
+
+import json
+import os
+import platform
+import socket
+from pathlib import Path
+
+
+def host_name() -> str:
+    return socket.gethostname().split(".")[0] or "localhost"
+
+
+def cpu_model() -> str:
+    """The CPU model string (Linux /proc/cpuinfo, else platform.processor())."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def profile_path(profile_dir: Path, host: str | None = None) -> Path:
+    return profile_dir / f"{host or host_name()}.json"
+
+
+def write_profile(path: Path, profile: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(profile, indent=2))
+    os.replace(tmp, path)
+
+
+def load_profile(path: Path) -> dict | None:
+    """The profile at path, or None if there is none or it was measured on a
+    machine with another CPU count."""
+    if not path.exists():
+        return None
+    profile = json.loads(path.read_text())
+    if profile.get("cpu_count") != os.cpu_count():
+        print(f"Ignoring autotune profile {path.name}: measured on {profile.get('cpu_count')} "
+              f"CPUs, this machine has {os.cpu_count()}")
+        return None
+    return profile
+
+
+def profile_defaults(profile: dict, run_blip: bool = True, run_vilt: bool = True,
+                     with_batch_size: bool = True) -> dict:
+    """argparse defaults (dest → value) from the profile's best settings for
+    the models being run. with_batch_size=False leaves --batch-size alone
+    (it means something else under --token-budget)."""
+    key = "both" if run_blip and run_vilt else "blip" if run_blip else "vilt"
+    best = profile.get("best", {}).get(key)
+    if not best:
+        return {}
+    defaults = {"backend": best["backend"]}
+    if best["backend"] == "onnx":
+        defaults["ort_intra_threads"] = best["num_threads"]
+        defaults["ort_inter_threads"] = best["interop_threads"]
+    else:
+        defaults["num_threads"] = best["num_threads"]
+        defaults["interop_threads"] = best["interop_threads"]
+    if with_batch_size:
+        defaults["batch_size"] = best["batch_size"]
+    return defaults
@@ -0,0 +1,52 @@
+"""
+tests/test_topk_dedup.py
+
+--vilt-topk records for deduplicated questions: a fan-out copy whose text
+differs from the answered question only in case or whitespace must get the
+answered question's record.
+
+  python -m pytest tests/
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "inference"))
+import run_inference as ri
+
+
+def make_question(image_id: str, text: str) -> dict:
+    return {"imageId": image_id, "question": text, "answer": "yes",
+            "types": {"structural": "verify", "semantic": "attr"}, "program_depth": 3}
+
+
+def variant(text: str, i: int) -> str:
+    return text.upper() if i % 2 else "  " + text.replace(" ", "  ")
+
+
+def test_case_variant_duplicates_get_topk_records():
+    todo = []
+    for i in range(24):
+        text = f"Is the object number {i} red?"
+        todo.append((f"q{2 * i:03d}", make_question(f"img{i // 4}", text)))
+        todo.append((f"q{2 * i + 1:03d}", make_question(f"img{i // 4}", variant(text, i))))
+    todo, n_dups = ri.dedup_todo(todo, "rev")
+    assert n_dups == 24
+
+    # What vilt_answer_batch leaves in _vilt_topk_out: one record per answered
+    # question, keyed on its own (imageId, question).
+    topk_out = {(q["imageId"], q["question"]): (np.array([i]), np.array([float(i)]))
+                for i, (_, q) in enumerate(todo)}
+    batch = [(qid, q, None) for qid, q in todo]
+    n = len(batch)
+    rows = ri.batch_rows(batch, [None] * n, ["yes"] * n, [None] * n, [0.1] * n, [None] * n,
+                         "fp32")
+    assert len(rows) == 48
+
+    records = dict(ri.topk_records(rows, topk_out))
+    assert sorted(records) == sorted(row["qid"] for row in rows)
+    for row in rows:
+        if row["dedup_of"] is not None:
+            assert records[row["qid"]] is records[row["dedup_of"]]